@@ -1,21 +1,42 @@
 from flask import (
     Flask, render_template, request, redirect, url_for,
-    send_from_directory, make_response, session, flash, abort
+    make_response, session, flash, abort, jsonify, g,
+    Response, stream_with_context, send_file
 )
 import os
+import io
+import re
+import csv
+import html
 import time
 import json
+import random
+import itertools
+import unicodedata
 import secrets
-from urllib.parse import urlencode
+import hashlib
+import tempfile
+import mimetypes
+import threading
+import zipfile
+import shutil
+import select
+from urllib.parse import urlencode, quote
 import requests
-from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+import click
+from datetime import datetime, date, timedelta, timezone
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import UniqueConstraint, text, inspect as sa_inspect
+from sqlalchemy import UniqueConstraint, text, func, case, and_, or_, insert, null, false, event, inspect as sa_inspect
+from sqlalchemy.exc import IntegrityError
+from collections import Counter
 
 # ================= APP =================
 app = Flask(__name__)
@@ -26,6 +47,12 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Adjuntos por contenido: uploads/blobs/ab/cd/<sha256>; los temporales en el mismo disco (rename atómico)
+BLOBS_FOLDER = os.path.join(UPLOAD_FOLDER, "blobs")
+UPLOAD_TMP_FOLDER = os.path.join(UPLOAD_FOLDER, "tmp")
+os.makedirs(BLOBS_FOLDER, exist_ok=True)
+os.makedirs(UPLOAD_TMP_FOLDER, exist_ok=True)
+
 # Compatibilidad para migración desde JSON
 DATA_DIR = os.getenv("DATA_DIR", os.path.join(BASE_DIR, "data"))
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -34,8 +61,71 @@ os.makedirs(DATA_DIR, exist_ok=True)
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx', 'xls', 'xlsx', 'txt'}
 ESTADOS = ['Sin Ejecutar', 'En Ejecución', 'Pendiente de', 'Completada', 'Validada']
 
+# Tareas por página en el planificador (paginación por cursor sobre (proyecto_id, id))
+PLANIFICADOR_POR_PAGINA = int(os.getenv("PLANIFICADOR_POR_PAGINA", "50"))
+PLANIFICADOR_MAX_POR_PAGINA = 500
+
+# Adjuntos: tamaño de bloque al hashear/copiar y gracia antes de borrar un archivo sin referencias
+ADJUNTOS_BLOQUE = 1024 * 1024
+ADJUNTOS_GC_GRACIA_SEG = int(os.getenv("ADJUNTOS_GC_GRACIA_SEG", "3600"))
+# Subidas por partes (reanudables): tamaño de parte (< MAX_CONTENT_LENGTH), máximo por archivo y vigencia
+SUBIDA_TAMANO_PARTE = int(os.getenv("SUBIDA_TAMANO_PARTE", str(8 * 1024 * 1024)))
+SUBIDA_MAX_TAMANO = int(os.getenv("SUBIDA_MAX_TAMANO", str(2 * 1024 * 1024 * 1024)))
+SUBIDA_VIGENCIA_SEG = int(os.getenv("SUBIDA_VIGENCIA_SEG", str(24 * 3600)))
+# Miniaturas de adjuntos (imágenes y primera página de PDF), lado mayor en píxeles
+MINIATURA_PX = int(os.getenv("MINIATURA_PX", "320"))
+MINIATURA_EXTENSIONES = {'pdf', 'png', 'jpg', 'jpeg', 'gif'}
+# Detrás de nginx: location interna (p.ej. "/_uploads/", alias de uploads/) para X-Accel-Redirect
+ADJUNTOS_X_ACCEL = os.getenv("ADJUNTOS_X_ACCEL", "").strip()
+
+# Segundos que se guardan en memoria los valores de los filtros del tablero (por proceso)
+FACETAS_TTL = int(os.getenv("FACETAS_TTL", "60"))
+
+# El feed de cambios solo entrega tareas con updated_at anterior a (ahora - margen), para no
+# saltarse escrituras que todavía estaban en una transacción abierta al leer. Por eso ninguna
+# transacción puede confirmar tareas escritas hace más de este margen: se rechaza el commit
+# (ver _limitar_transaccion_tareas). Lo más largo son los lotes de importación (IMPORT_LOTE).
+# Con 0 no hay margen ni límite (solo para pruebas: el feed puede saltarse escrituras).
+CAMBIOS_MARGEN_SEG = float(os.getenv("CAMBIOS_MARGEN_SEG", "5"))
+
+# Tablero en vivo (SSE): cada cuánto se revisa la BD si no llega aviso en este proceso,
+# duración máxima de una conexión (el navegador reconecta solo) y máximo de tareas por evento.
+# Cada stream ocupa un hilo de gunicorn mientras dura: SSE_MAX_STREAMS por proceso (por
+# defecto la mitad de GUNICORN_THREADS, ver gunicorn.conf.py); por encima se responde 503 y el
+# navegador reintenta a los SSE_REINTENTO_SEG, retomando desde el último evento recibido
+SSE_POLL_SEG = float(os.getenv("SSE_POLL_SEG", "5"))
+SSE_DURACION_SEG = float(os.getenv("SSE_DURACION_SEG", "300"))
+SSE_MAX_TAREAS = 200
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", str(max(int(os.getenv("GUNICORN_THREADS", "16")) // 2, 1))))
+SSE_REINTENTO_SEG = int(os.getenv("SSE_REINTENTO_SEG", "30"))
+SSE_REANUDAR_MAX_SEG = 3600
+
+# Bus de eventos: hilos para suscriptores asíncronos y broker entre workers ("" o "postgres")
+EVENTOS_HILOS = int(os.getenv("EVENTOS_HILOS", "4"))
+EVENTOS_BROKER = os.getenv("EVENTOS_BROKER", "").strip().lower()
+
+# Cola de trabajos: reintentos con backoff exponencial (con jitter), trabajos "en curso"
+# cuyo worker dejó de dar latidos que se reencolan, y un worker en hilo dentro de cada
+# proceso web, arrancado desde gunicorn.conf.py (JOBS_WORKER_EN_WEB=0 para no hacerlo)
+JOBS_POLL_SEG = float(os.getenv("JOBS_POLL_SEG", "2"))
+JOBS_MAX_INTENTOS = int(os.getenv("JOBS_MAX_INTENTOS", "5"))
+JOBS_BACKOFF_SEG = float(os.getenv("JOBS_BACKOFF_SEG", "10"))
+JOBS_BACKOFF_MAX_SEG = float(os.getenv("JOBS_BACKOFF_MAX_SEG", "900"))
+JOBS_TIMEOUT_SEG = float(os.getenv("JOBS_TIMEOUT_SEG", "600"))
+JOBS_LATIDO_SEG = float(os.getenv("JOBS_LATIDO_SEG", str(max(JOBS_TIMEOUT_SEG / 4, 1))))
+JOBS_WORKER_EN_WEB = os.getenv("JOBS_WORKER_EN_WEB", "1") == "1"
+
+# HTTP saliente (proveedores externos): timeouts (conexión, lectura), reintentos y circuit breaker
+HTTP_TIMEOUT_CONEXION = float(os.getenv("HTTP_TIMEOUT_CONEXION", "3.05"))
+HTTP_TIMEOUT_LECTURA = float(os.getenv("HTTP_TIMEOUT_LECTURA", "30"))
+HTTP_REINTENTOS = int(os.getenv("HTTP_REINTENTOS", "2"))
+HTTP_CIRCUITO_UMBRAL = int(os.getenv("HTTP_CIRCUITO_UMBRAL", "5"))
+HTTP_CIRCUITO_ENFRIAMIENTO_SEG = float(os.getenv("HTTP_CIRCUITO_ENFRIAMIENTO_SEG", "30"))
+
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+# Detrás de Apache/lighttpd con mod_xsendfile
+app.config['USE_X_SENDFILE'] = os.getenv("ADJUNTOS_X_SENDFILE", "0") == "1"
 
 # ================= DATABASE (PostgreSQL / Render) =================
 DATABASE_URL = os.environ.get("DATABASE_URL", "").strip()
@@ -72,6 +162,7 @@ class Company(db.Model):
     calendar_refresh_token = db.Column(db.Text, nullable=True)
     calendar_token_expires_at = db.Column(db.DateTime, nullable=True)
     calendar_microsoft_tenant = db.Column(db.String(120), default="common")
+    calendar_sync_cursores = db.Column(db.JSON, nullable=True)  # {proyecto_id: cursor del feed de cambios}
 
 
 class Project(db.Model):
@@ -117,14 +208,25 @@ class Task(db.Model):
     responsable = db.Column(db.String(200), default="")
     centro_responsabilidad = db.Column(db.String(200), default="")
     plazo = db.Column(db.String(20), default="")  # YYYY-MM-DD
+    plazo_fecha = db.Column(db.Date, nullable=True)  # plazo parseado (NULL si vacío o inválido)
     observacion = db.Column(db.Text, default="")
     recursos = db.Column(db.Text, default="")
 
-    documentos = db.Column(db.JSON, default=list)
+    documentos = db.Column(db.JSON, nullable=True)  # obsoleto: `flask adjuntos-normalizar` lo pasa a attachments (queda NULL)
+    adjuntos = db.relationship("Attachment", lazy="selectin", order_by="Attachment.id")
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_tasks_proyecto_id_id", "proyecto_id", "id"),
+        db.Index("ix_tasks_proyecto_plazo_fecha", "proyecto_id", "plazo_fecha"),
+        db.Index("ix_tasks_proyecto_situacion", "proyecto_id", "situacion"),
+        db.Index("ix_tasks_proyecto_responsable", "proyecto_id", "responsable"),
+        db.Index("ix_tasks_proyecto_centro", "proyecto_id", "centro_responsabilidad"),
+        db.Index("ix_tasks_proyecto_updated_at", "proyecto_id", "updated_at", "id"),
+    )
+
 
 class Objective(db.Model):
     __tablename__ = "objectives"
@@ -166,6 +268,305 @@ class KPI(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class ProjectStat(db.Model):
+    """Conteos materializados por proyecto; una fila por (dimensión, clave)."""
+    __tablename__ = "project_stats"
+
+    id = db.Column(db.Integer, primary_key=True)
+    proyecto_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=False, index=True)
+
+    dimension = db.Column(db.String(20), nullable=False)  # total | situacion | responsable | centro | plazo
+    clave = db.Column(db.String(200), nullable=False, default="")
+    n = db.Column(db.Integer, nullable=False, default=0)
+    fecha_ref = db.Column(db.Date, nullable=True)  # día con que se calcularon los buckets de plazo
+
+    __table_args__ = (
+        UniqueConstraint("proyecto_id", "dimension", "clave", name="uq_project_stat"),
+    )
+
+
+class CalendarEvent(db.Model):
+    """Evento de calendario externo creado para una tarea (permite upserts idempotentes)."""
+    __tablename__ = "calendar_events"
+
+    id = db.Column(db.Integer, primary_key=True)
+    empresa_id = db.Column(db.Integer, db.ForeignKey("companies.id"), nullable=False, index=True)
+    tarea_id = db.Column(db.Integer, db.ForeignKey("tasks.id"), nullable=False)
+    provider = db.Column(db.String(20), nullable=False)
+    evento_id = db.Column(db.String(1024), nullable=False)
+    sincronizado_en = db.Column(db.DateTime, nullable=True)  # Task.updated_at de la versión enviada
+
+    __table_args__ = (
+        UniqueConstraint("tarea_id", "provider", name="uq_calendar_event_tarea"),
+    )
+
+
+class Blob(db.Model):
+    """Archivo adjunto guardado una sola vez por contenido; `referencias` = filas de attachments que lo usan."""
+    __tablename__ = "blobs"
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    tamano = db.Column(db.BigInteger, nullable=False)
+    referencias = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    liberado_en = db.Column(db.DateTime, nullable=True)  # última vez que perdió una referencia
+
+    __table_args__ = (
+        db.Index("ix_blobs_referencias", "referencias"),
+    )
+
+
+class Attachment(db.Model):
+    """Documento adjunto a una tarea (una fila por adjunto)."""
+    __tablename__ = "attachments"
+
+    id = db.Column(db.Integer, primary_key=True)
+    empresa_id = db.Column(db.Integer, db.ForeignKey("companies.id"), nullable=False)
+    proyecto_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=False)
+    tarea_id = db.Column(db.Integer, db.ForeignKey("tasks.id"), nullable=False)
+
+    nombre = db.Column(db.String(255), nullable=False)
+    tamano = db.Column(db.BigInteger, nullable=False, default=0)
+    sha256 = db.Column(db.String(64), nullable=True)    # NULL: adjunto antiguo, archivo suelto en uploads/
+    archivo = db.Column(db.String(255), nullable=True)  # nombre en uploads/ de los adjuntos antiguos
+
+    usuario_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("tarea_id", "sha256", name="uq_attachments_tarea_sha256"),
+        db.Index("ix_attachments_proyecto_tarea", "proyecto_id", "tarea_id"),
+        db.Index("ix_attachments_empresa_proyecto", "empresa_id", "proyecto_id"),
+        db.Index("ix_attachments_sha256", "sha256"),
+    )
+
+
+class ChunkedUpload(db.Model):
+    """Subida por partes de un adjunto; las partes recibidas son archivos en uploads/tmp/subidas/<id>/."""
+    __tablename__ = "chunked_uploads"
+
+    id = db.Column(db.String(32), primary_key=True)
+    empresa_id = db.Column(db.Integer, db.ForeignKey("companies.id"), nullable=False, index=True)
+    proyecto_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=False)
+    tarea_id = db.Column(db.Integer, db.ForeignKey("tasks.id"), nullable=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+
+    nombre = db.Column(db.String(255), nullable=False)
+    tamano = db.Column(db.BigInteger, nullable=False)
+    tamano_parte = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=True)  # declarado por el cliente (opcional), se verifica al completar
+
+    estado = db.Column(db.String(20), nullable=False, default="abierta")  # abierta | completando
+    job_id = db.Column(db.Integer, nullable=True)  # trabajo que concatena las partes
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expira_en = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class Job(db.Model):
+    """Trabajo en segundo plano (cola en la propia base de datos)."""
+    __tablename__ = "jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(80), nullable=False)
+    payload = db.Column(db.JSON, default=dict)
+
+    estado = db.Column(db.String(20), nullable=False, default="pendiente")  # pendiente | en_curso | completado | fallido
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    max_intentos = db.Column(db.Integer, nullable=False, default=5)
+    ejecutar_desde = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    resultado = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    worker = db.Column(db.String(120), nullable=True)
+
+    empresa_id = db.Column(db.Integer, db.ForeignKey("companies.id"), nullable=True, index=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    tomado_en = db.Column(db.DateTime, nullable=True)
+    latido_en = db.Column(db.DateTime, nullable=True)  # lo renueva el worker mientras el trabajo corre
+    terminado_en = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_jobs_estado_ejecutar_desde", "estado", "ejecutar_desde"),
+    )
+
+
+# ================= HTTP SALIENTE (pool compartido) =================
+class CircuitoAbierto(requests.ConnectionError):
+    """El proveedor acumuló fallos seguidos: se rechaza la llamada sin salir a la red."""
+
+
+class ClienteHTTP:
+    """
+    requests.Session compartida por proceso (keep-alive y pool de conexiones) para toda
+    llamada a proveedores externos. Cada llamada indica una `clave` de proveedor
+    ("google", "microsoft:<tenant>") que agrupa:
+    - reintentos con backoff exponencial y jitter ante errores de conexión y 429/502/503/504,
+      respetando Retry-After. Los métodos no idempotentes (POST de lotes, tokens) solo se
+      reintentan si la petición no llegó a salir (fallo al conectar) o con 429/503, en que
+      el proveedor no la procesó; un timeout de lectura nunca se reintenta;
+    - circuit breaker: tras `umbral` fallos seguidos se rechazan las llamadas durante
+      `enfriamiento` segundos y luego se deja pasar una sola de prueba (semiabierto);
+    - histograma de latencias y conteo por status.
+    """
+
+    REINTENTABLES = (429, 502, 503, 504)
+    REINTENTABLES_NO_IDEMPOTENTE = (429, 503)
+    IDEMPOTENTES = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, timeout=(3.05, 30), reintentos=2, backoff=0.5, backoff_max=8,
+                 umbral=5, enfriamiento=30, pool=16):
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.umbral = umbral
+        self.enfriamiento = enfriamiento
+
+        self.sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=8, pool_maxsize=pool, max_retries=0)
+        self.sesion.mount("https://", adaptador)
+        self.sesion.mount("http://", adaptador)
+
+        self._lock = threading.Lock()
+        self._circuitos = {}
+        self._metricas = {}
+
+    # --- circuit breaker ---
+    def _circuito(self, clave):
+        return self._circuitos.setdefault(clave, {"fallos": 0, "abierto_hasta": 0.0, "prueba": False})
+
+    def _permitir(self, clave):
+        """Deja pasar la llamada o lanza CircuitoAbierto; True si es la petición de prueba."""
+        with self._lock:
+            c = self._circuito(clave)
+            if not c["abierto_hasta"]:
+                return False
+            if c["prueba"] or time.monotonic() < c["abierto_hasta"]:
+                raise CircuitoAbierto(f"Circuito abierto para {clave}: demasiados fallos seguidos")
+            c["prueba"] = True  # semiabierto: una sola petición de prueba
+            return True
+
+    def _soltar_prueba(self, clave):
+        with self._lock:
+            self._circuito(clave)["prueba"] = False
+
+    def _estado_circuito(self, c):
+        if not c["abierto_hasta"]:
+            return "cerrado"
+        if c["prueba"] or time.monotonic() < c["abierto_hasta"]:
+            return "abierto"
+        return "semiabierto"
+
+    def _registrar(self, clave, ok):
+        with self._lock:
+            c = self._circuito(clave)
+            c["prueba"] = False
+            if ok:
+                c["fallos"] = 0
+                c["abierto_hasta"] = 0.0
+            else:
+                c["fallos"] += 1
+                if c["fallos"] >= self.umbral:
+                    c["abierto_hasta"] = time.monotonic() + self.enfriamiento
+
+    # --- métricas ---
+    def _medir(self, clave, segundos, status):
+        with self._lock:
+            m = self._metricas.setdefault(clave, {
+                "buckets": [0] * (len(self.BUCKETS) + 1), "n": 0, "suma": 0.0, "status": Counter(),
+            })
+            i = next((i for i, b in enumerate(self.BUCKETS) if segundos <= b), len(self.BUCKETS))
+            m["buckets"][i] += 1
+            m["n"] += 1
+            m["suma"] += segundos
+            m["status"][str(status)] += 1
+
+    def metricas(self):
+        with self._lock:
+            out = {}
+            for clave, m in self._metricas.items():
+                acumulado, buckets = 0, {}
+                for b, n in zip(self.BUCKETS + ("inf",), m["buckets"]):
+                    acumulado += n
+                    buckets[f"le_{b}"] = acumulado
+                c = self._circuito(clave)
+                out[clave] = {
+                    "peticiones": m["n"],
+                    "latencia_media_ms": round(m["suma"] / m["n"] * 1000, 1) if m["n"] else None,
+                    "latencia_buckets_seg": buckets,
+                    "status": dict(m["status"]),
+                    "circuito": self._estado_circuito(c),
+                    "fallos_seguidos": c["fallos"],
+                }
+            return out
+
+    # --- peticiones ---
+    def _espera(self, intento, retry_after=None):
+        espera = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** intento))
+        if retry_after and str(retry_after).isdigit():
+            espera = max(espera, min(float(retry_after), self.backoff_max))
+        return espera
+
+    @staticmethod
+    def _sin_enviar(ex):
+        """True si el error ocurrió al conectar, antes de mandar la petición."""
+        if isinstance(ex, requests.ConnectTimeout):
+            return True
+        causa = ex.args[0] if ex.args else None
+        causa = getattr(causa, "reason", causa)  # MaxRetryError envuelve el error de urllib3
+        return isinstance(causa, ConnectTimeoutError)  # incluye NewConnectionError (conexión rechazada, DNS)
+
+    def request(self, clave, metodo, url, reintentos=None, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        reintentos = self.reintentos if reintentos is None else reintentos
+        idempotente = metodo.upper() in self.IDEMPOTENTES
+        reintentables = self.REINTENTABLES if idempotente else self.REINTENTABLES_NO_IDEMPOTENTE
+        for intento in range(reintentos + 1):
+            prueba = self._permitir(clave)
+            t0 = time.perf_counter()
+            try:
+                r = self.sesion.request(metodo, url, **kwargs)
+            except requests.ConnectionError as ex:
+                self._medir(clave, time.perf_counter() - t0, "error_conexion")
+                self._registrar(clave, False)
+                if intento >= reintentos or not (idempotente or self._sin_enviar(ex)):
+                    raise
+                espera = self._espera(intento)
+            except requests.Timeout:
+                self._medir(clave, time.perf_counter() - t0, "timeout")
+                self._registrar(clave, False)
+                raise
+            except Exception:
+                self._medir(clave, time.perf_counter() - t0, "error")
+                self._registrar(clave, False)
+                raise
+            else:
+                self._medir(clave, time.perf_counter() - t0, r.status_code)
+                self._registrar(clave, r.status_code < 500 and r.status_code != 429)
+                if r.status_code not in reintentables or intento >= reintentos:
+                    return r
+                espera = self._espera(intento, r.headers.get("Retry-After"))
+            finally:
+                if prueba:
+                    self._soltar_prueba(clave)
+            time.sleep(espera)
+
+    def post(self, clave, url, **kwargs):
+        return self.request(clave, "POST", url, **kwargs)
+
+
+http_saliente = ClienteHTTP(
+    timeout=(HTTP_TIMEOUT_CONEXION, HTTP_TIMEOUT_LECTURA),
+    reintentos=HTTP_REINTENTOS,
+    umbral=HTTP_CIRCUITO_UMBRAL,
+    enfriamiento=HTTP_CIRCUITO_ENFRIAMIENTO_SEG,
+)
+
+
 # ================= HELPERS =================
 def to_int(v, default=None):
     if v is None:
@@ -187,6 +588,19 @@ def _bool(v):
     return str(v).strip().lower() in ("1", "true", "on", "yes", "si", "sí")
 
 
+def parse_plazo(v):
+    """'YYYY-MM-DD' -> date; None si está vacío o no es una fecha válida."""
+    s = (v or "").strip()
+    if not s:
+        return None
+    try:
+        if len(s) == 10 and s[4] == '-' and s[7] == '-':
+            return date.fromisoformat(s)  # mucho más rápido que strptime en importaciones grandes
+        return datetime.strptime(s, '%Y-%m-%d').date()
+    except Exception:
+        return None
+
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -214,11 +628,22 @@ def company_to_dict(e):
 
 # -------- Calendario (OAuth por empresa) --------
 GOOGLE_AUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth"
-GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
+GOOGLE_TOKEN_URL = os.getenv("GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token")
 GOOGLE_CALENDAR_SCOPE = "https://www.googleapis.com/auth/calendar.events"
 
 MS_SCOPES = "offline_access Calendars.ReadWrite"
 
+# APIs de calendario (configurables para probar contra un servidor falso local, ver fake_calendario.py)
+GOOGLE_CALENDAR_API = os.getenv("GOOGLE_CALENDAR_API", "https://www.googleapis.com").rstrip("/")
+MS_LOGIN_URL = os.getenv("MS_LOGIN_URL", "https://login.microsoftonline.com").rstrip("/")
+MS_GRAPH_API = os.getenv("MS_GRAPH_API", "https://graph.microsoft.com").rstrip("/")
+
+def clave_http_calendario(empresa):
+    """Clave de circuito/métricas: Google, o Microsoft por inquilino."""
+    if empresa.calendar_provider == "microsoft":
+        return f"microsoft:{(empresa.calendar_microsoft_tenant or 'common').strip() or 'common'}"
+    return "google"
+
 
 def public_app_base_url():
     """URL pública del sitio (obligatoria en producción para OAuth)."""
@@ -261,6 +686,7 @@ def ensure_company_calendar_columns():
         ("calendar_refresh_token", "TEXT"),
         ("calendar_token_expires_at", "TIMESTAMP" if dialect != "sqlite" else "DATETIME"),
         ("calendar_microsoft_tenant", "VARCHAR(120) DEFAULT 'common'"),
+        ("calendar_sync_cursores", "JSON" if dialect == "postgresql" else "TEXT"),
     ]
     for col, typedef in defs:
         if need(col):
@@ -277,6 +703,122 @@ def ensure_company_calendar_columns():
             db.session.rollback()
 
 
+def ensure_job_columns():
+    """Añade a jobs las columnas agregadas después de crear la tabla."""
+    try:
+        insp = sa_inspect(db.engine)
+        if not insp.has_table("jobs"):
+            return
+        existing = {c["name"] for c in insp.get_columns("jobs")}
+    except Exception:
+        return
+
+    dialect = db.engine.dialect.name
+    defs = [
+        ("latido_en", "TIMESTAMP" if dialect != "sqlite" else "DATETIME"),
+    ]
+    for col, typedef in defs:
+        if col in existing:
+            continue
+        try:
+            db.session.execute(text(f"ALTER TABLE jobs ADD COLUMN {col} {typedef}"))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+
+
+def ensure_subida_columns():
+    """Añade a chunked_uploads las columnas agregadas después de crear la tabla."""
+    try:
+        insp = sa_inspect(db.engine)
+        if not insp.has_table("chunked_uploads"):
+            return
+        existing = {c["name"] for c in insp.get_columns("chunked_uploads")}
+    except Exception:
+        return
+
+    defs = [
+        ("estado", "VARCHAR(20) NOT NULL DEFAULT 'abierta'"),
+        ("job_id", "INTEGER"),
+    ]
+    for col, typedef in defs:
+        if col in existing:
+            continue
+        try:
+            db.session.execute(text(f"ALTER TABLE chunked_uploads ADD COLUMN {col} {typedef}"))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+
+
+TASK_INDEXES = [
+    ("ix_tasks_proyecto_id_id", "proyecto_id, id"),
+    ("ix_tasks_proyecto_plazo_fecha", "proyecto_id, plazo_fecha"),
+    ("ix_tasks_proyecto_situacion", "proyecto_id, situacion"),
+    ("ix_tasks_proyecto_responsable", "proyecto_id, responsable"),
+    ("ix_tasks_proyecto_centro", "proyecto_id, centro_responsabilidad"),
+    ("ix_tasks_proyecto_updated_at", "proyecto_id, updated_at, id"),
+]
+
+
+def ensure_task_schema():
+    """Añade plazo_fecha (con backfill desde plazo) e índices compuestos si la tabla tasks ya existía."""
+    try:
+        insp = sa_inspect(db.engine)
+        if not insp.has_table("tasks"):
+            return
+        existing = {c["name"] for c in insp.get_columns("tasks")}
+    except Exception:
+        return
+
+    if "plazo_fecha" not in existing:
+        try:
+            db.session.execute(text("ALTER TABLE tasks ADD COLUMN plazo_fecha DATE"))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            return
+        backfill_plazo_fecha()
+
+    # El feed de cambios ordena por updated_at: las filas antiguas sin valor toman created_at
+    try:
+        db.session.execute(text(
+            "UPDATE tasks SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE updated_at IS NULL"
+        ))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+
+    for name, cols in TASK_INDEXES:
+        try:
+            db.session.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON tasks ({cols})"))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+
+
+def backfill_plazo_fecha(batch=5000):
+    """Rellena tasks.plazo_fecha a partir del string plazo, por lotes."""
+    last_id = 0
+    while True:
+        rows = (
+            db.session.query(Task.id, Task.plazo)
+            .filter(Task.id > last_id, Task.plazo_fecha.is_(None), Task.plazo != "")
+            .order_by(Task.id.asc())
+            .limit(batch)
+            .all()
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = [{"tid": tid, "f": parse_plazo(plazo)} for tid, plazo in rows]
+        updates = [u for u in updates if u["f"] is not None]
+        if updates:
+            # SQL directo para no tocar updated_at
+            db.session.execute(text("UPDATE tasks SET plazo_fecha = :f WHERE id = :tid"), updates)
+        db.session.commit()
+
+
 def company_calendar_connected(e: Company) -> bool:
     return bool(e and (e.calendar_refresh_token or "").strip())
 
@@ -316,22 +858,54 @@ def user_to_dict(u):
 
 
 # ================= AUTH =================
+# Caché de identidad por petición (flask.g): el usuario y los proyectos se resuelven una sola vez.
+def _identidad_ahorro():
+    g.identidad_ahorros = g.get("identidad_ahorros", 0) + 1
+
+
+@app.after_request
+def identidad_debug_header(response):
+    if app.debug and "identidad_ahorros" in g:
+        response.headers["X-Identity-Cache-Saved"] = str(g.identidad_ahorros)
+    return response
+
+
 def current_user():
+    if "current_user" in g:
+        _identidad_ahorro()
+        return g.current_user
+
     uid = session.get("user_id")
     if not uid:
+        g.current_user = None
         return None
 
     u = db.session.get(User, int(uid))
     if not u or not u.activo:
+        g.current_user = None
         return None
 
-    return {
+    g.current_user = {
         "id": u.id,
         "nombre": u.nombre,
         "correo": u.correo,
         "rol": u.rol,
         "empresa_id": u.empresa_id
     }
+    return g.current_user
+
+
+def _project_cached(proyecto_id: int):
+    """Proyecto como dict (o None), resuelto como máximo una vez por petición."""
+    cache = g.setdefault("proyectos", {})
+    pid = int(proyecto_id)
+    if pid in cache:
+        _identidad_ahorro()
+        return cache[pid]
+
+    p = db.session.get(Project, pid)
+    cache[pid] = project_to_dict(p) if p else None
+    return cache[pid]
 
 
 def login_required(f):
@@ -371,10 +945,7 @@ def clear_active_project():
 
 
 def _get_project(proyecto_id: int):
-    p = db.session.get(Project, int(proyecto_id))
-    if not p:
-        return None
-    return project_to_dict(p)
+    return _project_cached(proyecto_id)
 
 
 def user_can_access_project(u, proyecto_id: int) -> bool:
@@ -384,14 +955,14 @@ def user_can_access_project(u, proyecto_id: int) -> bool:
     if u.get("rol") == "superadmin":
         return True
 
-    p = db.session.get(Project, int(proyecto_id))
+    p = _project_cached(proyecto_id)
     if not p:
         return False
 
-    if p.terminado:
+    if p["terminado"]:
         return False
 
-    return int(p.empresa_id) == int(u.get("empresa_id") or 0)
+    return int(p["empresa_id"]) == int(u.get("empresa_id") or 0)
 
 
 def require_project_access(f):
@@ -406,289 +977,2467 @@ def require_project_access(f):
     return wrapper
 
 
-# ================= TAREAS (DB) =================
-def task_to_dict(t: Task):
-    return {
-        "id": t.id,
-        "texto": t.texto,
-        "situacion": t.situacion,
-        "responsable": t.responsable or "",
-        "centro_responsabilidad": t.centro_responsabilidad or "",
-        "plazo": t.plazo or "",
-        "observacion": t.observacion or "",
-        "recursos": t.recursos or "",
-        "documentos": t.documentos or []
-    }
+# ================= EVENTOS (pub/sub en proceso) =================
+EVENTOS = ("task.created", "task.state_changed", "task.updated", "document.attached")
+EVENTOS_TAREA = ("task.created", "task.state_changed", "task.updated")
 
+_suscriptores = {e: [] for e in EVENTOS}
+_eventos_pool = None
+_eventos_pool_lock = threading.Lock()
+_eventos_broker = None
 
-def load_tareas(proyecto_id: int):
-    tareas_q = Task.query.filter_by(proyecto_id=int(proyecto_id)).order_by(Task.id.asc()).all()
-    tareas = [task_to_dict(t) for t in tareas_q]
-    contador_id = (tareas[-1]["id"] + 1) if tareas else 1
-    return tareas, contador_id
 
+def suscribir(*eventos, asincrono=False, en_todos=False):
+    """
+    Registra fn(evento, datos) para los eventos indicados.
+    asincrono=True la ejecuta en el pool de hilos (con app_context propio), fuera de la petición.
+    en_todos=True la ejecuta también en los demás workers cuando hay broker (cachés y
+    streams locales); si no, solo corre en el proceso que publicó (p.ej. escrituras en BD).
+    """
+    def deco(fn):
+        for e in eventos:
+            if e not in _suscriptores:
+                raise ValueError(f"Evento desconocido: {e}")
+            _suscriptores[e].append((fn, asincrono, en_todos))
+        return fn
+    return deco
 
-def agregar_tarea(proyecto_id, texto, responsable, centro, plazo, observacion, recursos):
-    p = db.session.get(Project, int(proyecto_id))
-    if not p:
-        raise ValueError("Proyecto no existe")
 
-    t = Task(
-        empresa_id=p.empresa_id,
-        proyecto_id=p.id,
-        texto=(texto or "").strip(),
-        situacion="Sin Ejecutar",
-        responsable=(responsable or "").strip(),
-        centro_responsabilidad=(centro or "").strip(),
-        plazo=(plazo or "").strip(),
-        observacion=(observacion or "").strip(),
-        recursos=(recursos or "").strip(),
-        documentos=[]
-    )
-    db.session.add(t)
-    db.session.commit()
-    return task_to_dict(t)
+def _pool_eventos():
+    global _eventos_pool
+    with _eventos_pool_lock:
+        if _eventos_pool is None:
+            _eventos_pool = ThreadPoolExecutor(max_workers=EVENTOS_HILOS, thread_name_prefix="eventos")
+        return _eventos_pool
 
 
-def cambiar_estado(proyecto_id, tid, estado, user):
-    if estado == "Validada" and user.get("rol") not in ("supervisor", "superadmin"):
-        return False
+def _ejecutar_suscriptor(fn, evento, datos):
+    try:
+        fn(evento, datos)
+    except Exception:
+        # publicar corre tras el commit: deshacer solo descarta lo que dejó a medias el
+        # suscriptor, y la sesión queda usable para el resto de la petición
+        db.session.rollback()
+        app.logger.exception("Error en suscriptor %s de %s", fn.__name__, evento)
 
-    if estado not in ESTADOS:
-        return False
 
-    t = Task.query.filter_by(proyecto_id=int(proyecto_id), id=int(tid)).first()
-    if not t:
-        return False
+def _en_contexto(fn, evento, datos):
+    with app.app_context():
+        _ejecutar_suscriptor(fn, evento, datos)
 
-    t.situacion = estado
-    db.session.commit()
-    return True
 
+def _despachar(evento, datos, remoto=False):
+    for fn, asincrono, en_todos in _suscriptores[evento]:
+        if remoto and not en_todos:
+            continue
+        if asincrono:
+            _pool_eventos().submit(_en_contexto, fn, evento, datos)
+        else:
+            _ejecutar_suscriptor(fn, evento, datos)
 
-def actualizar_tarea(proyecto_id, tid, responsable=None, centro=None, plazo=None, observacion=None, recursos=None):
-    t = Task.query.filter_by(proyecto_id=int(proyecto_id), id=int(tid)).first()
-    if not t:
-        return False
 
-    if responsable is not None:
-        t.responsable = (responsable or "").strip()
-    if centro is not None:
-        t.centro_responsabilidad = (centro or "").strip()
-    if plazo is not None:
-        t.plazo = (plazo or "").strip()
-    if observacion is not None:
-        t.observacion = (observacion or "").strip()
-    if recursos is not None:
-        t.recursos = (recursos or "").strip()
+def publicar(evento, **datos):
+    """
+    Publica un evento tras confirmar la transacción. Los suscriptores síncronos corren
+    aquí mismo; un error en uno se registra y no afecta a la petición ni a los demás.
+    """
+    if evento not in _suscriptores:
+        raise ValueError(f"Evento desconocido: {evento}")
+    _despachar(evento, datos)
+    if _eventos_broker is not None:
+        _eventos_broker.enviar(evento, datos)
 
-    db.session.commit()
-    return True
 
+class BrokerPostgres:
+    """
+    Reenvía los eventos a los demás workers con LISTEN/NOTIFY de PostgreSQL
+    (sin dependencias nuevas). Cada proceso escucha en un hilo y despacha localmente
+    solo a los suscriptores en_todos; ignora sus propios mensajes.
+    """
+    CANAL = "planificador_eventos"
+    MAX_PAYLOAD = 7000  # NOTIFY admite hasta 8000 bytes
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.origen = secrets.token_hex(8)
+
+    def enviar(self, evento, datos):
+        payload = json.dumps({"origen": self.origen, "evento": evento, "datos": datos}, default=str)
+        if len(payload) > self.MAX_PAYLOAD:
+            # Lotes grandes: a los otros workers les basta saber qué proyecto cambió
+            payload = json.dumps({
+                "origen": self.origen,
+                "evento": evento,
+                "datos": {"proyecto_id": datos.get("proyecto_id"), "truncado": True},
+            })
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT pg_notify(:canal, :payload)"), {"canal": self.CANAL, "payload": payload})
+                conn.commit()
+        except Exception:
+            app.logger.exception("No se pudo enviar %s al broker", evento)
 
-def agregar_documento(proyecto_id, tid, filename):
-    t = Task.query.filter_by(proyecto_id=int(proyecto_id), id=int(tid)).first()
-    if not t:
-        return False
+    def escuchar(self):
+        while True:
+            try:
+                self._escuchar()
+            except Exception:
+                app.logger.exception("Broker de eventos desconectado; reintentando")
+            time.sleep(5)
 
-    docs = t.documentos or []
-    if filename not in docs:
-        docs.append(filename)
-        t.documentos = docs
-        db.session.commit()
+    def _escuchar(self):
+        raw = self.engine.raw_connection()
+        try:
+            conn = raw.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {self.CANAL}")
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    msg = json.loads(conn.notifies.pop(0).payload)
+                    if msg.get("origen") == self.origen or msg.get("evento") not in _suscriptores:
+                        continue
+                    with app.app_context():
+                        _despachar(msg["evento"], msg.get("datos") or {}, remoto=True)
+        finally:
+            # La conexión quedó en autocommit y con LISTEN: no se devuelve al pool
+            raw.invalidate()
+
+    def iniciar(self):
+        threading.Thread(target=self.escuchar, name="eventos-broker", daemon=True).start()
+        return self
+
+
+def iniciar_broker_eventos():
+    """Activa el broker si EVENTOS_BROKER=postgres y la base es PostgreSQL."""
+    global _eventos_broker
+    if EVENTOS_BROKER != "postgres":
+        return
+    if db.engine.dialect.name != "postgresql":
+        print("ℹ️ EVENTOS_BROKER=postgres ignorado: la base de datos no es PostgreSQL.")
+        return
+    _eventos_broker = BrokerPostgres(db.engine).iniciar()
 
-    return True
 
+# ================= COLA DE TRABAJOS (jobs) =================
+JOBS = {}
+JOBS_NOMBRES = {}
+JOBS_VOLVER = {}
+_jobs_aviso = threading.Event()
 
-# ================= ESTADÍSTICAS =================
-def obtener_estadisticas(tareas_filtradas, estados=ESTADOS):
-    hoy = datetime.now().date()
 
-    por_estado = {estado: 0 for estado in estados}
-    for t in tareas_filtradas:
-        est = t.get('situacion', 'Sin Ejecutar')
-        if est in por_estado:
-            por_estado[est] += 1
+class JobFallido(Exception):
+    """Error definitivo: el trabajo se marca fallido sin reintentar."""
 
-    por_responsable = {}
-    for t in tareas_filtradas:
-        resp = t.get('responsable', '') or 'Sin asignar'
-        por_responsable[resp] = por_responsable.get(resp, 0) + 1
 
-    por_centro = {}
-    for t in tareas_filtradas:
-        centro = t.get('centro_responsabilidad', '') or 'Sin asignar'
-        por_centro[centro] = por_centro.get(centro, 0) + 1
+def job(tipo, nombre=None, volver=None):
+    """
+    Registra fn(payload) -> dict como manejador de los trabajos `tipo`.
+    `volver` es el endpoint al que enlaza la página de estado al terminar.
+    """
+    def deco(fn):
+        JOBS[tipo] = fn
+        JOBS_NOMBRES[tipo] = nombre or tipo
+        if volver:
+            JOBS_VOLVER[tipo] = volver
+        return fn
+    return deco
 
-    vencidas = 0
-    por_vencer = 0
-    sin_plazo = 0
 
-    for t in tareas_filtradas:
-        plazo_str = t.get('plazo', '')
-        if plazo_str:
-            try:
-                plazo_date = datetime.strptime(plazo_str, '%Y-%m-%d').date()
-                if plazo_date < hoy:
-                    vencidas += 1
-                else:
-                    por_vencer += 1
-            except Exception:
-                sin_plazo += 1
-        else:
+def encolar_job(tipo, payload=None, empresa_id=None, usuario_id=None, max_intentos=JOBS_MAX_INTENTOS, demora=0):
+    """Encola un trabajo; con `demora` (segundos) no se ejecuta antes de ese plazo."""
+    if tipo not in JOBS:
+        raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+    j = Job(
+        tipo=tipo,
+        payload=payload or {},
+        empresa_id=empresa_id,
+        usuario_id=usuario_id,
+        max_intentos=max_intentos,
+        ejecutar_desde=datetime.utcnow() + timedelta(seconds=demora),
+    )
+    db.session.add(j)
+    db.session.commit()
+    _jobs_aviso.set()
+    return j
+
+
+def _backoff_job(intentos):
+    base = min(JOBS_BACKOFF_MAX_SEG, JOBS_BACKOFF_SEG * 2 ** max(intentos - 1, 0))
+    return timedelta(seconds=base * random.uniform(0.5, 1.0))
+
+
+def tomar_job(worker):
+    """
+    Reserva el siguiente trabajo pendiente (o None). En PostgreSQL la lectura usa
+    FOR UPDATE SKIP LOCKED; en todo caso el UPDATE condicionado a estado='pendiente'
+    garantiza que dos workers no tomen el mismo trabajo. Un trabajo "en curso" solo se
+    reencola si su worker lleva JOBS_TIMEOUT_SEG sin latir (proceso muerto o colgado).
+    """
+    ahora = datetime.utcnow()
+    Job.query.filter(
+        Job.estado == "en_curso",
+        func.coalesce(Job.latido_en, Job.tomado_en) < ahora - timedelta(seconds=JOBS_TIMEOUT_SEG),
+    ).update({"estado": "pendiente"}, synchronize_session=False)
+    db.session.commit()
+
+    candidatos = (
+        db.session.query(Job.id)
+        .filter(Job.estado == "pendiente", Job.ejecutar_desde <= ahora)
+        .order_by(Job.ejecutar_desde.asc(), Job.id.asc())
+        .limit(5)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for (jid,) in candidatos:
+        n = Job.query.filter(Job.id == jid, Job.estado == "pendiente").update({
+            "estado": "en_curso",
+            "intentos": Job.intentos + 1,
+            "worker": worker,
+            "tomado_en": ahora,
+            "latido_en": ahora,
+        }, synchronize_session=False)
+        db.session.commit()
+        if n:
+            return db.session.get(Job, jid)
+    db.session.commit()
+    return None
+
+
+def _latir_job(jid, worker, fin):
+    """Renueva latido_en cada JOBS_LATIDO_SEG hasta que `fin` se active."""
+    while not fin.wait(JOBS_LATIDO_SEG):
+        with app.app_context():
+            try:
+                Job.query.filter(Job.id == jid, Job.estado == "en_curso", Job.worker == worker).update(
+                    {"latido_en": datetime.utcnow()}, synchronize_session=False
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("No se pudo renovar el latido del trabajo %s", jid)
+
+
+def ejecutar_job(j: Job):
+    """Ejecuta un trabajo ya reservado y registra el resultado, el reintento o el fallo."""
+    fin_latido = threading.Event()
+    threading.Thread(target=_latir_job, args=(j.id, j.worker, fin_latido), name=f"jobs-latido-{j.id}", daemon=True).start()
+    try:
+        return _ejecutar_job(j)
+    finally:
+        fin_latido.set()
+
+
+def _ejecutar_job(j: Job):
+    jid = j.id
+    try:
+        fn = JOBS.get(j.tipo)
+        if not fn:
+            raise JobFallido(f"Tipo de trabajo desconocido: {j.tipo}")
+        resultado = fn(dict(j.payload or {}))
+    except Exception as ex:
+        db.session.rollback()
+        j = db.session.get(Job, jid)
+        definitivo = isinstance(ex, JobFallido) or j.intentos >= j.max_intentos
+        j.error = str(ex) if isinstance(ex, JobFallido) else f"{type(ex).__name__}: {ex}"
+        if definitivo:
+            j.estado = "fallido"
+            j.terminado_en = datetime.utcnow()
+        else:
+            j.estado = "pendiente"
+            j.ejecutar_desde = datetime.utcnow() + _backoff_job(j.intentos)
+        db.session.commit()
+        app.logger.warning("Trabajo %s (%s) intento %s: %s", jid, j.tipo, j.intentos, j.error)
+        return j
+
+    j.estado = "completado"
+    j.resultado = resultado or {}
+    j.error = None
+    j.terminado_en = datetime.utcnow()
+    db.session.commit()
+    return j
+
+
+def procesar_jobs(worker, una_vez=False):
+    """Bucle del worker: toma y ejecuta trabajos; con una_vez=True vacía la cola y termina."""
+    procesados = 0
+    while True:
+        with app.app_context():
+            try:
+                j = tomar_job(worker)
+                if j:
+                    ejecutar_job(j)
+                    procesados += 1
+                    continue
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("Error en el worker de trabajos")
+        if una_vez:
+            return procesados
+        _jobs_aviso.wait(JOBS_POLL_SEG)
+        _jobs_aviso.clear()
+
+
+def iniciar_worker_jobs_web():
+    """
+    Worker en un hilo del proceso web, para despliegues sin proceso worker aparte.
+    Lo llaman gunicorn.conf.py (post_worker_init) y `python app.py`; no se arranca al
+    importar app, así los comandos `flask ...` no toman trabajos que morirían con ellos.
+    """
+    if not JOBS_WORKER_EN_WEB:
+        return
+    nombre = f"web-{os.getpid()}"
+    threading.Thread(target=procesar_jobs, args=(nombre,), name="jobs-worker", daemon=True).start()
+
+
+@app.cli.command("jobs-worker")
+def jobs_worker_cmd():
+    """Procesa la cola de trabajos (varios procesos pueden correr en paralelo)."""
+    import socket
+    nombre = f"{socket.gethostname()}-{os.getpid()}"
+    print(f"✅ Worker de trabajos {nombre} escuchando")
+    procesar_jobs(nombre)
+
+
+@app.cli.command("jobs-encolar")
+@click.argument("tipo")
+@click.argument("payload", required=False, default="{}")
+def jobs_encolar_cmd(tipo, payload):
+    """Encola un trabajo: flask jobs-encolar analisis.reporte '{}'"""
+    j = encolar_job(tipo, json.loads(payload))
+    print(f"✅ Trabajo {j.id} ({tipo}) encolado")
+
+
+@job("analisis.reporte", "Reporte de análisis")
+def job_reporte_analisis(payload):
+    # analisis.py depende de pandas/matplotlib: se importa solo en el worker y sin backend gráfico
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    try:
+        import analisis
+    except ImportError as ex:
+        raise JobFallido(f"Falta una dependencia para el reporte de análisis: {ex.name}")
+    analisis.generar_reporte_completo()
+    return {"mensaje": f"Reporte generado en {os.path.abspath(analisis.OUTPUT_DIR)}"}
+
+
+# ================= ADJUNTOS (almacén por contenido) =================
+# Cada archivo se guarda una vez, con su SHA-256 como nombre, en uploads/blobs/ab/cd/<sha256>
+# (dos niveles de subdirectorios para que ninguno crezca a millones de entradas).
+# Cada fila de attachments con sha256 es una referencia contada en Blob.referencias. Las
+# filas sin sha256 son adjuntos antiguos (archivo suelto en uploads/) y `flask adjuntos-migrar`
+# los pasa al almacén.
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def ruta_blob(sha256):
+    return os.path.join(BLOBS_FOLDER, sha256[:2], sha256[2:4], sha256)
+
+
+def attachment_to_dict(a: Attachment):
+    return {
+        "id": a.id,
+        "nombre": a.nombre,
+        "tamano": a.tamano,
+        "sha256": a.sha256,
+        "archivo": a.archivo,
+        "created_at": a.created_at.isoformat() if a.created_at else None,
+    }
+
+
+def recibir_blob(stream):
+    """
+    Copia `stream` a un temporal calculando el SHA-256 por bloques (sin cargarlo en memoria).
+    Devuelve (sha256, tamano, ruta_temporal); el temporal se entrega a retener_blob o se borra.
+    """
+    h = hashlib.sha256()
+    tamano = 0
+    fd, tmp = tempfile.mkstemp(dir=UPLOAD_TMP_FOLDER)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for bloque in iter(lambda: stream.read(ADJUNTOS_BLOQUE), b""):
+                h.update(bloque)
+                f.write(bloque)
+                tamano += len(bloque)
+    except BaseException:
+        descartar_temporal(tmp)
+        raise
+    return h.hexdigest(), tamano, tmp
+
+
+def descartar_temporal(tmp):
+    if tmp:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+
+
+def retener_blob(sha256, tamano, archivo=None):
+    """
+    Suma una referencia al blob (creándolo si no existe) y, si el contenido aún no está en
+    disco, mueve ahí `archivo`. Va en la transacción de quien inserta el adjunto:
+    el UPDATE bloquea la fila hasta el commit, así recolectar_blobs no puede borrar el archivo
+    entre medio. Si la transacción se deshace, el archivo queda sin fila y lo borra
+    _barrer_huerfanos pasada la gracia (se le actualiza el mtime para contarla desde ahora).
+    """
+    tabla = Blob.__table__
+    upd = tabla.update().where(tabla.c.sha256 == sha256).values(referencias=tabla.c.referencias + 1)
+    if not db.session.execute(upd).rowcount:
+        try:
+            with db.session.begin_nested():
+                db.session.add(Blob(sha256=sha256, tamano=tamano, referencias=1))
+        except IntegrityError:
+            # Otra petición subió el mismo contenido entre medio
+            db.session.execute(upd)
+
+    destino = ruta_blob(sha256)
+    if os.path.exists(destino):
+        descartar_temporal(archivo)
+        os.utime(destino)
+    elif archivo:
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        os.replace(archivo, destino)
+        os.utime(destino)
+
+
+def borrar_adjuntos(filtro):
+    """
+    Borra los adjuntos que cumplen `filtro` y resta sus referencias a cada blob (un GROUP BY
+    sobre attachments, sin leer las filas). Va en la transacción del borrado de tareas.
+    """
+    conteo = (
+        db.session.query(Attachment.sha256, func.count())
+        .filter(filtro, Attachment.sha256.isnot(None))
+        .group_by(Attachment.sha256)
+        .all()
+    )
+    tabla = Blob.__table__
+    ahora = datetime.utcnow()
+    for sha256, n in conteo:
+        db.session.execute(
+            tabla.update()
+            .where(tabla.c.sha256 == sha256)
+            .values(referencias=tabla.c.referencias - n, liberado_en=ahora)
+        )
+    Attachment.query.filter(filtro).delete(synchronize_session=False)
+
+
+def _barrer_huerfanos(gracia, lote=500):
+    """
+    Borra los archivos del almacén (y sus miniaturas) sin fila en blobs y sin tocar hace más de
+    `gracia` segundos: quedan cuando se deshace la transacción que los movió ahí.
+    """
+    limite = time.time() - gracia
+    borrados = liberado = 0
+
+    def barrer(candidatos):
+        nonlocal borrados, liberado
+        shas = {sha for sha, _ in candidatos}
+        con_fila = {sha for (sha,) in db.session.query(Blob.sha256).filter(Blob.sha256.in_(shas))}
+        db.session.commit()
+        for sha, ruta in candidatos:
+            if sha in con_fila:
+                continue
+            try:
+                st = os.stat(ruta)
+                if st.st_mtime >= limite:  # retener_blob lo tocó mientras se consultaba
+                    continue
+                os.unlink(ruta)
+            except FileNotFoundError:
+                continue
+            borrados += 1
+            liberado += st.st_size
+
+    candidatos = []
+    for raiz, _dirs, archivos in os.walk(BLOBS_FOLDER):
+        for nombre in archivos:
+            sha = nombre.split(".", 1)[0]
+            ruta = os.path.join(raiz, nombre)
+            if not SHA256_RE.match(sha):
+                continue
+            try:
+                if os.path.getmtime(ruta) >= limite:
+                    continue
+            except FileNotFoundError:
+                continue
+            candidatos.append((sha, ruta))
+            if len(candidatos) >= lote:
+                barrer(candidatos)
+                candidatos = []
+    if candidatos:
+        barrer(candidatos)
+    return borrados, liberado
+
+
+def recolectar_blobs(gracia=None, lote=500):
+    """
+    Borra los blobs sin referencias hace más de `gracia` segundos (fila y archivo).
+    La fila se bloquea mientras se borra el archivo: una subida concurrente del mismo
+    contenido espera y luego vuelve a crearlo. Luego barre los archivos huérfanos.
+    """
+    gracia = ADJUNTOS_GC_GRACIA_SEG if gracia is None else gracia
+    limite = datetime.utcnow() - timedelta(seconds=gracia)
+    borrados = liberado = 0
+    while True:
+        blobs = (
+            Blob.query
+            .filter(Blob.referencias <= 0, Blob.liberado_en <= limite)
+            .limit(lote)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if not blobs:
+            break
+        for b in blobs:
+            for ruta in (ruta_blob(b.sha256), ruta_miniatura(b.sha256)):
+                try:
+                    os.unlink(ruta)
+                except FileNotFoundError:
+                    pass
+            liberado += b.tamano or 0
+            db.session.delete(b)
+        db.session.commit()
+        borrados += len(blobs)
+    db.session.commit()
+
+    huerfanos, liberado_huerfanos = _barrer_huerfanos(gracia, lote)
+    return borrados + huerfanos, liberado + liberado_huerfanos
+
+
+def servir_adjunto(ruta, nombre, etag=None, max_age=3600):
+    """
+    Respuesta para un adjunto ya autorizado. Con `etag` (el SHA-256 del contenido) el ETag es
+    fuerte y la respuesta inmutable; If-None-Match responde 304 y Range 206 sin leer el resto.
+    Con ADJUNTOS_X_ACCEL el archivo lo envía nginx (sendfile) y el worker queda libre.
+    """
+    if not os.path.isfile(ruta):
+        abort(404)
+
+    if etag and request.if_none_match.contains(etag):
+        r = make_response("", 304)
+        r.set_etag(etag)
+    elif ADJUNTOS_X_ACCEL:
+        relativa = os.path.relpath(ruta, UPLOAD_FOLDER).replace(os.sep, "/")
+        r = make_response("")
+        r.headers["X-Accel-Redirect"] = ADJUNTOS_X_ACCEL.rstrip("/") + "/" + quote(relativa)
+        r.headers["Content-Type"] = mimetypes.guess_type(nombre)[0] or "application/octet-stream"
+        r.headers["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(nombre)}"
+        if etag:
+            r.set_etag(etag)
+    else:
+        r = send_file(ruta, download_name=nombre, conditional=True, etag=etag or True, max_age=None)
+
+    # privado: pasa por control de acceso, ningún proxy compartido debe guardarlo
+    r.cache_control.no_cache = None
+    r.cache_control.private = True
+    r.cache_control.max_age = 31536000 if etag else max_age
+    r.cache_control.immutable = bool(etag)
+    r.headers["X-Content-Type-Options"] = "nosniff"
+    return r
+
+
+# --- subidas por partes (reanudables) ---
+# El cliente declara nombre y tamaño, envía las partes (en cualquier orden, en paralelo y
+# reintentando las que fallen) y al completar un trabajo las concatena hacia el almacén por
+# contenido. La subida pasa de "abierta" a "completando" con un UPDATE condicionado: solo un
+# pedido de completar encola el trabajo y desde ahí no se aceptan más partes.
+def carpeta_subida(sid):
+    return os.path.join(UPLOAD_TMP_FOLDER, "subidas", sid)
+
+
+def partes_subida(s: ChunkedUpload):
+    return max(1, -(-s.tamano // s.tamano_parte))
+
+
+def partes_recibidas(s: ChunkedUpload):
+    try:
+        return sorted(int(x) for x in os.listdir(carpeta_subida(s.id)) if x.isdigit())
+    except FileNotFoundError:
+        return []
+
+
+def _ruta_parte(s: ChunkedUpload, n):
+    return os.path.join(carpeta_subida(s.id), f"{n:06d}")
+
+
+def guardar_parte(s: ChunkedUpload, n, stream, sha256=None):
+    """
+    Escribe la parte `n` por bloques (memoria acotada) y la publica con un rename, así un
+    reintento o dos envíos en paralelo de la misma parte nunca dejan una parte a medias.
+    Verifica el tamaño esperado y, si viene, el SHA-256 de la parte. Devuelve su SHA-256.
+    """
+    total = partes_subida(s)
+    esperado = s.tamano - s.tamano_parte * (total - 1) if n == total - 1 else s.tamano_parte
+    carpeta = carpeta_subida(s.id)
+    os.makedirs(carpeta, exist_ok=True)
+
+    h = hashlib.sha256()
+    tamano = 0
+    fd, tmp = tempfile.mkstemp(dir=carpeta, prefix=".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for bloque in iter(lambda: stream.read(ADJUNTOS_BLOQUE), b""):
+                tamano += len(bloque)
+                if tamano > esperado:
+                    break
+                h.update(bloque)
+                f.write(bloque)
+        if tamano != esperado:
+            raise ValueError(f"La parte {n} debe tener {esperado} bytes")
+        if sha256 and h.hexdigest() != sha256.strip().lower():
+            raise ValueError(f"El SHA-256 de la parte {n} no coincide")
+        os.replace(tmp, _ruta_parte(s, n))
+    except BaseException:
+        descartar_temporal(tmp)
+        raise
+    return h.hexdigest()
+
+
+class _PartesConcatenadas:
+    """Lectura secuencial de varios archivos como si fueran uno (para recibir_blob)."""
+
+    def __init__(self, rutas):
+        self._rutas = iter(rutas)
+        self._f = None
+
+    def read(self, n):
+        while True:
+            if self._f is None:
+                ruta = next(self._rutas, None)
+                if ruta is None:
+                    return b""
+                self._f = open(ruta, "rb")
+            bloque = self._f.read(n)
+            if bloque:
+                return bloque
+            self._f.close()
+            self._f = None
+
+    def close(self):
+        if self._f:
+            self._f.close()
+            self._f = None
+
+
+def completar_subida(s: ChunkedUpload):
+    """
+    Concatena las partes hacia el almacén calculando el SHA-256 del archivo completo, lo
+    compara con el declarado y agrega el documento a la tarea. Devuelve el documento
+    agregado; ValueError si el contenido no cuadra. En ambos casos la subida se cierra; si
+    falla la lectura de las partes queda como está para que el trabajo lo reintente.
+    """
+    lector = _PartesConcatenadas(_ruta_parte(s, n) for n in range(partes_subida(s)))
+    try:
+        sha256, tamano, tmp = recibir_blob(lector)
+    finally:
+        lector.close()
+    if tamano != s.tamano or (s.sha256 and sha256 != s.sha256):
+        descartar_temporal(tmp)
+        cerrar_subida(s)
+        raise ValueError("El archivo completo no coincide con el tamaño o SHA-256 declarados")
+    documento = {"sha256": sha256, "nombre": s.nombre, "tamano": tamano}
+    ok = agregar_documento(s.proyecto_id, s.tarea_id, documento, tmp, s.usuario_id)
+    cerrar_subida(s)
+    if not ok:
+        raise ValueError("La tarea ya no existe")
+    return documento
+
+
+def iniciar_completar_subida(s: ChunkedUpload):
+    """
+    Pasa la subida a "completando" y encola adjuntos.subida en la misma transacción.
+    Devuelve el trabajo, o None si otro pedido ya la estaba completando.
+    """
+    j = Job(
+        tipo="adjuntos.subida",
+        payload={"subida_id": s.id},
+        empresa_id=s.empresa_id,
+        usuario_id=s.usuario_id,
+        max_intentos=JOBS_MAX_INTENTOS,
+        ejecutar_desde=datetime.utcnow(),
+    )
+    db.session.add(j)
+    db.session.flush()
+    tabla = ChunkedUpload.__table__
+    upd = (
+        tabla.update()
+        .where(tabla.c.id == s.id, tabla.c.estado == "abierta")
+        .values(estado="completando", job_id=j.id)
+    )
+    if not db.session.execute(upd).rowcount:
+        db.session.rollback()
+        return None
+    db.session.commit()
+    _jobs_aviso.set()
+    return j
+
+
+@job("adjuntos.subida", "Subida por partes")
+def job_completar_subida(payload):
+    s = db.session.get(ChunkedUpload, str(payload.get("subida_id") or ""))
+    if not s:
+        raise JobFallido("La subida ya no existe o venció")
+    try:
+        documento = completar_subida(s)
+    except ValueError as ex:
+        raise JobFallido(str(ex))
+    return {"mensaje": f"{documento['nombre']} agregado a la tarea", "documento": documento}
+
+
+def cerrar_subida(s: ChunkedUpload):
+    shutil.rmtree(carpeta_subida(s.id), ignore_errors=True)
+    ChunkedUpload.query.filter_by(id=s.id).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def limpiar_subidas_vencidas():
+    """Cierra las subidas vencidas y borra carpetas de partes huérfanas (p.ej. de proyectos borrados)."""
+    ahora = datetime.utcnow()
+    n = 0
+    # las que se están completando tienen otra vigencia completa para que el trabajo termine
+    vencidas = ChunkedUpload.query.filter(or_(
+        and_(ChunkedUpload.estado == "abierta", ChunkedUpload.expira_en < ahora),
+        ChunkedUpload.expira_en < ahora - timedelta(seconds=SUBIDA_VIGENCIA_SEG),
+    ))
+    for s in vencidas.all():
+        cerrar_subida(s)
+        n += 1
+
+    raiz = os.path.join(UPLOAD_TMP_FOLDER, "subidas")
+    limite = time.time() - SUBIDA_VIGENCIA_SEG
+    vigentes = {sid for (sid,) in db.session.query(ChunkedUpload.id)}
+    for sid in os.listdir(raiz) if os.path.isdir(raiz) else []:
+        carpeta = os.path.join(raiz, sid)
+        if sid not in vigentes and os.path.getmtime(carpeta) < limite:
+            shutil.rmtree(carpeta, ignore_errors=True)
+            n += 1
+    return n
+
+
+# --- miniaturas ---
+# Se generan en la cola de trabajos al adjuntar y quedan junto al blob (<sha256>.miniatura.webp):
+# como el contenido no cambia, la miniatura tampoco, y se sirve con caché inmutable.
+def ruta_miniatura(sha256):
+    return ruta_blob(sha256) + ".miniatura.webp"
+
+
+def tiene_miniatura(nombre):
+    return '.' in (nombre or "") and nombre.rsplit('.', 1)[1].lower() in MINIATURA_EXTENSIONES
+
+
+def generar_miniatura(sha256):
+    """
+    Escribe la miniatura del blob (WebP, lado mayor MINIATURA_PX). Pillow y pypdfium2 se
+    importan solo aquí, en el worker. Devuelve False si el contenido no es imagen ni PDF.
+    """
+    from PIL import Image, ImageOps
+
+    origen = ruta_blob(sha256)
+    with open(origen, "rb") as f:
+        es_pdf = f.read(5) == b"%PDF-"
+
+    if es_pdf:
+        import pypdfium2
+        pdf = pypdfium2.PdfDocument(origen)
+        try:
+            pagina = pdf[0]
+            ancho, alto = pagina.get_size()
+            img = pagina.render(scale=MINIATURA_PX / max(ancho, alto, 1)).to_pil()
+        finally:
+            pdf.close()
+        img.thumbnail((MINIATURA_PX, MINIATURA_PX))
+    else:
+        try:
+            original = Image.open(origen)
+        except Image.UnidentifiedImageError:
+            return False
+        with original:
+            original.draft("RGB", (MINIATURA_PX, MINIATURA_PX))  # JPEG: decodifica ya reducido
+            img = ImageOps.exif_transpose(original)
+            img.thumbnail((MINIATURA_PX, MINIATURA_PX))
+
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+
+    destino = ruta_miniatura(sha256)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(destino), prefix=".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            img.save(f, "WEBP", quality=80, method=4)
+        os.replace(tmp, destino)
+    except BaseException:
+        descartar_temporal(tmp)
+        raise
+    return True
+
+
+@job("adjuntos.miniatura", "Miniatura de adjunto")
+def job_miniatura(payload):
+    sha256 = str(payload.get("sha256") or "")
+    if not SHA256_RE.match(sha256) or not os.path.isfile(ruta_blob(sha256)):
+        raise JobFallido("El adjunto no existe")
+    if os.path.exists(ruta_miniatura(sha256)):
+        return {"mensaje": "La miniatura ya existía"}
+    try:
+        from PIL import Image
+        import pypdfium2
+    except ImportError as ex:
+        raise JobFallido(f"Falta una dependencia para generar miniaturas: {ex.name}")
+    try:
+        ok = generar_miniatura(sha256)
+    except (OSError, ValueError, Image.DecompressionBombError, pypdfium2.PdfiumError) as ex:
+        # archivo dañado, PDF inválido, imagen demasiado grande: reintentar no cambia nada
+        raise JobFallido(f"No se pudo generar la miniatura: {ex}")
+    return {"mensaje": "Miniatura generada" if ok else "El archivo no es una imagen ni un PDF"}
+
+
+@suscribir("document.attached", asincrono=True)
+def _miniatura_al_adjuntar(evento, datos):
+    sha256 = datos.get("sha256")
+    if sha256 and tiene_miniatura(datos.get("archivo")) and not os.path.exists(ruta_miniatura(sha256)):
+        p = db.session.get(Project, int(datos["proyecto_id"]))
+        encolar_job("adjuntos.miniatura", {"sha256": sha256}, empresa_id=p.empresa_id if p else None, max_intentos=2)
+
+
+@app.cli.command("adjuntos-miniaturas")
+def adjuntos_miniaturas_cmd():
+    """
+    Encola las miniaturas que faltan (p.ej. de adjuntos migrados o anteriores a esta función):
+    solo de adjuntos con extensión previsualizable y sin un trabajo ya pendiente.
+    """
+    pendientes = {
+        (j.payload or {}).get("sha256")
+        for j in Job.query.filter(Job.tipo == "adjuntos.miniatura", Job.estado.in_(("pendiente", "en_curso")))
+    }
+    q = (
+        db.session.query(Attachment.sha256, Attachment.nombre)
+        .filter(Attachment.sha256.isnot(None))
+        .execution_options(yield_per=1000)
+    )
+    n = 0
+    for sha256, nombre in q:
+        if sha256 in pendientes or not tiene_miniatura(nombre):
+            continue
+        pendientes.add(sha256)
+        if os.path.isfile(ruta_blob(sha256)) and not os.path.exists(ruta_miniatura(sha256)):
+            db.session.add(Job(tipo="adjuntos.miniatura", payload={"sha256": sha256}, max_intentos=2))
+            n += 1
+    db.session.commit()
+    print(f"✅ {n} miniatura(s) encoladas")
+
+
+@job("adjuntos.gc", "Limpieza de adjuntos")
+def job_recolectar_blobs(payload):
+    subidas = limpiar_subidas_vencidas()
+    borrados, liberado = recolectar_blobs(payload.get("gracia"))
+    return {"mensaje": f"{borrados} archivo(s) borrados, {liberado / 1024 / 1024:.1f} MB liberados, {subidas} subida(s) vencidas"}
+
+
+@app.cli.command("adjuntos-gc")
+@click.option("--gracia", type=int, default=None, help="Segundos sin referencias antes de borrar.")
+def adjuntos_gc_cmd(gracia):
+    """Borra del almacén los adjuntos que ya no usa ninguna tarea y las subidas vencidas."""
+    subidas = limpiar_subidas_vencidas()
+    borrados, liberado = recolectar_blobs(gracia)
+    print(f"✅ {borrados} archivo(s) borrados, {liberado / 1024 / 1024:.1f} MB liberados, {subidas} subida(s) vencidas")
+
+
+def migrar_documentos_a_adjuntos(lote=500):
+    """
+    Pasa las entradas de Task.documentos (JSON) a filas de attachments y deja la columna en
+    NULL. Cada tarea se reclama con un UPDATE condicionado, así varios procesos que arrancan
+    a la vez no la migran dos veces. Las referencias de los blobs ya estaban contadas.
+    """
+    tabla = Task.__table__
+    migradas = 0
+    while True:
+        filas = (
+            db.session.query(Task.id, Task.empresa_id, Task.proyecto_id, Task.documentos)
+            .filter(Task.documentos.isnot(None))
+            .order_by(Task.id)
+            .limit(lote)
+            .all()
+        )
+        if not filas:
+            break
+        for tid, empresa_id, proyecto_id, docs in filas:
+            reclamada = db.session.execute(
+                tabla.update().where(tabla.c.id == tid, tabla.c.documentos.isnot(None)).values(documentos=null())
+            ).rowcount
+            if not reclamada:
+                continue
+            vistos = set()
+            for doc in docs or []:
+                if isinstance(doc, dict):
+                    clave = doc.get("sha256")
+                    fila = {"nombre": doc.get("nombre") or clave, "tamano": doc.get("tamano") or 0, "sha256": clave}
+                else:
+                    clave = str(doc)
+                    ruta = os.path.join(UPLOAD_FOLDER, secure_filename(clave))
+                    tamano = os.path.getsize(ruta) if os.path.isfile(ruta) else 0
+                    fila = {"nombre": clave, "tamano": tamano, "archivo": clave}
+                if not clave or clave in vistos:
+                    continue
+                vistos.add(clave)
+                db.session.add(Attachment(empresa_id=empresa_id, proyecto_id=proyecto_id, tarea_id=tid, **fila))
+            migradas += 1
+        db.session.commit()
+    return migradas
+
+
+@app.cli.command("adjuntos-normalizar")
+@click.option("--lote", type=int, default=500, show_default=True, help="Tareas por transacción.")
+def adjuntos_normalizar_cmd(lote):
+    """
+    Pasa a la tabla attachments los adjuntos guardados en Task.documentos (formato anterior).
+    Se corre una vez al desplegar la versión con attachments; repetirlo no hace nada.
+    """
+    migradas = migrar_documentos_a_adjuntos(lote)
+    print(f"✅ {migradas} tarea(s) con adjuntos pasadas a attachments")
+
+
+@app.cli.command("adjuntos-migrar")
+def adjuntos_migrar_cmd():
+    """Pasa los adjuntos antiguos (archivos sueltos en uploads/) al almacén por contenido."""
+    movidos = faltantes = 0
+    ids = [aid for (aid,) in db.session.query(Attachment.id).filter(Attachment.sha256.is_(None)).order_by(Attachment.id)]
+    for aid in ids:
+        a = db.session.get(Attachment, aid)
+        ruta = os.path.join(UPLOAD_FOLDER, secure_filename(a.archivo or ""))
+        if not a.archivo or not os.path.isfile(ruta):
+            faltantes += 1
+            continue
+        with open(ruta, "rb") as f:
+            sha256, tamano, tmp = recibir_blob(f)
+        if Attachment.query.filter_by(tarea_id=a.tarea_id, sha256=sha256).first():
+            # la tarea ya tiene ese contenido en el almacén
+            db.session.delete(a)
+            descartar_temporal(tmp)
+        else:
+            a.sha256, a.tamano, a.archivo = sha256, tamano, None
+            retener_blob(sha256, tamano, tmp)
+        db.session.commit()
+        # el archivo suelto ya está en el almacén (la fila quedó confirmada)
+        descartar_temporal(ruta)
+        movidos += 1
+    print(f"✅ {movidos} archivo(s) al almacén, {faltantes} no encontrados")
+
+
+def uso_adjuntos(*filtros):
+    """
+    Uso de almacenamiento por proyecto: adjuntos, bytes referenciados y bytes únicos (cada
+    contenido contado una vez por proyecto). Un solo GROUP BY sobre attachments.
+    """
+    contenido = func.coalesce(Attachment.sha256, Attachment.archivo)
+    unicos = (
+        db.session.query(Attachment.proyecto_id, func.max(Attachment.tamano).label("tamano"))
+        .filter(*filtros)
+        .group_by(Attachment.proyecto_id, contenido)
+        .subquery()
+    )
+    totales = dict(
+        (pid, (n, b)) for pid, n, b in
+        db.session.query(Attachment.proyecto_id, func.count(), func.coalesce(func.sum(Attachment.tamano), 0))
+        .filter(*filtros)
+        .group_by(Attachment.proyecto_id)
+    )
+    unicos_por_proyecto = dict(
+        db.session.query(unicos.c.proyecto_id, func.coalesce(func.sum(unicos.c.tamano), 0))
+        .group_by(unicos.c.proyecto_id)
+    )
+    return {
+        pid: {"adjuntos": int(n), "bytes": int(b), "bytes_unicos": int(unicos_por_proyecto.get(pid, 0))}
+        for pid, (n, b) in totales.items()
+    }
+
+
+# ================= TAREAS (DB) =================
+def task_to_api(t: Task):
+    """Representación JSON de una tarea para la API (fechas en ISO 8601)."""
+    d = task_to_dict(t)
+    d.pop("plazo_fecha", None)
+    d["updated_at"] = t.updated_at.isoformat() if t.updated_at else None
+    return d
+
+
+def task_to_dict(t: Task):
+    return {
+        "id": t.id,
+        "texto": t.texto,
+        "situacion": t.situacion,
+        "responsable": t.responsable or "",
+        "centro_responsabilidad": t.centro_responsabilidad or "",
+        "plazo": t.plazo or "",
+        "plazo_fecha": t.plazo_fecha,
+        "observacion": t.observacion or "",
+        "recursos": t.recursos or "",
+        "documentos": [attachment_to_dict(a) for a in t.adjuntos]
+    }
+
+
+def load_tareas(proyecto_id: int):
+    tareas_q = Task.query.filter_by(proyecto_id=int(proyecto_id)).order_by(Task.id.asc()).all()
+    tareas = [task_to_dict(t) for t in tareas_q]
+    contador_id = (tareas[-1]["id"] + 1) if tareas else 1
+    return tareas, contador_id
+
+
+def load_tareas_pagina(proyecto_id: int, despues_de=0, limite=PLANIFICADOR_POR_PAGINA, serializar=task_to_dict):
+    """
+    Una página de tareas por cursor (keyset) sobre (proyecto_id, id): las `limite` tareas
+    con id > despues_de. Devuelve (tareas, siguiente_cursor o None si no hay más).
+    """
+    filas = (
+        Task.query
+        .filter(Task.proyecto_id == int(proyecto_id), Task.id > int(despues_de or 0))
+        .order_by(Task.id.asc())
+        .limit(int(limite) + 1)
+        .all()
+    )
+    hay_mas = len(filas) > limite
+    tareas = [serializar(t) for t in filas[:limite]]
+    siguiente = tareas[-1]["id"] if (hay_mas and tareas) else None
+    return tareas, siguiente
+
+
+def load_tareas_resumen_pagina(proyecto_id: int, despues_de=0, limite=PLANIFICADOR_POR_PAGINA):
+    """Como load_tareas_pagina, pero solo con las columnas de la lista (sin observación, recursos ni documentos)."""
+    filas = (
+        db.session.query(
+            Task.id, Task.texto, Task.situacion, Task.responsable,
+            Task.centro_responsabilidad, Task.plazo,
+        )
+        .filter(Task.proyecto_id == int(proyecto_id), Task.id > int(despues_de or 0))
+        .order_by(Task.id.asc())
+        .limit(int(limite) + 1)
+        .all()
+    )
+    hay_mas = len(filas) > limite
+    tareas = [
+        {
+            "id": tid,
+            "texto": texto,
+            "situacion": situacion,
+            "responsable": responsable or "",
+            "centro_responsabilidad": centro or "",
+            "plazo": plazo or "",
+        }
+        for tid, texto, situacion, responsable, centro, plazo in filas[:limite]
+    ]
+    siguiente = tareas[-1]["id"] if (hay_mas and tareas) else None
+    return tareas, siguiente
+
+
+def cursor_cambios(t):
+    """Cursor opaco 'updated_at_id' del feed de cambios."""
+    return f"{t.updated_at.isoformat()}_{t.id}"
+
+
+def _parse_cursor_cambios(cursor):
+    """(updated_at, id) de un cursor; ValueError si no es válido."""
+    ts, _, tid = (cursor or "").rpartition("_")
+    return datetime.fromisoformat(ts), int(tid)
+
+
+class TransaccionLarga(RuntimeError):
+    """Una transacción escribió tareas hace más de CAMBIOS_MARGEN_SEG y ya no puede confirmarse."""
+
+
+# Momento de la primera escritura en tasks de la transacción en curso (en session.info).
+# Desde ahí corre el plazo: updated_at se fija al escribir, y el feed de cambios da por
+# confirmado lo que tenga más de CAMBIOS_MARGEN_SEG; confirmar después lo dejaría atrás del cursor.
+@event.listens_for(db.session, "before_flush")
+def _tareas_en_flush(session, flush_context, instances):
+    if "tareas_escritas_en" not in session.info and any(
+        isinstance(o, Task) for o in itertools.chain(session.new, session.dirty)
+    ):
+        session.info["tareas_escritas_en"] = time.monotonic()
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def _tareas_en_dml(estado):
+    tabla = getattr(estado.statement, "table", None)
+    if (estado.is_insert or estado.is_update) and getattr(tabla, "name", None) == Task.__tablename__:
+        estado.session.info.setdefault("tareas_escritas_en", time.monotonic())
+
+
+@event.listens_for(db.session, "before_commit")
+def _limitar_transaccion_tareas(session):
+    desde = session.info.get("tareas_escritas_en")
+    if desde is not None and 0 < CAMBIOS_MARGEN_SEG < time.monotonic() - desde:
+        raise TransaccionLarga(
+            f"La transacción escribió tareas hace más de {CAMBIOS_MARGEN_SEG:g} s (CAMBIOS_MARGEN_SEG); "
+            "confirmarla dejaría cambios fuera del feed"
+        )
+
+
+@event.listens_for(db.session, "after_transaction_end")
+def _fin_transaccion_tareas(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("tareas_escritas_en", None)
+
+
+def cambios_tareas(proyecto_id: int, cursor=None, limite=PLANIFICADOR_POR_PAGINA, serializar=task_to_api):
+    """
+    Tareas modificadas después de `cursor`, en orden (updated_at, id), vía el índice
+    (proyecto_id, updated_at, id). Sin cursor empieza desde el principio.
+    Devuelve (tareas, cursor para la siguiente consulta, hay_mas).
+    """
+    hasta = datetime.utcnow() - timedelta(seconds=CAMBIOS_MARGEN_SEG)
+    q = Task.query.filter(Task.proyecto_id == int(proyecto_id), Task.updated_at <= hasta)
+    if cursor:
+        ts, tid = _parse_cursor_cambios(cursor)
+        q = q.filter(or_(Task.updated_at > ts, and_(Task.updated_at == ts, Task.id > tid)))
+
+    filas = q.order_by(Task.updated_at.asc(), Task.id.asc()).limit(int(limite) + 1).all()
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    siguiente = cursor_cambios(filas[-1]) if filas else cursor
+    return [serializar(t) for t in filas], siguiente, hay_mas
+
+
+def _limite_pagina():
+    limite = request.args.get("limite", PLANIFICADOR_POR_PAGINA, type=int) or PLANIFICADOR_POR_PAGINA
+    return min(max(limite, 1), PLANIFICADOR_MAX_POR_PAGINA)
+
+
+def agregar_tarea(proyecto_id, texto, responsable, centro, plazo, observacion, recursos):
+    p = db.session.get(Project, int(proyecto_id))
+    if not p:
+        raise ValueError("Proyecto no existe")
+
+    t = Task(
+        empresa_id=p.empresa_id,
+        proyecto_id=p.id,
+        texto=(texto or "").strip(),
+        situacion="Sin Ejecutar",
+        responsable=(responsable or "").strip(),
+        centro_responsabilidad=(centro or "").strip(),
+        plazo=(plazo or "").strip(),
+        plazo_fecha=parse_plazo(plazo),
+        observacion=(observacion or "").strip(),
+        recursos=(recursos or "").strip(),
+    )
+    db.session.add(t)
+    project_stats_aplicar(p.id, despues=_stats_claves(t))
+    db.session.commit()
+    publicar("task.created", proyecto_id=p.id, ids=[t.id], n=1)
+    return task_to_dict(t)
+
+
+def cambiar_estado(proyecto_id, tid, estado, user):
+    if estado == "Validada" and user.get("rol") not in ("supervisor", "superadmin"):
+        return False
+
+    if estado not in ESTADOS:
+        return False
+
+    t = Task.query.filter_by(proyecto_id=int(proyecto_id), id=int(tid)).first()
+    if not t:
+        return False
+
+    anterior = t.situacion
+    antes = _stats_claves(t)
+    t.situacion = estado
+    project_stats_aplicar(t.proyecto_id, antes, _stats_claves(t))
+    db.session.commit()
+    if anterior != estado:
+        publicar(
+            "task.state_changed",
+            proyecto_id=t.proyecto_id,
+            cambios=[{"id": t.id, "antes": anterior, "despues": estado}],
+        )
+    return True
+
+
+def actualizar_tarea(proyecto_id, tid, responsable=None, centro=None, plazo=None, observacion=None, recursos=None):
+    t = Task.query.filter_by(proyecto_id=int(proyecto_id), id=int(tid)).first()
+    if not t:
+        return False
+
+    antes = _stats_claves(t)
+    valores = {
+        "responsable": responsable,
+        "centro_responsabilidad": centro,
+        "plazo": plazo,
+        "observacion": observacion,
+        "recursos": recursos,
+    }
+    campos = []
+    for campo, valor in valores.items():
+        if valor is None:
+            continue
+        valor = (valor or "").strip()
+        if getattr(t, campo) != valor:
+            setattr(t, campo, valor)
+            campos.append(campo)
+        if campo == "plazo":
+            t.plazo_fecha = parse_plazo(valor)
+
+    project_stats_aplicar(t.proyecto_id, antes, _stats_claves(t))
+    db.session.commit()
+    if campos:
+        publicar("task.updated", proyecto_id=t.proyecto_id, ids=[t.id], campos=campos)
+    return True
+
+
+def agregar_documento(proyecto_id, tid, documento, archivo=None, usuario_id=None):
+    """
+    Agrega a la tarea el adjunto {"sha256", "nombre", "tamano"} (un INSERT) y su referencia
+    al blob. `archivo` es el temporal de recibir_blob: se mueve al almacén o se descarta.
+    Un contenido que la tarea ya tiene no se vuelve a agregar (restricción única).
+    """
+    t = db.session.query(Task.empresa_id).filter_by(proyecto_id=int(proyecto_id), id=int(tid)).first()
+    if not t:
+        descartar_temporal(archivo)
+        return False
+
+    a = Attachment(
+        empresa_id=t.empresa_id,
+        proyecto_id=int(proyecto_id),
+        tarea_id=int(tid),
+        nombre=documento["nombre"],
+        tamano=documento["tamano"],
+        sha256=documento["sha256"],
+        usuario_id=usuario_id,
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(a)
+    except IntegrityError:
+        descartar_temporal(archivo)
+        return True
+
+    retener_blob(documento["sha256"], documento["tamano"], archivo)
+    # mueve updated_at para que el feed de cambios incluya la tarea
+    Task.query.filter_by(id=int(tid)).update({"updated_at": datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    publicar(
+        "document.attached",
+        proyecto_id=int(proyecto_id), tarea_id=int(tid), adjunto_id=a.id,
+        archivo=documento["nombre"], sha256=documento["sha256"],
+    )
+    return True
+
+
+def fila_tarea(p: Project, texto, responsable="", centro="", plazo="", observacion="", recursos=""):
+    """Diccionario listo para insertar en tasks (mismas reglas que agregar_tarea)."""
+    return {
+        "empresa_id": p.empresa_id,
+        "proyecto_id": p.id,
+        "texto": (texto or "").strip(),
+        "situacion": "Sin Ejecutar",
+        "responsable": (responsable or "").strip(),
+        "centro_responsabilidad": (centro or "").strip(),
+        "plazo": (plazo or "").strip(),
+        "plazo_fecha": parse_plazo(plazo),
+        "observacion": (observacion or "").strip(),
+        "recursos": (recursos or "").strip(),
+    }
+
+
+def insertar_tareas_lote(proyecto_id, filas, devolver=True):
+    """
+    Inserta muchas tareas (dicts de fila_tarea) con un solo INSERT ejecutado por lotes
+    (executemany), actualiza project_stats una vez y confirma la transacción.
+    Con devolver=True usa RETURNING y devuelve las Task creadas; si no, devuelve [].
+    """
+    if not filas:
+        return []
+    if devolver:
+        tareas = db.session.scalars(insert(Task).returning(Task), filas).all()
+    else:
+        # INSERT de Core: executemany directo del driver, sin RETURNING
+        db.session.execute(Task.__table__.insert(), filas)
+        tareas = []
+    project_stats_aplicar(proyecto_id, despues=[c for f in filas for c in _stats_claves_fila(f)])
+    db.session.commit()
+    publicar(
+        "task.created",
+        proyecto_id=int(proyecto_id),
+        ids=[t.id for t in tareas] if devolver else None,
+        n=len(filas),
+    )
+    return tareas
+
+
+def actualizar_tareas_lote(proyecto_id, cambios):
+    """
+    Aplica {tid: {campo: valor}} a las tareas del proyecto en una sola transacción.
+    Devuelve (tareas que cambiaron, ids inexistentes); si falta alguna no se escribe nada.
+    """
+    pid = int(proyecto_id)
+    tareas = Task.query.filter(Task.proyecto_id == pid, Task.id.in_(list(cambios))).all()
+    faltantes = sorted(set(cambios) - {t.id for t in tareas})
+    if faltantes:
+        return [], faltantes
+
+    antes, despues, cambiadas = [], [], []
+    cambios_estado, editadas, campos_editados = [], [], set()
+    for t in tareas:
+        claves = _stats_claves(t)
+        situacion = t.situacion
+        cambio = editada = False
+        for campo, valor in cambios[t.id].items():
+            if getattr(t, campo) != valor:
+                setattr(t, campo, valor)
+                cambio = True
+                if campo != "situacion":
+                    editada = True
+                    campos_editados.add(campo)
+            if campo == "plazo":
+                t.plazo_fecha = parse_plazo(valor)
+        if cambio:
+            antes += claves
+            despues += _stats_claves(t)
+            cambiadas.append(t)
+            if t.situacion != situacion:
+                cambios_estado.append({"id": t.id, "antes": situacion, "despues": t.situacion})
+            if editada:
+                editadas.append(t.id)
+
+    project_stats_aplicar(pid, antes, despues)
+    db.session.commit()
+    if cambios_estado:
+        publicar("task.state_changed", proyecto_id=pid, cambios=cambios_estado)
+    if editadas:
+        publicar("task.updated", proyecto_id=pid, ids=sorted(editadas), campos=sorted(campos_editados))
+    return sorted(cambiadas, key=lambda t: t.id), []
+
+
+# ================= ESTADÍSTICAS =================
+def obtener_estadisticas(tareas_filtradas, estados=ESTADOS):
+    hoy = datetime.now().date()
+
+    por_estado = {estado: 0 for estado in estados}
+    for t in tareas_filtradas:
+        est = t.get('situacion', 'Sin Ejecutar')
+        if est in por_estado:
+            por_estado[est] += 1
+
+    por_responsable = {}
+    for t in tareas_filtradas:
+        resp = t.get('responsable', '') or 'Sin asignar'
+        por_responsable[resp] = por_responsable.get(resp, 0) + 1
+
+    por_centro = {}
+    for t in tareas_filtradas:
+        centro = t.get('centro_responsabilidad', '') or 'Sin asignar'
+        por_centro[centro] = por_centro.get(centro, 0) + 1
+
+    vencidas = 0
+    por_vencer = 0
+    sin_plazo = 0
+
+    for t in tareas_filtradas:
+        plazo_date = t.get('plazo_fecha')
+        if plazo_date is None:
             sin_plazo += 1
+        elif plazo_date < hoy:
+            vencidas += 1
+        else:
+            por_vencer += 1
+
+    return {
+        'total': len(tareas_filtradas),
+        'por_estado': por_estado,
+        'por_responsable': por_responsable,
+        'por_centro': por_centro,
+        'vencidas': vencidas,
+        'por_vencer': por_vencer,
+        'sin_plazo': sin_plazo
+    }
+
+
+def obtener_estadisticas_db(*criterios, estados=ESTADOS):
+    """
+    Igual que obtener_estadisticas, pero calcula los conteos con GROUP BY / CASE
+    en la base de datos sobre las tareas que cumplen `criterios`
+    (p.ej. Task.proyecto_id == pid), sin materializar las filas.
+    """
+    hoy = datetime.now().date()
+
+    vencida = case((Task.plazo_fecha < hoy, 1), else_=0)
+    vigente = case((Task.plazo_fecha >= hoy, 1), else_=0)
+
+    filas_estado = (
+        db.session.query(
+            Task.situacion,
+            func.count(Task.id),
+            func.sum(vencida),
+            func.sum(vigente),
+        )
+        .filter(*criterios)
+        .group_by(Task.situacion)
+        .all()
+    )
+
+    total = 0
+    vencidas = 0
+    por_vencer = 0
+    por_estado = {estado: 0 for estado in estados}
+    for situacion, n, n_vencidas, n_vigentes in filas_estado:
+        total += n
+        vencidas += int(n_vencidas or 0)
+        por_vencer += int(n_vigentes or 0)
+        if situacion in por_estado:
+            por_estado[situacion] += n
+
+    def _agrupar(columna):
+        # Se ordena por la primera aparición para conservar el orden de la versión en Python
+        filas = (
+            db.session.query(columna, func.count(Task.id))
+            .filter(*criterios)
+            .group_by(columna)
+            .order_by(func.min(Task.id))
+            .all()
+        )
+        out = {}
+        for valor, n in filas:
+            clave = valor or 'Sin asignar'
+            out[clave] = out.get(clave, 0) + n
+        return out
+
+    return {
+        'total': total,
+        'por_estado': por_estado,
+        'por_responsable': _agrupar(Task.responsable),
+        'por_centro': _agrupar(Task.centro_responsabilidad),
+        'vencidas': vencidas,
+        'por_vencer': por_vencer,
+        'sin_plazo': total - vencidas - por_vencer
+    }
+
+
+FILTROS_TABLERO = ("centro", "responsable", "estado", "plazo", "objetivo")
+
+
+def filtros_desde_request():
+    """Filtros del tablero leídos de la query string ('Todos' si no vienen)."""
+    return {k: request.args.get(k, 'Todos') for k in FILTROS_TABLERO}
+
+
+def filtros_tareas_sql(proyecto_id, centro=None, responsable=None, estado=None, plazo=None, objetivo=None, objetivos_map=None):
+    """
+    Traduce los filtros del tablero a criterios SQLAlchemy sobre Task (se combinan con AND),
+    para usarlos con Task.query.filter(*criterios) u obtener_estadisticas_db(*criterios).
+    """
+    criterios = [Task.proyecto_id == int(proyecto_id)]
+    hoy = datetime.now().date()
+
+    if centro and centro != 'Todos':
+        criterios.append(Task.centro_responsabilidad == centro)
+
+    if responsable and responsable != 'Todos':
+        criterios.append(Task.responsable == responsable)
+
+    if estado and estado != 'Todos':
+        criterios.append(Task.situacion == estado)
+
+    if objetivo is not None and objetivo != 'Todos' and objetivos_map:
+        oid = to_int(objetivo)
+        obj = objetivos_map.get(oid) if oid is not None else None
+        if obj:
+            centros = obj.get('centros') or []
+            if centros:
+                criterios.append(func.coalesce(Task.centro_responsabilidad, '').in_(centros))
+
+    if plazo and plazo != 'Todos':
+        if plazo == 'vencidas':
+            criterios.append(Task.plazo_fecha < hoy)
+
+        elif plazo == 'por_vencer':
+            criterios.append(Task.plazo_fecha >= hoy)
+
+        elif plazo == 'sin_plazo':
+            criterios.append(or_(Task.plazo.is_(None), Task.plazo == ''))
+
+    return criterios
+
+
+KPI_AUTO_TIPOS = [
+    'avance_completadas_pct',
+    'avance_validadas_pct',
+    'tareas_vencidas',
+    'tareas_total',
+]
+
+
+def objective_to_dict(o: Objective):
+    return {
+        'id': o.id,
+        'empresa_id': o.empresa_id,
+        'proyecto_id': o.proyecto_id,
+        'nombre': o.nombre,
+        'descripcion': o.descripcion or '',
+        'centros': o.centros or [],
+        'responsable': o.responsable or '',
+        'estado': o.estado or 'Activo',
+        'fecha_inicio': o.fecha_inicio or '',
+        'fecha_fin': o.fecha_fin or ''
+    }
+
+
+def conteos_kpi_por_centro(proyecto_id: int):
+    """
+    Una sola consulta agregada por centro con todo lo que necesitan los KPI automáticos:
+    {centro: {'total', 'completadas', 'validadas', 'vencidas'}}.
+    """
+    hoy = datetime.now().date()
+    cerrada = Task.situacion.in_(('Completada', 'Validada'))
+    filas = (
+        db.session.query(
+            Task.centro_responsabilidad,
+            func.count(Task.id),
+            func.sum(case((Task.situacion == 'Completada', 1), else_=0)),
+            func.sum(case((Task.situacion == 'Validada', 1), else_=0)),
+            func.sum(case(((Task.plazo_fecha < hoy) & ~cerrada, 1), else_=0)),
+        )
+        .filter(Task.proyecto_id == int(proyecto_id))
+        .group_by(Task.centro_responsabilidad)
+        .all()
+    )
+
+    conteos = {}
+    for centro, total, completadas, validadas, vencidas in filas:
+        c = conteos.setdefault(centro or '', {'total': 0, 'completadas': 0, 'validadas': 0, 'vencidas': 0})
+        c['total'] += total
+        c['completadas'] += int(completadas or 0)
+        c['validadas'] += int(validadas or 0)
+        c['vencidas'] += int(vencidas or 0)
+    return conteos
+
+
+def _valor_kpi_auto(auto_tipo, c):
+    total = c['total']
+    if auto_tipo == 'tareas_total':
+        return float(total)
+    if auto_tipo == 'tareas_vencidas':
+        return float(c['vencidas'])
+
+    if total <= 0:
+        return 0.0
+
+    if auto_tipo == 'avance_completadas_pct':
+        return 100.0 * c['completadas'] / total
+    if auto_tipo == 'avance_validadas_pct':
+        return 100.0 * c['validadas'] / total
+
+    return None
+
+
+def calcular_kpis_actuales(kpis, proyecto_id: int, objetivos_map: dict):
+    """
+    Valor actual de cada KPI, {kpi_id: valor}. Las tareas del proyecto se agregan
+    una sola vez (por centro) y cada objetivo suma los centros que le corresponden.
+    """
+    conteos = None
+    por_centros = {}
+    out = {}
+
+    for k in kpis:
+        if (k.modo or 'manual') == 'manual':
+            out[k.id] = k.actual_manual
+            continue
+
+        obj = objetivos_map.get(k.objetivo_id)
+        if not obj:
+            out[k.id] = None
+            continue
+
+        if conteos is None:
+            conteos = conteos_kpi_por_centro(proyecto_id)
+
+        centros = tuple(sorted(obj.get('centros') or []))
+        if centros not in por_centros:
+            agg = {'total': 0, 'completadas': 0, 'validadas': 0, 'vencidas': 0}
+            for centro, c in conteos.items():
+                if centros and centro not in centros:
+                    continue
+                for clave in agg:
+                    agg[clave] += c[clave]
+            por_centros[centros] = agg
+
+        out[k.id] = _valor_kpi_auto(k.auto_tipo, por_centros[centros])
+
+    return out
+
+
+def kpi_to_dict(k: KPI, actual):
+    estado_kpi = 'sin_meta'
+    if k.meta is not None and actual is not None:
+        estado_kpi = 'ok' if actual >= k.meta else 'bajo'
+    return {
+        'id': k.id,
+        'objetivo_id': k.objetivo_id,
+        'nombre': k.nombre,
+        'unidad': k.unidad or '',
+        'meta': k.meta,
+        'modo': k.modo or 'manual',
+        'auto_tipo': k.auto_tipo,
+        'actual_manual': k.actual_manual,
+        'actual': actual,
+        'estado_kpi': estado_kpi,
+    }
+
+
+def kpis_proyecto(proyecto_id: int, objetivos_map: dict):
+    kpis = (
+        KPI.query.join(Objective, KPI.objetivo_id == Objective.id)
+        .filter(Objective.proyecto_id == int(proyecto_id))
+        .order_by(KPI.id.asc())
+        .all()
+    )
+    actuales = calcular_kpis_actuales(kpis, proyecto_id, objetivos_map)
+    return [kpi_to_dict(k, actuales[k.id]) for k in kpis]
+
+
+# ================= ESTADÍSTICAS MATERIALIZADAS (project_stats) =================
+def _bucket_plazo(plazo_fecha, hoy):
+    if plazo_fecha is None:
+        return 'sin_plazo'
+    return 'vencidas' if plazo_fecha < hoy else 'por_vencer'
+
+
+def _stats_claves_valores(situacion, responsable, centro, plazo_fecha):
+    hoy = datetime.now().date()
+    return [
+        ('total', ''),
+        ('situacion', situacion or ''),
+        ('responsable', responsable or 'Sin asignar'),
+        ('centro', centro or 'Sin asignar'),
+        ('plazo', _bucket_plazo(plazo_fecha, hoy)),
+    ]
+
+
+def _stats_claves(t: Task):
+    """(dimensión, clave) a las que aporta una tarea en project_stats."""
+    return _stats_claves_valores(t.situacion, t.responsable, t.centro_responsabilidad, t.plazo_fecha)
+
+
+def _stats_claves_fila(d: dict):
+    """Igual que _stats_claves, para un dict de fila_tarea."""
+    return _stats_claves_valores(
+        d.get("situacion"), d.get("responsable"), d.get("centro_responsabilidad"), d.get("plazo_fecha")
+    )
+
+
+def project_stats_aplicar(proyecto_id, antes=(), despues=()):
+    """
+    Aplica a project_stats la diferencia entre las claves de una tarea antes y después
+    de escribirla. Va en la misma transacción que la escritura de la tarea, con la fila
+    del proyecto bloqueada en modo compartido frente a recalcular_project_stats.
+    Si el proyecto aún no está materializado no hace nada (se calcula completo al leer).
+    """
+    delta = Counter(despues)
+    delta.subtract(Counter(antes))
+    delta = {k: d for k, d in delta.items() if d}
+    if not delta:
+        return
+
+    pid = int(proyecto_id)
+    # FOR SHARE sobre el proyecto: una reconstrucción (FOR UPDATE) espera a que este delta se
+    # confirme y cuente la tarea, o este espera a que termine y suma sobre las filas nuevas
+    db.session.query(Project.id).filter(Project.id == pid).with_for_update(read=True).first()
+    materializado = db.session.query(ProjectStat.id).filter_by(proyecto_id=pid, dimension='total').first()
+    if not materializado:
+        return
+
+    tabla = ProjectStat.__table__
+    hoy = datetime.now().date()
+    for (dimension, clave), d in delta.items():
+        upd = (
+            tabla.update()
+            .where(tabla.c.proyecto_id == pid, tabla.c.dimension == dimension, tabla.c.clave == clave)
+            .values(n=tabla.c.n + d)
+        )
+        if db.session.execute(upd).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.add(ProjectStat(
+                    proyecto_id=pid,
+                    dimension=dimension,
+                    clave=clave,
+                    n=d,
+                    fecha_ref=hoy if dimension == 'plazo' else None,
+                ))
+        except IntegrityError:
+            # Otra petición creó la fila entre medio
+            db.session.execute(upd)
+
+
+def _project_stats_vigentes(proyecto_ids, hoy):
+    """Proyectos ya materializados con los buckets de plazo calculados hoy."""
+    return {
+        pid for pid, fecha_min in (
+            db.session.query(ProjectStat.proyecto_id, func.min(ProjectStat.fecha_ref))
+            .filter(ProjectStat.proyecto_id.in_(proyecto_ids), ProjectStat.dimension == 'plazo')
+            .group_by(ProjectStat.proyecto_id)
+            .all()
+        )
+        if fecha_min is not None and fecha_min >= hoy
+    }
+
+
+def recalcular_project_stats(proyecto_id, solo_vencidos=False):
+    """
+    Reconstruye project_stats de un proyecto desde la tabla tasks. La fila del proyecto
+    se bloquea (FOR UPDATE; SQLite ya serializa las escrituras) para que dos
+    reconstrucciones simultáneas no inserten las mismas claves; con solo_vencidos=True,
+    si otra petición lo reconstruyó mientras se esperaba el bloqueo, no se repite.
+    """
+    pid = int(proyecto_id)
+    hoy = datetime.now().date()
+    db.session.query(Project.id).filter(Project.id == pid).with_for_update().first()
+    if solo_vencidos and _project_stats_vigentes([pid], hoy):
+        db.session.commit()
+        return
+    est = obtener_estadisticas_db(Task.proyecto_id == pid)
+
+    filas = [('total', '', est['total'])]
+    filas += [('situacion', k, n) for k, n in est['por_estado'].items() if n]
+    filas += [('responsable', k, n) for k, n in est['por_responsable'].items()]
+    filas += [('centro', k, n) for k, n in est['por_centro'].items()]
+    filas += [('plazo', k, est[k]) for k in ('vencidas', 'por_vencer', 'sin_plazo')]
+
+    ProjectStat.query.filter_by(proyecto_id=pid).delete(synchronize_session=False)
+    db.session.add_all([
+        ProjectStat(
+            proyecto_id=pid,
+            dimension=dimension,
+            clave=clave,
+            n=n,
+            fecha_ref=hoy if dimension == 'plazo' else None,
+        )
+        for dimension, clave, n in filas
+    ])
+    db.session.commit()
 
-    return {
-        'total': len(tareas_filtradas),
-        'por_estado': por_estado,
-        'por_responsable': por_responsable,
-        'por_centro': por_centro,
-        'vencidas': vencidas,
-        'por_vencer': por_vencer,
-        'sin_plazo': sin_plazo
+
+def asegurar_project_stats(proyecto_ids):
+    """
+    Calcula en el momento los proyectos aún sin materializar. Los que tienen los buckets
+    de plazo de otro día se sirven como están y su reconstrucción se encola
+    (stats.recalcular; además de reconciliar-stats cada noche): leer no recorre tareas.
+    """
+    ids = [int(x) for x in proyecto_ids]
+    if not ids:
+        return
+    hoy = datetime.now().date()
+    fechas = dict(
+        db.session.query(
+            ProjectStat.proyecto_id,
+            func.min(case((ProjectStat.dimension == 'plazo', ProjectStat.fecha_ref), else_=None)),
+        )
+        .filter(ProjectStat.proyecto_id.in_(ids), ProjectStat.dimension.in_(('total', 'plazo')))
+        .group_by(ProjectStat.proyecto_id)
+        .all()
+    )
+    for pid in ids:
+        if pid not in fechas:
+            recalcular_project_stats(pid, solo_vencidos=True)
+    viejos = [pid for pid, fecha in fechas.items() if fecha is None or fecha < hoy]
+    if viejos:
+        encolar_recalculo_stats(viejos)
+
+
+def encolar_recalculo_stats(proyecto_ids):
+    """Encola stats.recalcular para las empresas de los proyectos, salvo que ya haya uno pendiente."""
+    empresas = {eid for (eid,) in db.session.query(Project.empresa_id).filter(Project.id.in_(proyecto_ids)).distinct()}
+    pendientes = {
+        eid for (eid,) in db.session.query(Job.empresa_id).filter(
+            Job.tipo == "stats.recalcular", Job.estado == "pendiente", Job.empresa_id.in_(empresas),
+        )
     }
+    for eid in sorted(empresas - pendientes):
+        encolar_job("stats.recalcular", {"empresa_id": eid}, empresa_id=eid)
 
 
-def filtrar_tareas(tareas, centro=None, responsable=None, estado=None, plazo=None, objetivo_id=None, objetivos_map=None):
-    tareas_filtradas = list(tareas)
-    hoy = datetime.now().date()
+@job("stats.recalcular", "Recálculo de estadísticas")
+def job_recalcular_stats(payload):
+    eid = int(payload["empresa_id"])
+    ids = [pid for (pid,) in db.session.query(Project.id).filter_by(empresa_id=eid).order_by(Project.id.asc())]
+    vigentes = _project_stats_vigentes(ids, datetime.now().date()) if ids else set()
+    pendientes = [pid for pid in ids if pid not in vigentes]
+    for pid in pendientes:
+        recalcular_project_stats(pid, solo_vencidos=True)
+    return {"mensaje": f"{len(pendientes)} proyecto(s) recalculados."}
 
-    if centro and centro != 'Todos':
-        tareas_filtradas = [t for t in tareas_filtradas if t.get('centro_responsabilidad') == centro]
 
-    if responsable and responsable != 'Todos':
-        tareas_filtradas = [t for t in tareas_filtradas if t.get('responsable') == responsable]
+def estadisticas_proyectos(proyecto_ids, estados=ESTADOS):
+    """
+    Estadísticas de varios proyectos leídas de project_stats, {proyecto_id: dict}
+    con la misma forma que obtener_estadisticas.
+    """
+    ids = [int(x) for x in proyecto_ids]
+    asegurar_project_stats(ids)
+
+    out = {
+        pid: {
+            'total': 0,
+            'por_estado': {estado: 0 for estado in estados},
+            'por_responsable': {},
+            'por_centro': {},
+            'vencidas': 0,
+            'por_vencer': 0,
+            'sin_plazo': 0
+        }
+        for pid in ids
+    }
+    if not ids:
+        return out
+
+    filas = (
+        ProjectStat.query
+        .filter(ProjectStat.proyecto_id.in_(ids))
+        .order_by(ProjectStat.id.asc())
+        .all()
+    )
+    for s in filas:
+        est = out[s.proyecto_id]
+        if s.dimension == 'total':
+            est['total'] = s.n
+        elif s.dimension == 'situacion':
+            if s.clave in est['por_estado']:
+                est['por_estado'][s.clave] = s.n
+        elif s.dimension == 'responsable':
+            if s.n > 0:
+                est['por_responsable'][s.clave] = s.n
+        elif s.dimension == 'centro':
+            if s.n > 0:
+                est['por_centro'][s.clave] = s.n
+        elif s.dimension == 'plazo':
+            est[s.clave] = s.n
+    return out
+
+
+@app.cli.command("reconciliar-stats")
+def reconciliar_stats_command():
+    """Recalcula project_stats de todos los proyectos (programar cada noche: flask --app app reconciliar-stats)."""
+    ids = [pid for (pid,) in db.session.query(Project.id).order_by(Project.id.asc()).all()]
+    for pid in ids:
+        recalcular_project_stats(pid)
+    print(f"✅ project_stats reconciliado para {len(ids)} proyecto(s)")
+
+
+def _consulta_avance_empresa(empresa_id):
+    # project_stats en el ON del LEFT JOIN: los proyectos sin materializar salen con n_total NULL
+    return (
+        db.session.query(
+            Project.id,
+            Project.empresa_id,
+            Project.nombre,
+            Project.terminado,
+            func.sum(case((ProjectStat.dimension == 'total', ProjectStat.n), else_=None)),
+            func.sum(case((ProjectStat.clave == 'Completada', ProjectStat.n), else_=0)),
+            func.sum(case((ProjectStat.clave == 'Validada', ProjectStat.n), else_=0)),
+        )
+        .outerjoin(ProjectStat, and_(
+            ProjectStat.proyecto_id == Project.id,
+            or_(
+                ProjectStat.dimension == 'total',
+                and_(ProjectStat.dimension == 'situacion', ProjectStat.clave.in_(('Completada', 'Validada'))),
+            ),
+        ))
+        .filter(Project.empresa_id == int(empresa_id))
+        .group_by(Project.id, Project.empresa_id, Project.nombre, Project.terminado)
+        .order_by(Project.nombre.asc())
+        .all()
+    )
 
-    if estado and estado != 'Todos':
-        tareas_filtradas = [t for t in tareas_filtradas if t.get('situacion') == estado]
 
-    if objetivo_id is not None and objetivo_id != 'Todos' and objetivos_map:
-        try:
-            oid = int(objetivo_id)
-            obj = objetivos_map.get(oid)
-            if obj:
-                centros = obj.get('centros') or []
-                if centros:
-                    tareas_filtradas = [t for t in tareas_filtradas if (t.get('centro_responsabilidad') or '') in centros]
-        except Exception:
-            pass
+def avance_proyectos_empresa(empresa_id: int):
+    """
+    Total y Completada/Validada de cada proyecto de la empresa, leídos de project_stats en una
+    sola consulta agrupada (O(proyectos), sin recorrer tareas). Los proyectos aún sin
+    materializar se calculan una vez y se repite la consulta.
+    """
+    filas = _consulta_avance_empresa(empresa_id)
+    pendientes = [f[0] for f in filas if f[4] is None]
+    if pendientes:
+        asegurar_project_stats(pendientes)
+        filas = _consulta_avance_empresa(empresa_id)
 
-    if plazo and plazo != 'Todos':
-        if plazo == 'vencidas':
-            tmp = []
-            for t in tareas_filtradas:
-                if t.get('plazo'):
-                    try:
-                        if datetime.strptime(t.get('plazo'), '%Y-%m-%d').date() < hoy:
-                            tmp.append(t)
-                    except Exception:
-                        pass
-            tareas_filtradas = tmp
+    avances = []
+    for pid, eid, nombre, terminado, total, comp, val in filas:
+        total = int(total or 0)
+        comp = int(comp or 0)
+        val = int(val or 0)
+        avances.append({
+            "proyecto": {"id": pid, "empresa_id": eid, "nombre": nombre, "terminado": terminado},
+            "total": total,
+            "completadas": comp,
+            "validadas": val,
+            "avance_pct": round(((comp + val) / total) * 100, 1) if total else 0
+        })
+    return avances
 
-        elif plazo == 'por_vencer':
-            tmp = []
-            for t in tareas_filtradas:
-                if t.get('plazo'):
-                    try:
-                        if datetime.strptime(t.get('plazo'), '%Y-%m-%d').date() >= hoy:
-                            tmp.append(t)
-                    except Exception:
-                        pass
-            tareas_filtradas = tmp
 
-        elif plazo == 'sin_plazo':
-            tareas_filtradas = [t for t in tareas_filtradas if not t.get('plazo')]
+SA_RESUMEN_ORDEN = ("nombre", "proyectos", "usuarios", "tareas")
+SA_RESUMEN_POR_PAGINA = 50
 
-    return tareas_filtradas
 
+def _consulta_resumen_empresas(orden, desc, page, per_page):
+    proys = (
+        db.session.query(Project.empresa_id.label("empresa_id"), func.count(Project.id).label("n"))
+        .group_by(Project.empresa_id)
+        .subquery()
+    )
+    users = (
+        db.session.query(User.empresa_id.label("empresa_id"), func.count(User.id).label("n"))
+        .filter(User.empresa_id.isnot(None))
+        .group_by(User.empresa_id)
+        .subquery()
+    )
+    tareas = (
+        db.session.query(
+            Project.empresa_id.label("empresa_id"),
+            func.sum(ProjectStat.n).label("n"),
+            func.count(ProjectStat.id).label("materializados"),
+        )
+        .join(ProjectStat, ProjectStat.proyecto_id == Project.id)
+        .filter(ProjectStat.dimension == 'total')
+        .group_by(Project.empresa_id)
+        .subquery()
+    )
 
-KPI_AUTO_TIPOS = [
-    'avance_completadas_pct',
-    'avance_validadas_pct',
-    'tareas_vencidas',
-    'tareas_total',
-]
+    n_proys = func.coalesce(proys.c.n, 0)
+    n_users = func.coalesce(users.c.n, 0)
+    n_tareas = func.coalesce(tareas.c.n, 0)
+    columnas = {"nombre": Company.nombre, "proyectos": n_proys, "usuarios": n_users, "tareas": n_tareas}
+    col = columnas[orden]
+
+    q = (
+        db.session.query(
+            Company.id,
+            Company.nombre,
+            n_proys,
+            n_users,
+            n_tareas,
+            func.coalesce(tareas.c.materializados, 0),
+            func.count(Company.id).over(),
+        )
+        .outerjoin(proys, proys.c.empresa_id == Company.id)
+        .outerjoin(users, users.c.empresa_id == Company.id)
+        .outerjoin(tareas, tareas.c.empresa_id == Company.id)
+        .order_by(col.desc() if desc else col.asc(), Company.id.asc())
+    )
+    if per_page:
+        q = q.limit(per_page).offset((page - 1) * per_page)
+    return q.all()
 
 
-def objective_to_dict(o: Objective):
+def resumen_empresas(orden="nombre", desc=False, page=1, per_page=None):
+    """
+    Resumen del superadmin (proyectos, usuarios y tareas por empresa) en una sola consulta
+    con subconsultas agrupadas. Devuelve (filas de la página, total de empresas).
+    """
+    filas = _consulta_resumen_empresas(orden, desc, page, per_page)
+
+    # Empresas con proyectos aún sin materializar en project_stats: se calculan y se repite la consulta
+    pendientes = [f[0] for f in filas if f[5] < f[2]]
+    if pendientes:
+        ids = db.session.query(Project.id).filter(Project.empresa_id.in_(pendientes)).all()
+        asegurar_project_stats(pid for (pid,) in ids)
+        filas = _consulta_resumen_empresas(orden, desc, page, per_page)
+
+    resumen = [
+        {
+            "empresa": {"id": eid, "nombre": nombre},
+            "n_proyectos": int(n_proys),
+            "n_usuarios": int(n_users),
+            "n_tareas": int(n_tareas)
+        }
+        for eid, nombre, n_proys, n_users, n_tareas, _, _ in filas
+    ]
+    total = filas[0][6] if filas else Company.query.count()
+    return resumen, total
+
+
+# ================= FACETAS (filtros del tablero) =================
+_facetas_cache = {}  # proyecto_id -> (expira_en, facetas)
+_facetas_lock = threading.Lock()
+
+
+def _contar_distintos(proyecto_id: int, columna):
+    filas = (
+        db.session.query(columna, func.count(Task.id))
+        .filter(Task.proyecto_id == int(proyecto_id), columna != '')
+        .group_by(columna)
+        .order_by(columna.asc())
+        .all()
+    )
+    return [{"valor": v, "n": n} for v, n in filas if v]
+
+
+def facetas_proyecto(proyecto_id: int):
+    """
+    Valores distintos (con su número de tareas) de responsable y centro de un proyecto,
+    con GROUP BY sobre (proyecto_id, columna). Se cachea por proyecto durante FACETAS_TTL
+    segundos y se invalida al escribir tareas.
+    """
+    pid = int(proyecto_id)
+    ahora = time.monotonic()
+    with _facetas_lock:
+        hit = _facetas_cache.get(pid)
+    if hit and hit[0] > ahora:
+        return hit[1]
+
+    facetas = {
+        "responsables": _contar_distintos(pid, Task.responsable),
+        "centros": _contar_distintos(pid, Task.centro_responsabilidad),
+    }
+    with _facetas_lock:
+        _facetas_cache[pid] = (ahora + FACETAS_TTL, facetas)
+    return facetas
+
+
+def invalidar_facetas(*proyecto_ids):
+    with _facetas_lock:
+        for pid in proyecto_ids:
+            _facetas_cache.pop(int(pid), None)
+
+
+@suscribir("task.created", "task.updated", en_todos=True)
+def _facetas_al_cambiar(evento, datos):
+    campos = datos.get("campos")
+    if campos is not None and not {"responsable", "centro_responsabilidad"} & set(campos):
+        return
+    invalidar_facetas(datos["proyecto_id"])
+
+
+# ================= TABLERO EN VIVO (SSE) =================
+_tablero_versiones = Counter()
+_tablero_cond = threading.Condition()
+_sse_lock = threading.Lock()
+_sse_activos = 0
+
+
+def _tomar_cupo_sse():
+    """Reserva un cupo de stream en este proceso; False si ya hay SSE_MAX_STREAMS abiertos."""
+    global _sse_activos
+    with _sse_lock:
+        if _sse_activos >= SSE_MAX_STREAMS:
+            return False
+        _sse_activos += 1
+        return True
+
+
+def _soltar_cupo_sse():
+    global _sse_activos
+    with _sse_lock:
+        _sse_activos -= 1
+
+
+def notificar_tablero(proyecto_id):
+    """Despierta los streams del tablero de este proceso tras confirmar cambios en tareas."""
+    with _tablero_cond:
+        _tablero_versiones[int(proyecto_id)] += 1
+        _tablero_cond.notify_all()
+
+
+@suscribir(*EVENTOS_TAREA, en_todos=True)
+def _tablero_al_cambiar(evento, datos):
+    notificar_tablero(datos["proyecto_id"])
+
+
+def _esperar_tablero(proyecto_id, version, timeout):
+    """Espera un aviso para el proyecto (o el timeout); devuelve la versión vista."""
+    with _tablero_cond:
+        _tablero_cond.wait_for(lambda: _tablero_versiones[proyecto_id] != version, timeout)
+        return _tablero_versiones[proyecto_id]
+
+
+def _evento_sse(evento, datos):
+    return f"event: {evento}\ndata: {json.dumps(datos, default=str)}\n\n"
+
+
+def estado_tablero(proyecto_id, criterios, filtrado, objetivos_map):
+    """Contadores del tablero: totales desde project_stats y, si hay filtros, GROUP BY sobre el filtro."""
+    totales = estadisticas_proyectos([proyecto_id])[proyecto_id]
     return {
-        'id': o.id,
-        'empresa_id': o.empresa_id,
-        'proyecto_id': o.proyecto_id,
-        'nombre': o.nombre,
-        'descripcion': o.descripcion or '',
-        'centros': o.centros or [],
-        'responsable': o.responsable or '',
-        'estado': o.estado or 'Activo',
-        'fecha_inicio': o.fecha_inicio or '',
-        'fecha_fin': o.fecha_fin or ''
+        "estadisticas": obtener_estadisticas_db(*criterios) if filtrado else totales,
+        "estadisticas_totales": totales,
+        "kpis": [{"id": k["id"], "actual": k["actual"]} for k in kpis_proyecto(proyecto_id, objetivos_map)],
     }
 
 
-def calcular_kpi_actual(k: KPI, proyecto_id: int, objetivos_map: dict):
-    modo = (k.modo or 'manual')
-    if modo == 'manual':
-        return k.actual_manual
+def stream_tablero(proyecto_id, filtros, reanudar=None):
+    """
+    Generador SSE del tablero. Tras cada aviso de notificar_tablero (o cada SSE_POLL_SEG,
+    para cambios hechos en otros workers) lee las tareas con updated_at posterior al último
+    corte y emite un evento 'tablero' con esas tareas y los contadores recalculados.
+    El corte retrocede CAMBIOS_MARGEN_SEG para no perder transacciones lentas; las
+    tareas ya enviadas con el mismo updated_at no se repiten. Cada evento lleva el corte
+    como id, y `reanudar` (el último id recibido) retoma desde ahí tras una reconexión.
+    """
+    pid = int(proyecto_id)
+    objetivos_map = {o.id: objective_to_dict(o) for o in Objective.query.filter_by(proyecto_id=pid).all()}
+    criterios = filtros_tareas_sql(pid, objetivos_map=objetivos_map, **filtros)
+    filtrado = any(v != 'Todos' for v in filtros.values())
+    margen = timedelta(seconds=CAMBIOS_MARGEN_SEG)
+
+    desde = datetime.utcnow() - margen
+    enviadas = {}
+    version = _tablero_versiones[pid]
+    fin = time.monotonic() + SSE_DURACION_SEG
+    db.session.close()
+
+    yield f"retry: {int(SSE_POLL_SEG * 1000)}\n\n"
+    if reanudar:
+        if reanudar < desde - timedelta(seconds=SSE_REANUDAR_MAX_SEG):
+            yield _evento_sse("tablero", {"recargar": True})
+            return
+        desde = min(desde, reanudar)
+    while time.monotonic() < fin:
+        version = _esperar_tablero(pid, version, SSE_POLL_SEG)
+        ahora = datetime.utcnow()
+
+        filas = (
+            Task.query
+            .filter(Task.proyecto_id == pid, Task.updated_at > desde)
+            .order_by(Task.updated_at.asc(), Task.id.asc())
+            .limit(SSE_MAX_TAREAS + 1)
+            .all()
+        )
+        nuevas = [t for t in filas if enviadas.get(t.id) != t.updated_at]
+        if not nuevas:
+            db.session.close()
+            yield ": ping\n\n"
+            continue
 
-    obj = objetivos_map.get(k.objetivo_id)
-    if not obj:
-        return None
+        recargar = len(filas) > SSE_MAX_TAREAS
+        ids = [t.id for t in nuevas]
+        visibles = {tid for (tid,) in db.session.query(Task.id).filter(*criterios, Task.id.in_(ids))}
+        datos = estado_tablero(pid, criterios, filtrado, objetivos_map)
+        datos["recargar"] = recargar
+        datos["tareas"] = [] if recargar else [
+            {**task_to_dict(t), "visible": t.id in visibles} for t in nuevas
+        ]
 
-    centros = obj.get('centros') or []
-    tq = Task.query.filter_by(proyecto_id=int(proyecto_id))
-    tareas = [task_to_dict(t) for t in tq.all()]
-    if centros:
-        tareas = [t for t in tareas if (t.get('centro_responsabilidad') or '') in centros]
+        for t in nuevas:
+            enviadas[t.id] = t.updated_at
+        desde = max(desde, ahora - margen)
+        enviadas = {tid: ts for tid, ts in enviadas.items() if ts > desde}
+        # Libera la conexión mientras se espera el siguiente aviso
+        db.session.close()
+        yield f"id: {desde.isoformat()}\n" + _evento_sse("tablero", datos)
 
-    total = len(tareas)
-    if k.auto_tipo == 'tareas_total':
-        return float(total)
 
-    hoy = datetime.now().date()
-    if k.auto_tipo == 'tareas_vencidas':
-        vencidas = 0
-        for t in tareas:
-            plazo_str = t.get('plazo')
-            if not plazo_str:
+# ================= IMPORTACIÓN MASIVA (CSV / Excel) =================
+IMPORT_COLUMNAS = ("texto", "responsable", "centro_responsabilidad", "plazo", "observacion", "recursos")
+IMPORT_ALIAS = {"tarea": "texto", "centro": "centro_responsabilidad"}
+IMPORT_LARGOS = {"texto": 500, "responsable": 200, "centro_responsabilidad": 200}
+IMPORT_LOTE = int(os.getenv("IMPORT_LOTE", "2000"))
+IMPORT_MAX_ERRORES = 1000
+
+
+def _columna_import(nombre):
+    n = unicodedata.normalize("NFKD", str(nombre or "")).encode("ascii", "ignore").decode()
+    n = n.strip().lower().replace(" ", "_")
+    return IMPORT_ALIAS.get(n, n)
+
+
+def _lineas_csv(stream):
+    """
+    Líneas de texto de un CSV binario. Cada línea se decodifica como UTF-8 y, si no lo es,
+    como Latin-1: un archivo con alguna línea en Latin-1 (típico de Excel) no falla a mitad.
+    """
+    for i, linea in enumerate(stream):
+        try:
+            texto = linea.decode("utf-8-sig" if i == 0 else "utf-8")
+        except UnicodeDecodeError:
+            texto = linea.decode("latin-1")
+        yield texto
+
+
+def _filas_csv(stream):
+    """Filas de un CSV (',' o ';', UTF-8 o Latin-1) como dicts, leyendo en streaming."""
+    texto = _lineas_csv(stream)
+    primera = next(texto, "")
+    delimitador = ";" if primera.count(";") > primera.count(",") else ","
+    reader = csv.reader(itertools.chain([primera], texto), delimiter=delimitador)
+    cabecera = [_columna_import(c) for c in next(reader, [])]
+    for fila in reader:
+        if not any((v or "").strip() for v in fila):
+            yield None
+            continue
+        yield dict(zip(cabecera, fila))
+
+
+def _filas_xlsx(stream):
+    """Filas de la primera hoja de un .xlsx como dicts (openpyxl en modo read_only)."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Para importar archivos .xlsx instala openpyxl (pip install openpyxl).")
+
+    wb = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        filas = wb.active.iter_rows(values_only=True)
+        cabecera = [_columna_import(c) for c in next(filas, ())]
+        for fila in filas:
+            if all(v is None or str(v).strip() == "" for v in fila):
+                yield None
                 continue
+            yield dict(zip(cabecera, fila))
+    finally:
+        wb.close()
+
+
+def _valor_import(v):
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        return v.date().isoformat()
+    if isinstance(v, date):
+        return v.isoformat()
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v).strip()
+
+
+def _validar_fila_import(p: Project, fila: dict):
+    """Devuelve (fila lista para insertar, None) o (None, mensaje de error)."""
+    valores = {c: _valor_import(fila.get(c)) for c in IMPORT_COLUMNAS}
+
+    if not valores["texto"]:
+        return None, "'texto' es obligatorio"
+    for campo, largo in IMPORT_LARGOS.items():
+        if len(valores[campo]) > largo:
+            return None, f"'{campo}' supera {largo} caracteres"
+
+    plazo = valores["plazo"]
+    if plazo:
+        fecha = parse_plazo(plazo)
+        if fecha is None:
             try:
-                plazo_date = datetime.strptime(plazo_str, '%Y-%m-%d').date()
-            except Exception:
-                continue
-            if t.get('situacion') in ('Completada', 'Validada'):
-                continue
-            if plazo_date < hoy:
-                vencidas += 1
-        return float(vencidas)
+                fecha = datetime.strptime(plazo, "%d/%m/%Y").date()
+            except ValueError:
+                return None, f"plazo inválido '{plazo[:20]}' (usa YYYY-MM-DD o DD/MM/YYYY)"
+        plazo = fecha.isoformat()
+
+    return fila_tarea(
+        p,
+        valores["texto"],
+        valores["responsable"],
+        valores["centro_responsabilidad"],
+        plazo,
+        valores["observacion"],
+        valores["recursos"],
+    ), None
+
+
+def importar_tareas(proyecto_id, filas):
+    """
+    Valida e inserta tareas desde un iterable de dicts, por lotes de IMPORT_LOTE filas
+    (executemany + commit por lote), sin cargar el archivo completo en memoria.
+    Las filas con error se omiten y se informan con su número (la fila 1 es la cabecera).
+    """
+    p = db.session.get(Project, int(proyecto_id))
+    if not p:
+        raise ValueError("Proyecto no existe")
 
-    if total <= 0:
-        return 0.0
+    lote, errores = [], []
+    insertadas = con_error = 0
+    for num, fila in enumerate(filas, start=2):
+        if fila is None:
+            continue
+        datos, error = _validar_fila_import(p, fila)
+        if error:
+            con_error += 1
+            if len(errores) < IMPORT_MAX_ERRORES:
+                errores.append({"fila": num, "error": error})
+            continue
+        lote.append(datos)
+        if len(lote) >= IMPORT_LOTE:
+            insertar_tareas_lote(p.id, lote, devolver=False)
+            insertadas += len(lote)
+            lote = []
 
-    if k.auto_tipo == 'avance_completadas_pct':
-        return 100.0 * sum(1 for t in tareas if t.get('situacion') == 'Completada') / total
-    if k.auto_tipo == 'avance_validadas_pct':
-        return 100.0 * sum(1 for t in tareas if t.get('situacion') == 'Validada') / total
+    if lote:
+        insertar_tareas_lote(p.id, lote, devolver=False)
+        insertadas += len(lote)
 
-    return None
+    return {"insertadas": insertadas, "con_error": con_error, "errores": errores}
 
 
-def kpi_to_dict(k: KPI, proyecto_id: int, objetivos_map: dict):
-    actual = calcular_kpi_actual(k, proyecto_id, objetivos_map)
-    estado_kpi = 'sin_meta'
-    if k.meta is not None and actual is not None:
-        estado_kpi = 'ok' if actual >= k.meta else 'bajo'
-    return {
-        'id': k.id,
-        'objetivo_id': k.objetivo_id,
-        'nombre': k.nombre,
-        'unidad': k.unidad or '',
-        'meta': k.meta,
-        'modo': k.modo or 'manual',
-        'auto_tipo': k.auto_tipo,
-        'actual_manual': k.actual_manual,
-        'actual': actual,
-        'estado_kpi': estado_kpi,
-    }
+def _errores_lectura_import():
+    """Excepciones de un archivo ilegible (CSV mal formado, .xlsx dañado)."""
+    errores = (csv.Error, zipfile.BadZipFile)
+    try:
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        return errores
+    return errores + (InvalidFileException,)
+
+
+def importar_archivo(proyecto_id, archivo):
+    """
+    Importa un FileStorage .csv o .xlsx; ValueError si el formato no es soportado o el
+    archivo no se puede leer. Como las filas se confirman por lotes, antes se recorre el
+    archivo completo sin insertar: un archivo dañado falla sin haber creado ninguna tarea.
+    """
+    nombre = (archivo.filename or "").lower()
+    if nombre.endswith(".csv"):
+        leer = _filas_csv
+    elif nombre.endswith(".xlsx"):
+        leer = _filas_xlsx
+    else:
+        raise ValueError("Formato no soportado: sube un archivo .csv o .xlsx")
+
+    try:
+        for _ in leer(archivo.stream):
+            pass
+        archivo.stream.seek(0)
+        return importar_tareas(proyecto_id, leer(archivo.stream))
+    except _errores_lectura_import() as ex:
+        db.session.rollback()
+        raise ValueError(f"No se pudo leer el archivo: {ex}")
+
+
+# ================= EXPORTACIÓN (CSV / Excel en streaming) =================
+EXPORT_COLUMNAS = ("id",) + IMPORT_COLUMNAS[:1] + ("situacion",) + IMPORT_COLUMNAS[1:]
+EXPORT_LOTE = int(os.getenv("EXPORT_LOTE", "1000"))
+_XML_INVALIDOS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+# Excel/LibreOffice evalúan como fórmula el texto que empieza así (inyección de fórmulas):
+# esas celdas salen con un apóstrofo delante y se muestran como texto
+_INICIO_FORMULA = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _celda_export(v):
+    if v is None:
+        return ""
+    if isinstance(v, str) and v.startswith(_INICIO_FORMULA):
+        return "'" + v
+    return v
+
+
+def _filas_export(criterios):
+    """
+    Tuplas (EXPORT_COLUMNAS) de las tareas filtradas, leídas con cursor en servidor y con
+    los textos que parecen fórmulas neutralizados.
+    """
+    columnas = [getattr(Task, c) for c in EXPORT_COLUMNAS]
+    q = (
+        db.session.query(*columnas)
+        .filter(*criterios)
+        .order_by(Task.id.asc())
+        .execution_options(yield_per=EXPORT_LOTE)
+    )
+    for fila in q:
+        yield tuple(_celda_export(v) for v in fila)
+
+
+def exportar_csv(criterios):
+    """Genera el CSV por trozos (BOM UTF-8 + ';' para que Excel lo abra tal cual)."""
+    buf = io.StringIO()
+    w = csv.writer(buf, delimiter=";")
+    w.writerow(EXPORT_COLUMNAS)
+    yield "\ufeff" + buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+
+    for i, fila in enumerate(_filas_export(criterios), start=1):
+        w.writerow(fila)
+        if i % EXPORT_LOTE == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+class _SalidaZip:
+    """Destino no buscable para zipfile: acumula los bytes hasta que el generador los entrega."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, b):
+        self.partes.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b"".join(self.partes)
+        self.partes = []
+        return datos
+
+
+_XLSX_PARTES = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Tareas" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _celda_xlsx(v):
+    if isinstance(v, int):
+        return f"<c><v>{v}</v></c>"
+    t = html.escape(_XML_INVALIDOS.sub("", str(v)), quote=False)
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{t}</t></is></c>'
+
+
+def _fila_xlsx(fila):
+    return "<row>" + "".join(_celda_xlsx(v) for v in fila) + "</row>"
+
+
+def exportar_xlsx(criterios):
+    """
+    Genera un .xlsx mínimo (una hoja, celdas inlineStr) escribiendo el zip sobre la marcha,
+    así la descarga empieza con la primera página de filas y la memoria no crece con el proyecto.
+    """
+    salida = _SalidaZip()
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as zf:
+        for nombre, contenido in _XLSX_PARTES.items():
+            zf.writestr(nombre, contenido)
+        yield salida.vaciar()
+
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as hoja:
+            hoja.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _fila_xlsx(EXPORT_COLUMNAS)
+            ).encode("utf-8"))
+            partes = []
+            for i, fila in enumerate(_filas_export(criterios), start=1):
+                partes.append(_fila_xlsx(fila))
+                if i % EXPORT_LOTE == 0:
+                    hoja.write("".join(partes).encode("utf-8"))
+                    partes = []
+                    yield salida.vaciar()
+            hoja.write(("".join(partes) + "</sheetData></worksheet>").encode("utf-8"))
+    yield salida.vaciar()
 
 
 # ================= SEED/RESET SUPERADMIN =================
@@ -790,6 +3539,7 @@ def login():
             return render_template("login.html"), 200
 
         session.clear()
+        g.pop("current_user", None)
         session["user_id"] = u.id
         session["nombre"] = u.nombre or u.correo or "Usuario"
         session["rol"] = u.rol
@@ -807,6 +3557,7 @@ def login():
 @app.route("/logout")
 def logout():
     session.clear()
+    g.pop("current_user", None)
     return redirect(url_for("login"))
 
 
@@ -833,19 +3584,29 @@ def root():
 @login_required
 @require_roles("superadmin")
 def sa_dashboard():
-    empresas = Company.query.order_by(Company.nombre.asc()).all()
-    resumen = []
-
-    for e in empresas:
-        n_proys = Project.query.filter_by(empresa_id=e.id).count()
-        n_users = User.query.filter_by(empresa_id=e.id).count()
-        resumen.append({
-            "empresa": {"id": e.id, "nombre": e.nombre},
-            "n_proyectos": n_proys,
-            "n_usuarios": n_users
-        })
+    orden = request.args.get("orden", "nombre")
+    if orden not in SA_RESUMEN_ORDEN:
+        orden = "nombre"
+    desc = request.args.get("dir") == "desc"
+    # per_page=0 muestra todas las empresas en una sola página
+    per_page = request.args.get("per_page", SA_RESUMEN_POR_PAGINA, type=int)
+    if per_page is None or per_page < 0:
+        per_page = SA_RESUMEN_POR_PAGINA
+    page = max(request.args.get("page", 1, type=int) or 1, 1)
+
+    resumen, total = resumen_empresas(orden=orden, desc=desc, page=page, per_page=per_page)
+    paginas = max((total + per_page - 1) // per_page, 1) if per_page else 1
 
-    return render_template("admin_dashboard.html", resumen=resumen)
+    return render_template(
+        "admin_dashboard.html",
+        resumen=resumen,
+        orden=orden,
+        dir="desc" if desc else "asc",
+        page=page,
+        per_page=per_page,
+        paginas=paginas,
+        total_empresas=total
+    )
 
 
 # Rutas faltantes que algunos templates antiguos usan
@@ -870,6 +3631,30 @@ def sa_proyectos():
     return redirect(url_for("sa_config"))
 
 
+@app.route("/sa/metricas/http")
+@login_required
+@require_roles("superadmin")
+def sa_metricas_http():
+    """Latencias, status y estado del circuito por proveedor externo (este proceso)."""
+    return jsonify(http_saliente.metricas())
+
+
+@app.route("/sa/metricas/adjuntos")
+@login_required
+@require_roles("superadmin")
+def sa_metricas_adjuntos():
+    """Almacenamiento de adjuntos por proyecto y lo que ahorra guardar cada contenido una vez."""
+    por_proyecto = uso_adjuntos()
+    nombres = dict(db.session.query(Project.id, Project.nombre).filter(Project.id.in_(list(por_proyecto))))
+    referenciado = sum(u["bytes"] for u in por_proyecto.values())
+    en_disco = db.session.query(func.coalesce(func.sum(Blob.tamano), 0)).filter(Blob.referencias > 0).scalar()
+    return jsonify({
+        "proyectos": [{"id": pid, "nombre": nombres.get(pid), **u} for pid, u in sorted(por_proyecto.items())],
+        "bytes_referenciados": referenciado,
+        "bytes_almacen": int(en_disco),
+    })
+
+
 @app.route("/sa/empresa/nueva", methods=["GET", "POST"])
 @login_required
 @require_roles("superadmin")
@@ -1039,20 +3824,36 @@ def sa_empresa_editar(empresa_id):
 @login_required
 @require_roles("superadmin")
 def sa_empresa_eliminar(empresa_id):
+    if eventos_calendario_borrables(db.session.get(Company, empresa_id)).first():
+        # Los eventos se borran del proveedor antes que la empresa (después ya no habría tokens)
+        j = encolar_job("empresa.eliminar", {"empresa_id": empresa_id}, usuario_id=current_user().get("id"))
+        return redirect(url_for("job_estado", job_id=j.id))
+
+    eliminar_empresa(empresa_id)
+    flash("Empresa eliminada (con proyectos, usuarios y tareas asociadas).", "ok")
+    return redirect(url_for("sa_config"))
+
+
+def eliminar_empresa(empresa_id):
+    """Elimina la empresa con sus proyectos, tareas, adjuntos, usuarios y trabajos."""
     proys = Project.query.filter_by(empresa_id=empresa_id).all()
     proy_ids = [p.id for p in proys]
 
+    CalendarEvent.query.filter_by(empresa_id=empresa_id).delete(synchronize_session=False)
+    ChunkedUpload.query.filter_by(empresa_id=empresa_id).delete(synchronize_session=False)
     if proy_ids:
+        borrar_adjuntos(Attachment.proyecto_id.in_(proy_ids))
         Task.query.filter(Task.proyecto_id.in_(proy_ids)).delete(synchronize_session=False)
+        ProjectStat.query.filter(ProjectStat.proyecto_id.in_(proy_ids)).delete(synchronize_session=False)
 
+    usuarios = db.session.query(User.id).filter_by(empresa_id=empresa_id)
+    Job.query.filter(or_(Job.empresa_id == empresa_id, Job.usuario_id.in_(usuarios))).delete(synchronize_session=False)
     User.query.filter_by(empresa_id=empresa_id).delete(synchronize_session=False)
     Project.query.filter_by(empresa_id=empresa_id).delete(synchronize_session=False)
     Company.query.filter_by(id=empresa_id).delete(synchronize_session=False)
 
     db.session.commit()
-
-    flash("Empresa eliminada (con proyectos, usuarios y tareas asociadas).", "ok")
-    return redirect(url_for("sa_config"))
+    invalidar_facetas(*proy_ids)
 
 
 @app.route("/sa/proyecto/nuevo-simple", methods=["POST"])
@@ -1141,9 +3942,16 @@ def sa_proyecto_eliminar_post(proyecto_id):
 
     empresa_id = p.empresa_id
 
+    tareas = db.session.query(Task.id).filter_by(proyecto_id=proyecto_id)
+    encolar_borrado_eventos(db.session.get(Company, empresa_id), CalendarEvent.tarea_id.in_(tareas))
+    CalendarEvent.query.filter(CalendarEvent.tarea_id.in_(tareas)).delete(synchronize_session=False)
+    borrar_adjuntos(Attachment.proyecto_id == proyecto_id)
+    ChunkedUpload.query.filter_by(proyecto_id=proyecto_id).delete(synchronize_session=False)
     Task.query.filter_by(proyecto_id=proyecto_id).delete(synchronize_session=False)
+    ProjectStat.query.filter_by(proyecto_id=proyecto_id).delete(synchronize_session=False)
     Project.query.filter_by(id=proyecto_id).delete(synchronize_session=False)
     db.session.commit()
+    invalidar_facetas(proyecto_id)
 
     flash("Proyecto eliminado (y tareas asociadas).", "ok")
     return redirect(url_for("sa_config", empresa_id=empresa_id))
@@ -1272,6 +4080,9 @@ def sa_usuario_eliminar_post(user_id):
     if not u:
         abort(404)
 
+    Job.query.filter_by(usuario_id=user_id).update({"usuario_id": None}, synchronize_session=False)
+    ChunkedUpload.query.filter_by(usuario_id=user_id).update({"usuario_id": None}, synchronize_session=False)
+    Attachment.query.filter_by(usuario_id=user_id).update({"usuario_id": None}, synchronize_session=False)
     User.query.filter_by(id=user_id).delete(synchronize_session=False)
     db.session.commit()
 
@@ -1288,28 +4099,21 @@ def empresa_dashboard():
     u = current_user()
     empresa = db.session.get(Company, int(u.get("empresa_id")))
 
-    proys = Project.query.filter_by(
-        empresa_id=int(u.get("empresa_id"))
-    ).order_by(Project.nombre.asc()).all()
-
-    avances = []
-    for p in proys:
-        tareas, _ = load_tareas(p.id)
-        est = obtener_estadisticas(tareas)
-        total = est["total"]
-        comp = est["por_estado"].get("Completada", 0)
-        val = est["por_estado"].get("Validada", 0)
-        avance = round(((comp + val) / total) * 100, 1) if total else 0
-        avances.append({
-            "proyecto": project_to_dict(p),
-            "estadisticas": est,
-            "avance_pct": avance
-        })
+    avances = avance_proyectos_empresa(int(u.get("empresa_id")))
 
     empresa_out = {"id": empresa.id, "nombre": empresa.nombre} if empresa else None
     return render_template("empresa_dashboard.html", empresa=empresa_out, avances=avances, user=u)
 
 
+@app.route("/empresa/avance")
+@login_required
+@require_roles("supervisor", "ejecutor")
+@no_cache
+def empresa_avance():
+    u = current_user()
+    return jsonify({"proyectos": avance_proyectos_empresa(int(u.get("empresa_id")))})
+
+
 @app.route("/empresa/ir/<int:proyecto_id>")
 @login_required
 @require_roles("supervisor", "ejecutor")
@@ -1339,6 +4143,9 @@ def empresa_calendario():
         prov = (request.form.get("calendar_provider") or "none").strip().lower()
         if prov not in ("none", "google", "microsoft"):
             prov = "none"
+        if prov != empresa.calendar_provider:
+            # Otro calendario: la próxima sincronización vuelve a enviar todas las tareas
+            empresa.calendar_sync_cursores = None
         empresa.calendar_provider = prov
         cid = (request.form.get("oauth_client_id") or "").strip()
         csec = (request.form.get("oauth_client_secret") or "").strip()
@@ -1380,10 +4187,89 @@ def empresa_calendario_desconectar():
         abort(403)
     _clear_calendar_tokens(empresa)
     db.session.commit()
+    tokens_calendario.invalidar(empresa.id)
     flash("Conexión con el calendario cerrada (tokens eliminados en el ERP).", "ok")
     return redirect(url_for("empresa_calendario"))
 
 
+CALENDARIO_NOMBRES = {"google": "Google Calendar", "microsoft": "Microsoft 365 / Outlook"}
+
+
+def _encolar_token_calendario(u, empresa, provider, code):
+    """El canje del código por tokens va a la cola: el callback responde al instante."""
+    j = encolar_job(
+        "calendario.token",
+        {
+            "empresa_id": empresa.id,
+            "provider": provider,
+            "code": code,
+            "redirect_uri": calendar_callback_urls()[provider],
+        },
+        empresa_id=empresa.id,
+        usuario_id=u.get("id"),
+    )
+    return redirect(url_for("job_estado", job_id=j.id))
+
+
+def _token_url_calendario(empresa, provider):
+    if provider == "microsoft":
+        tenant = (empresa.calendar_microsoft_tenant or "common").strip() or "common"
+        return f"{MS_LOGIN_URL}/{tenant}/oauth2/v2.0/token"
+    return GOOGLE_TOKEN_URL
+
+
+def _pedir_tokens_calendario(empresa, provider, datos):
+    """
+    POST al endpoint de tokens del proveedor y guarda el resultado en la empresa.
+    Errores de red o 5xx se propagan (reintentables); una respuesta 4xx (código usado
+    o vencido, refresh token revocado) lanza JobFallido.
+    """
+    datos = {
+        "client_id": (empresa.calendar_oauth_client_id or "").strip(),
+        "client_secret": (empresa.calendar_oauth_client_secret or "").strip(),
+        **datos,
+    }
+    if provider == "microsoft":
+        datos["scope"] = MS_SCOPES
+
+    r = http_saliente.post(clave_http_calendario(empresa), _token_url_calendario(empresa, provider), data=datos)
+    if r.status_code >= 500:
+        raise RuntimeError(f"{CALENDARIO_NOMBRES[provider]} respondió {r.status_code}")
+    try:
+        data = r.json()
+    except ValueError:
+        data = {}
+    if r.status_code != 200 or "access_token" not in data:
+        msg = data.get("error_description") or data.get("error") or (r.text or "")[:200]
+        raise JobFallido(f"No se pudo obtener el token: {msg}")
+
+    empresa.calendar_access_token = data.get("access_token")
+    empresa.calendar_refresh_token = data.get("refresh_token") or empresa.calendar_refresh_token
+    exp = data.get("expires_in")
+    if exp:
+        empresa.calendar_token_expires_at = datetime.utcnow() + timedelta(seconds=int(exp))
+    db.session.commit()
+    tokens_calendario.guardar(empresa.id, empresa.calendar_access_token, empresa.calendar_token_expires_at)
+    return empresa.calendar_access_token
+
+
+@job("calendario.token", "Conexión del calendario", volver="empresa_calendario")
+def job_token_calendario(payload):
+    empresa = db.session.get(Company, int(payload["empresa_id"]))
+    if not empresa:
+        raise JobFallido("La empresa ya no existe.")
+
+    provider = payload["provider"]
+    _pedir_tokens_calendario(empresa, provider, {
+        "code": payload["code"],
+        "redirect_uri": payload["redirect_uri"],
+        "grant_type": "authorization_code",
+    })
+    return {
+        "mensaje": f"{CALENDARIO_NOMBRES[provider]} conectado. Siguiente paso: sincronizar eventos desde las tareas.",
+    }
+
+
 @app.route("/oauth/google/iniciar")
 @login_required
 @require_roles("supervisor")
@@ -1441,40 +4327,10 @@ def oauth_google_callback():
 
     empresa = _company_for_calendar_user(u)
     if not empresa or empresa.id != cal.get("company_id"):
-        flash("La sesión no coincide con la empresa.", "error")
-        return redirect(url_for("empresa_calendario"))
-
-    redirect_uri = calendar_callback_urls()["google"]
-    try:
-        r = requests.post(
-            GOOGLE_TOKEN_URL,
-            data={
-                "code": code,
-                "client_id": (empresa.calendar_oauth_client_id or "").strip(),
-                "client_secret": (empresa.calendar_oauth_client_secret or "").strip(),
-                "redirect_uri": redirect_uri,
-                "grant_type": "authorization_code",
-            },
-            timeout=45,
-        )
-        data = r.json()
-    except Exception as ex:
-        flash(f"Error al contactar Google: {ex}", "error")
-        return redirect(url_for("empresa_calendario"))
-
-    if r.status_code != 200 or "access_token" not in data:
-        msg = data.get("error_description") or data.get("error") or (r.text or "")[:200]
-        flash(f"No se pudo obtener el token: {msg}", "error")
-        return redirect(url_for("empresa_calendario"))
-
-    empresa.calendar_access_token = data.get("access_token")
-    empresa.calendar_refresh_token = data.get("refresh_token") or empresa.calendar_refresh_token
-    exp = data.get("expires_in")
-    if exp:
-        empresa.calendar_token_expires_at = datetime.utcnow() + timedelta(seconds=int(exp))
-    db.session.commit()
-    flash("Google Calendar conectado. Siguiente paso: sincronizar eventos desde las tareas.", "ok")
-    return redirect(url_for("empresa_calendario"))
+        flash("La sesión no coincide con la empresa.", "error")
+        return redirect(url_for("empresa_calendario"))
+
+    return _encolar_token_calendario(u, empresa, "google", code)
 
 
 @app.route("/oauth/microsoft/iniciar")
@@ -1502,7 +4358,7 @@ def oauth_microsoft_iniciar():
         "company_id": empresa.id,
         "provider": "microsoft",
     }
-    auth_base = f"https://login.microsoftonline.com/{tenant}/oauth2/v2.0/authorize"
+    auth_base = f"{MS_LOGIN_URL}/{tenant}/oauth2/v2.0/authorize"
     q = {
         "client_id": empresa.calendar_oauth_client_id.strip(),
         "response_type": "code",
@@ -1540,40 +4396,587 @@ def oauth_microsoft_callback():
         flash("La sesión no coincide con la empresa.", "error")
         return redirect(url_for("empresa_calendario"))
 
-    tenant = (empresa.calendar_microsoft_tenant or "common").strip() or "common"
-    token_url = f"https://login.microsoftonline.com/{tenant}/oauth2/v2.0/token"
-    redirect_uri = calendar_callback_urls()["microsoft"]
-    try:
-        r = requests.post(
-            token_url,
-            data={
-                "client_id": (empresa.calendar_oauth_client_id or "").strip(),
-                "client_secret": (empresa.calendar_oauth_client_secret or "").strip(),
-                "code": code,
-                "redirect_uri": redirect_uri,
-                "grant_type": "authorization_code",
-                "scope": MS_SCOPES,
-            },
-            timeout=45,
+    return _encolar_token_calendario(u, empresa, "microsoft", code)
+
+
+# ================= CALENDARIO: sincronización de plazos =================
+CALENDARIO_SYNC_PAGINA = 200
+CALENDARIO_REINTENTAR = "reintentar"  # clave en calendar_sync_cursores: tareas que el proveedor rechazó
+CALENDARIO_POSTERGAR_MAX_SEG = int(os.getenv("CALENDARIO_POSTERGAR_MAX_SEG", "60"))
+CALENDARIO_LOTE = {"google": 50, "microsoft": 20}  # máximos de Google batch y Graph $batch
+
+
+class TokensCalendario:
+    """
+    Caché en memoria (por proceso) de los access tokens de calendario de cada empresa.
+    - Con más de `anticipo` segundos de vida se devuelve el token cacheado sin tocar la BD.
+    - Entre `margen` y `anticipo` se devuelve el cacheado y se renueva en segundo plano.
+    - Con menos de `margen` (o forzar=True) se renueva en línea.
+    Las renovaciones de una empresa son single-flight: un solo hilo llama al proveedor y
+    los demás esperan su resultado. Antes de renovar se relee la BD por si otro worker ya
+    lo hizo; el resultado se persiste en Company.
+    Quien ya tiene la fila de Company pasa `guardado` (token y vencimiento en la BD): si no
+    coincide con el cacheado (reconexión a otra cuenta, desconexión o renovación en otro
+    proceso) manda la BD.
+    """
+
+    def __init__(self, anticipo=300, margen=60):
+        self.anticipo = timedelta(seconds=anticipo)
+        self.margen = timedelta(seconds=margen)
+        self._cache = {}  # empresa_id -> (token, vence o None)
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _lock_empresa(self, empresa_id):
+        with self._lock:
+            return self._locks.setdefault(empresa_id, threading.Lock())
+
+    def guardar(self, empresa_id, token, vence):
+        with self._lock:
+            self._cache[int(empresa_id)] = (token, vence)
+
+    def invalidar(self, empresa_id):
+        with self._lock:
+            self._cache.pop(int(empresa_id), None)
+
+    def _restante(self, vence):
+        return timedelta.max if vence is None else vence - datetime.utcnow()
+
+    def obtener(self, empresa_id, forzar=False, guardado=None):
+        eid = int(empresa_id)
+        if guardado is not None:
+            token_bd, vence_bd = guardado
+            if self._cache.get(eid, (None, None))[0] != token_bd:
+                if token_bd:
+                    self.guardar(eid, token_bd, vence_bd)
+                else:
+                    self.invalidar(eid)
+        elif eid not in self._cache and not forzar:
+            self._cargar(eid)
+        token, vence = self._cache.get(eid, (None, None))
+        if token and not forzar:
+            restante = self._restante(vence)
+            if restante > self.anticipo:
+                return token
+            if restante > self.margen:
+                self._renovar_en_segundo_plano(eid)
+                return token
+        return self._renovar(eid, descartar=token if forzar else None)
+
+    def _cargar(self, eid):
+        """Primer uso en este proceso: parte del token guardado en la BD."""
+        empresa = db.session.get(Company, eid)
+        if empresa and empresa.calendar_access_token:
+            self.guardar(eid, empresa.calendar_access_token, empresa.calendar_token_expires_at)
+
+    def _renovar(self, eid, descartar=None):
+        with self._lock_empresa(eid):
+            # Otro hilo pudo renovar mientras se esperaba el lock
+            token, vence = self._cache.get(eid, (None, None))
+            if token and token != descartar and self._restante(vence) > self.anticipo:
+                return token
+
+            empresa = db.session.get(Company, eid)
+            if empresa:
+                db.session.refresh(empresa)
+            if not empresa or not empresa.calendar_refresh_token:
+                raise JobFallido("El calendario no está conectado: vuelve a conectarlo.")
+            # ...u otro worker, que lo dejó guardado en la BD
+            actual = empresa.calendar_access_token
+            if actual and actual != descartar and self._restante(empresa.calendar_token_expires_at) > self.anticipo:
+                self.guardar(eid, actual, empresa.calendar_token_expires_at)
+                return actual
+
+            return _pedir_tokens_calendario(empresa, empresa.calendar_provider, {
+                "refresh_token": empresa.calendar_refresh_token,
+                "grant_type": "refresh_token",
+            })
+
+    def _renovar_en_segundo_plano(self, eid):
+        lock = self._lock_empresa(eid)
+        if lock.locked():
+            return  # ya hay una renovación en curso
+
+        def trabajo():
+            with app.app_context():
+                try:
+                    self._renovar(eid)
+                except Exception:
+                    app.logger.exception("No se pudo renovar el token de calendario de la empresa %s", eid)
+
+        threading.Thread(target=trabajo, name=f"token-calendario-{eid}", daemon=True).start()
+
+
+tokens_calendario = TokensCalendario(
+    anticipo=int(os.getenv("CALENDARIO_TOKEN_ANTICIPO_SEG", "300")),
+)
+
+
+def token_calendario(empresa: Company, forzar=False):
+    """Access token vigente de la empresa (ver TokensCalendario)."""
+    return tokens_calendario.obtener(
+        empresa.id,
+        forzar=forzar,
+        guardado=(empresa.calendar_access_token, empresa.calendar_token_expires_at),
+    )
+
+
+def _evento_calendario(t: Task, proyecto_nombre, provider, empresa_id):
+    """Evento de día completo en la fecha de plazo de la tarea."""
+    titulo = f"[{proyecto_nombre}] {t.texto}"
+    detalle = "\n".join(x for x in (
+        f"Estado: {t.situacion}",
+        f"Responsable: {t.responsable}" if t.responsable else "",
+        f"Centro: {t.centro_responsabilidad}" if t.centro_responsabilidad else "",
+        t.observacion or "",
+    ) if x)
+    inicio, fin = t.plazo_fecha, t.plazo_fecha + timedelta(days=1)
+    if provider == "microsoft":
+        return {
+            "subject": titulo,
+            "body": {"contentType": "text", "content": detalle},
+            "isAllDay": True,
+            "start": {"dateTime": f"{inicio.isoformat()}T00:00:00", "timeZone": "UTC"},
+            "end": {"dateTime": f"{fin.isoformat()}T00:00:00", "timeZone": "UTC"},
+            "transactionId": f"planificador-{empresa_id}-{t.id}",
+        }
+    return {
+        "summary": titulo,
+        "description": detalle,
+        "start": {"date": inicio.isoformat()},
+        "end": {"date": fin.isoformat()},
+        "status": "confirmed",
+    }
+
+
+def _id_evento_google(empresa_id, tid):
+    # Id propio (base32hex: a-v y 0-9): reintentar una creación da 409 en vez de duplicar
+    return f"planificador{empresa_id}t{tid}"
+
+
+def _peticion_calendario(empresa, accion, t, m, evento):
+    """(método, ruta relativa, cuerpo) de una operación sobre el evento de la tarea."""
+    if empresa.calendar_provider == "microsoft":
+        if accion == "crear":
+            return "POST", "/me/events", evento
+        if accion == "actualizar":
+            return "PATCH", f"/me/events/{m.evento_id}", evento
+        return "DELETE", f"/me/events/{m.evento_id}", None
+
+    cal = quote(empresa.calendar_google_calendar_id or "primary", safe="")
+    base = f"/calendar/v3/calendars/{cal}/events"
+    if accion == "crear":
+        return "POST", base, {**evento, "id": _id_evento_google(empresa.id, t.id)}
+    evento_id = m.evento_id if m else _id_evento_google(empresa.id, t.id)
+    if accion == "actualizar":
+        return "PATCH", f"{base}/{evento_id}", evento
+    return "DELETE", f"{base}/{evento_id}", None
+
+
+def _batch_google(clave, token, peticiones):
+    """Google batch HTTP (multipart/mixed). Devuelve [(status, cuerpo dict)] en el mismo orden."""
+    limite = f"batch_{secrets.token_hex(8)}"
+    partes = []
+    for i, (metodo, ruta, cuerpo) in enumerate(peticiones):
+        parte = (
+            f"--{limite}\r\nContent-Type: application/http\r\nContent-ID: <item{i}>\r\n\r\n"
+            f"{metodo} {ruta}\r\n"
         )
-        data = r.json()
-    except Exception as ex:
-        flash(f"Error al contactar Microsoft: {ex}", "error")
-        return redirect(url_for("empresa_calendario"))
+        if cuerpo is not None:
+            parte += f"Content-Type: application/json\r\n\r\n{json.dumps(cuerpo)}\r\n"
+        else:
+            parte += "\r\n"
+        partes.append(parte)
+    cuerpo_batch = "".join(partes) + f"--{limite}--\r\n"
+
+    r = http_saliente.post(
+        clave,
+        f"{GOOGLE_CALENDAR_API}/batch/calendar/v3",
+        data=cuerpo_batch.encode("utf-8"),
+        headers={"Authorization": f"Bearer {token}", "Content-Type": f"multipart/mixed; boundary={limite}"},
+    )
+    if r.status_code != 200:
+        return [(r.status_code, {})] * len(peticiones)
+
+    ctype = r.headers.get("Content-Type", "")
+    limite_resp = ctype.split("boundary=", 1)[-1].strip().strip('"')
+    respuestas = {}
+    for parte in r.text.split(f"--{limite_resp}"):
+        if "Content-ID:" not in parte:
+            continue
+        cid = parte.split("Content-ID:", 1)[1].split("\n", 1)[0].strip().strip("<>")
+        i = int(cid.rsplit("item", 1)[-1])
+        http = parte.split("HTTP/", 1)[1].replace("\r\n", "\n")
+        status = int(http.split(None, 2)[1])
+        # Línea de estado y cabeceras internas, línea en blanco y cuerpo JSON (vacío en 204)
+        cuerpo = http.split("\n\n", 1)[1].strip() if "\n\n" in http else ""
+        try:
+            respuestas[i] = (status, json.loads(cuerpo) if cuerpo else {})
+        except ValueError:
+            respuestas[i] = (status, {})
+    return [respuestas.get(i, (500, {})) for i in range(len(peticiones))]
+
+
+def _batch_microsoft(clave, token, peticiones):
+    """Microsoft Graph $batch (JSON). Devuelve [(status, cuerpo dict)] en el mismo orden."""
+    reqs = []
+    for i, (metodo, ruta, cuerpo) in enumerate(peticiones):
+        req = {"id": str(i), "method": metodo, "url": ruta}
+        if cuerpo is not None:
+            req["headers"] = {"Content-Type": "application/json"}
+            req["body"] = cuerpo
+        reqs.append(req)
+
+    r = http_saliente.post(
+        clave,
+        f"{MS_GRAPH_API}/v1.0/$batch",
+        json={"requests": reqs},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    if r.status_code != 200:
+        return [(r.status_code, {})] * len(peticiones)
+    respuestas = {int(x["id"]): (int(x["status"]), x.get("body") or {}) for x in r.json().get("responses", [])}
+    return [respuestas.get(i, (500, {})) for i in range(len(peticiones))]
 
-    if r.status_code != 200 or "access_token" not in data:
-        msg = data.get("error_description") or data.get("error") or (r.text or "")[:200]
-        flash(f"No se pudo obtener el token: {msg}", "error")
-        return redirect(url_for("empresa_calendario"))
 
-    empresa.calendar_access_token = data.get("access_token")
-    empresa.calendar_refresh_token = data.get("refresh_token") or empresa.calendar_refresh_token
-    exp = data.get("expires_in")
-    if exp:
-        empresa.calendar_token_expires_at = datetime.utcnow() + timedelta(seconds=int(exp))
+def _enviar_lote_calendario(empresa, ops, proyectos, res, fallidas):
+    """
+    Envía un lote de operaciones (accion, tarea, mapeo) y guarda los ids de evento.
+    Devuelve las operaciones a repetir en otra vuelta (409 al crear, 404 al actualizar)
+    y si hubo errores transitorios (401/429/5xx); las tareas rechazadas por el proveedor
+    se agregan a `fallidas` para reintentarlas en la próxima sincronización.
+    """
+    provider = empresa.calendar_provider
+    batch = _batch_microsoft if provider == "microsoft" else _batch_google
+    peticiones = [
+        _peticion_calendario(empresa, accion, t, m, _evento_calendario(t, proyectos[t.proyecto_id], provider, empresa.id))
+        if accion != "borrar" else _peticion_calendario(empresa, accion, t, m, None)
+        for accion, t, m in ops
+    ]
+    respuestas = batch(clave_http_calendario(empresa), token_calendario(empresa), peticiones)
+
+    repetir, transitorio = [], False
+    for (accion, t, m), (status, cuerpo) in zip(ops, respuestas):
+        if accion == "borrar":
+            if status in (200, 204, 404, 410):
+                db.session.delete(m)
+                res["borrados"] += 1
+            elif status in (401, 429) or status >= 500:
+                transitorio = True
+            else:
+                res["errores"] += 1
+                fallidas.add(t.id)
+            continue
+
+        if 200 <= status < 300:
+            if not m:
+                m = CalendarEvent(empresa_id=empresa.id, tarea_id=t.id, provider=provider)
+                db.session.add(m)
+            m.evento_id = cuerpo.get("id") or m.evento_id or _id_evento_google(empresa.id, t.id)
+            m.sincronizado_en = t.updated_at
+            res["creados" if accion == "crear" else "actualizados"] += 1
+        elif accion == "crear" and status == 409:
+            # Google: el evento ya existía (creación anterior sin confirmar en la BD)
+            repetir.append(("actualizar", t, m))
+        elif accion == "actualizar" and status in (404, 410):
+            if m:
+                db.session.delete(m)
+                db.session.flush()
+            repetir.append(("crear", t, None))
+        elif status in (401, 429) or status >= 500:
+            transitorio = True
+        else:
+            res["errores"] += 1
+            fallidas.add(t.id)
+
+    if any(status == 401 for status, _ in respuestas):
+        # Token revocado o vencido antes de tiempo: el reintento pedirá uno nuevo
+        tokens_calendario.invalidar(empresa.id)
+        empresa.calendar_token_expires_at = datetime.utcnow()
     db.session.commit()
-    flash("Microsoft 365 / Outlook conectado. Siguiente paso: sincronizar eventos desde las tareas.", "ok")
-    return redirect(url_for("empresa_calendario"))
+    return repetir, transitorio
+
+
+def _operaciones_calendario(empresa, tareas):
+    ids = [t.id for t in tareas]
+    mapeos = {
+        m.tarea_id: m for m in CalendarEvent.query.filter(
+            CalendarEvent.tarea_id.in_(ids), CalendarEvent.provider == empresa.calendar_provider
+        )
+    }
+    ops = []
+    for t in tareas:
+        m = mapeos.get(t.id)
+        if m and m.sincronizado_en == t.updated_at:
+            continue  # esta versión ya se envió
+        if t.plazo_fecha:
+            ops.append(("actualizar" if m else "crear", t, m))
+        elif m:
+            ops.append(("borrar", t, m))
+    return ops
+
+
+def _enviar_operaciones_calendario(empresa, ops, proyectos, res, fallidas):
+    """Envía `ops` por lotes, con una segunda vuelta para 409/404; lo que siga sin resolverse va a `fallidas`."""
+    lote = CALENDARIO_LOTE[empresa.calendar_provider]
+    for _ in range(2):
+        repetir, transitorio = [], False
+        for i in range(0, len(ops), lote):
+            r, tr = _enviar_lote_calendario(empresa, ops[i:i + lote], proyectos, res, fallidas)
+            repetir += r
+            transitorio = transitorio or tr
+        if transitorio:
+            # El cursor no avanza: el reintento del trabajo solo reenvía lo pendiente
+            raise RuntimeError(f"{CALENDARIO_NOMBRES[empresa.calendar_provider]} no respondió a todo el lote")
+        ops = repetir
+        if not ops:
+            return
+    fallidas.update(t.id for _, t, _ in ops)
+    res["errores"] += len(ops)
+
+
+def sincronizar_calendario(empresa_id):
+    """
+    Lleva al calendario de la empresa los plazos de las tareas modificadas desde la última
+    sincronización (feed de cambios por proyecto, cursor guardado en la empresa).
+    Las operaciones van en lotes (Google batch / Graph $batch) por la sesión HTTP compartida.
+    Las tareas que el proveedor rechazó quedan en calendar_sync_cursores[CALENDARIO_REINTENTAR]
+    y se vuelven a enviar al comienzo de la siguiente sincronización, aunque nadie las edite.
+    """
+    empresa = db.session.get(Company, int(empresa_id))
+    if not empresa or empresa.calendar_provider not in CALENDARIO_NOMBRES:
+        raise JobFallido("La empresa no tiene un calendario configurado.")
+    if not company_calendar_connected(empresa):
+        raise JobFallido("El calendario no está conectado: vuelve a conectarlo.")
+
+    proyectos = dict(db.session.query(Project.id, Project.nombre).filter(Project.empresa_id == empresa.id))
+    cursores = dict(empresa.calendar_sync_cursores or {})
+    res = {"creados": 0, "actualizados": 0, "borrados": 0, "errores": 0}
+    fallidas = set()
+
+    def guardar_cursores():
+        cursores.pop(CALENDARIO_REINTENTAR, None)
+        if fallidas:
+            cursores[CALENDARIO_REINTENTAR] = sorted(fallidas)
+        empresa.calendar_sync_cursores = dict(cursores)
+        db.session.commit()
+
+    reintentar = [int(tid) for tid in cursores.get(CALENDARIO_REINTENTAR, [])]
+    for i in range(0, len(reintentar), CALENDARIO_SYNC_PAGINA):
+        ids = reintentar[i:i + CALENDARIO_SYNC_PAGINA]
+        tareas = Task.query.filter(Task.id.in_(ids), Task.proyecto_id.in_(list(proyectos))).order_by(Task.id).all()
+        _enviar_operaciones_calendario(empresa, _operaciones_calendario(empresa, tareas), proyectos, res, fallidas)
+    if reintentar:
+        guardar_cursores()
+
+    for pid in sorted(proyectos):
+        cursor = cursores.get(str(pid))
+        while True:
+            tareas, siguiente, hay_mas = cambios_tareas(pid, cursor, CALENDARIO_SYNC_PAGINA, serializar=lambda t: t)
+            _enviar_operaciones_calendario(empresa, _operaciones_calendario(empresa, tareas), proyectos, res, fallidas)
+
+            cursores[str(pid)] = siguiente
+            guardar_cursores()
+            cursor = siguiente
+            if not hay_mas:
+                break
+
+    res["mensaje"] = (
+        f"Calendario sincronizado: {res['creados']} creados, {res['actualizados']} actualizados, "
+        f"{res['borrados']} eliminados" + (f", {res['errores']} con error" if res["errores"] else "") + "."
+    )
+    return res
+
+
+@job("calendario.sync", "Sincronización del calendario", volver="empresa_calendario")
+def job_sincronizar_calendario(payload):
+    return sincronizar_calendario(payload["empresa_id"])
+
+
+def eventos_calendario_borrables(empresa, *filtro):
+    """Mapeos de la empresa en su calendario conectado (los de otro proveedor ya no se pueden borrar)."""
+    if not empresa or empresa.calendar_provider not in CALENDARIO_NOMBRES or not company_calendar_connected(empresa):
+        return CalendarEvent.query.filter(false())
+    return CalendarEvent.query.filter(
+        CalendarEvent.empresa_id == empresa.id, CalendarEvent.provider == empresa.calendar_provider, *filtro
+    )
+
+
+def borrar_eventos_calendario(empresa, evento_ids):
+    """
+    Borra del calendario de la empresa los eventos indicados, por lotes. 404/410 cuentan como
+    borrados (así reintentar todo el trabajo es idempotente); 401/429/5xx lanzan RuntimeError.
+    Devuelve (borrados, con error).
+    """
+    provider = empresa.calendar_provider
+    batch = _batch_microsoft if provider == "microsoft" else _batch_google
+    lote = CALENDARIO_LOTE[provider]
+    borrados = errores = 0
+    for i in range(0, len(evento_ids), lote):
+        ids = evento_ids[i:i + lote]
+        peticiones = [_peticion_calendario(empresa, "borrar", None, CalendarEvent(evento_id=eid), None) for eid in ids]
+        respuestas = batch(clave_http_calendario(empresa), token_calendario(empresa), peticiones)
+        transitorio = False
+        for status, _ in respuestas:
+            if status in (200, 204, 404, 410):
+                borrados += 1
+            elif status in (401, 429) or status >= 500:
+                transitorio = True
+            else:
+                errores += 1
+        if any(status == 401 for status, _ in respuestas):
+            tokens_calendario.invalidar(empresa.id)
+            empresa.calendar_token_expires_at = datetime.utcnow()
+            db.session.commit()
+        if transitorio:
+            raise RuntimeError(f"{CALENDARIO_NOMBRES[provider]} no respondió a todo el lote")
+    return borrados, errores
+
+
+def encolar_borrado_eventos(empresa, *filtro):
+    """
+    Encola, en la transacción en curso, el borrado en el proveedor de los eventos que cumplen
+    `filtro`, antes de que quien llama elimine sus filas de calendar_events.
+    """
+    ids = [eid for (eid,) in eventos_calendario_borrables(empresa, *filtro).with_entities(CalendarEvent.evento_id)]
+    if not ids:
+        return None
+    j = Job(
+        tipo="calendario.borrar_eventos",
+        payload={"empresa_id": empresa.id, "provider": empresa.calendar_provider, "eventos": ids},
+        empresa_id=empresa.id,
+        max_intentos=JOBS_MAX_INTENTOS,
+    )
+    db.session.add(j)
+    _jobs_aviso.set()
+    return j
+
+
+@job("calendario.borrar_eventos", "Borrado de eventos del calendario", volver="empresa_calendario")
+def job_borrar_eventos_calendario(payload):
+    empresa = db.session.get(Company, int(payload["empresa_id"]))
+    if not empresa or empresa.calendar_provider != payload.get("provider") or not company_calendar_connected(empresa):
+        raise JobFallido("El calendario ya no está conectado: los eventos deben borrarse a mano.")
+    borrados, errores = borrar_eventos_calendario(empresa, payload.get("eventos") or [])
+    return {"mensaje": f"{borrados} evento(s) eliminados del calendario" + (f", {errores} con error" if errores else "") + "."}
+
+
+@job("empresa.eliminar", "Eliminación de empresa", volver="sa_config")
+def job_eliminar_empresa(payload):
+    """Borra los eventos de calendario de la empresa (mientras aún tiene sus tokens) y luego la empresa."""
+    eid = int(payload["empresa_id"])
+    empresa = db.session.get(Company, eid)
+    borrados = errores = 0
+    aviso = ""
+    if empresa:
+        ids = [e for (e,) in eventos_calendario_borrables(empresa).with_entities(CalendarEvent.evento_id)]
+        try:
+            borrados, errores = borrar_eventos_calendario(empresa, ids)
+        except JobFallido as ex:  # calendario desconectado entre medio: se elimina igual
+            aviso = f" {ex}"
+    eliminar_empresa(eid)
+    return {"mensaje": f"Empresa eliminada; {borrados} evento(s) borrados del calendario"
+                       + (f", {errores} con error" if errores else "") + "." + aviso}
+
+
+def encolar_sync_calendario(empresa_id, usuario_id=None, demora=0):
+    """
+    Encola una sincronización salvo que ya haya una pendiente para la empresa; en ese caso
+    la pendiente se posterga hasta `demora` si iba a correr antes, pero nunca más allá de
+    CALENDARIO_POSTERGAR_MAX_SEG desde que se encoló: una empresa que edita sin pausa no
+    deja su sincronización esperando para siempre (lo que quede fuera lo lleva la siguiente).
+    """
+    pendiente = Job.query.filter_by(tipo="calendario.sync", empresa_id=int(empresa_id), estado="pendiente").first()
+    if not pendiente:
+        return encolar_job(
+            "calendario.sync", {"empresa_id": int(empresa_id)},
+            empresa_id=int(empresa_id), usuario_id=usuario_id, demora=demora,
+        )
+    desde = min(
+        datetime.utcnow() + timedelta(seconds=demora),
+        pendiente.created_at + timedelta(seconds=CALENDARIO_POSTERGAR_MAX_SEG),
+    )
+    Job.query.filter(
+        Job.id == pendiente.id, Job.estado == "pendiente", Job.ejecutar_desde < desde,
+    ).update({"ejecutar_desde": desde}, synchronize_session=False)
+    db.session.commit()
+    return pendiente
+
+
+@suscribir(*EVENTOS_TAREA, asincrono=True)
+def _calendario_al_cambiar(evento, datos):
+    p = db.session.get(Project, int(datos["proyecto_id"]))
+    empresa = db.session.get(Company, p.empresa_id) if p else None
+    if empresa and empresa.calendar_provider in CALENDARIO_NOMBRES and company_calendar_connected(empresa):
+        # el feed de cambios no entrega lo escrito hace menos de CAMBIOS_MARGEN_SEG: esperar a que salga
+        encolar_sync_calendario(empresa.id, demora=CAMBIOS_MARGEN_SEG + 1)
+
+
+@app.route("/empresa/calendario/sincronizar", methods=["POST"])
+@login_required
+@require_roles("supervisor")
+def empresa_calendario_sincronizar():
+    u = current_user()
+    empresa = _company_for_calendar_user(u)
+    if not empresa:
+        abort(403)
+    if not company_calendar_connected(empresa):
+        flash("Conecta el calendario antes de sincronizar.", "error")
+        return redirect(url_for("empresa_calendario"))
+    j = encolar_sync_calendario(empresa.id, u.get("id"))
+    return redirect(url_for("job_estado", job_id=j.id))
+
+
+# ================= TRABAJOS: estado =================
+def _job_visible(u, j: Job) -> bool:
+    if u.get("rol") == "superadmin" or j.usuario_id == u.get("id"):
+        return True
+    return bool(j.empresa_id) and j.empresa_id == u.get("empresa_id") and u.get("rol") == "supervisor"
+
+
+def job_to_dict(j: Job):
+    return {
+        "id": j.id,
+        "tipo": j.tipo,
+        "nombre": JOBS_NOMBRES.get(j.tipo, j.tipo),
+        "estado": j.estado,
+        "intentos": j.intentos,
+        "max_intentos": j.max_intentos,
+        "ejecutar_desde": j.ejecutar_desde.isoformat() if j.ejecutar_desde else None,
+        "resultado": j.resultado,
+        "error": j.error,
+        "created_at": j.created_at.isoformat() if j.created_at else None,
+        "terminado_en": j.terminado_en.isoformat() if j.terminado_en else None,
+    }
+
+
+def _job_de_usuario(job_id):
+    j = db.session.get(Job, int(job_id))
+    if not j or not _job_visible(current_user(), j):
+        abort(404)
+    return j
+
+
+@app.route("/jobs/<int:job_id>")
+@login_required
+@no_cache
+def job_estado(job_id):
+    j = _job_de_usuario(job_id)
+    volver = JOBS_VOLVER.get(j.tipo)
+    return render_template(
+        "job.html",
+        job=job_to_dict(j),
+        en_curso=j.estado in ("pendiente", "en_curso"),
+        volver_url=url_for(volver) if volver else None,
+        user=current_user(),
+    )
+
+
+@app.route("/jobs/<int:job_id>.json")
+@login_required
+@no_cache
+def job_estado_json(job_id):
+    return jsonify(job_to_dict(_job_de_usuario(job_id)))
 
 
 # ================= SELECCIONAR PROYECTO =================
@@ -1623,7 +5026,10 @@ def seleccionar_proyecto_post(proyecto_id):
 @require_project_access
 @no_cache
 def proyecto_index(proyecto_id):
-    tareas, _ = load_tareas(proyecto_id)
+    despues = request.args.get("despues", 0, type=int) or 0
+    limite = _limite_pagina()
+    tareas, siguiente = load_tareas_pagina(proyecto_id, despues, limite)
+    total_tareas = estadisticas_proyectos([proyecto_id])[int(proyecto_id)]["total"]
     u = current_user()
 
     empresa = db.session.get(Company, int(u.get("empresa_id"))) if u.get("empresa_id") else None
@@ -1638,14 +5044,30 @@ def proyecto_index(proyecto_id):
     return render_template(
         "index.html",
         tareas=tareas,
+        total_tareas=total_tareas,
+        despues=despues,
+        siguiente=siguiente,
+        limite=limite,
         estados=ESTADOS,
         proyecto_id=proyecto_id,
         user=u,
         empresa_nombre=empresa_nombre,
-        proyectos_usuario=proyectos_usuario
+        proyectos_usuario=proyectos_usuario,
+        subida_umbral=SUBIDA_TAMANO_PARTE,
+        miniatura_extensiones=MINIATURA_EXTENSIONES
     )
 
 
+@app.route("/p/<int:proyecto_id>/tareas.json")
+@login_required
+@require_project_access
+@no_cache
+def proyecto_tareas_json(proyecto_id):
+    despues = request.args.get("despues", 0, type=int) or 0
+    tareas, siguiente = load_tareas_resumen_pagina(proyecto_id, despues, _limite_pagina())
+    return jsonify({"tareas": tareas, "siguiente": siguiente})
+
+
 @app.route("/p/<int:proyecto_id>/agregar", methods=["POST"])
 @login_required
 @require_project_access
@@ -1664,6 +5086,29 @@ def proyecto_agregar(proyecto_id):
     return redirect(url_for("proyecto_index", proyecto_id=proyecto_id))
 
 
+@app.route("/p/<int:proyecto_id>/importar", methods=["POST"])
+@login_required
+@require_project_access
+def proyecto_importar(proyecto_id):
+    archivo = request.files.get("archivo")
+    if not archivo or not archivo.filename:
+        flash("Selecciona un archivo CSV o Excel.", "error")
+        return redirect(url_for("proyecto_index", proyecto_id=proyecto_id))
+
+    try:
+        res = importar_archivo(proyecto_id, archivo)
+    except ValueError as ex:
+        flash(str(ex), "error")
+        return redirect(url_for("proyecto_index", proyecto_id=proyecto_id))
+
+    flash(f"Importación: {res['insertadas']} tarea(s) creadas, {res['con_error']} fila(s) con error.", "ok")
+    for e in res["errores"][:10]:
+        flash(f"Fila {e['fila']}: {e['error']}", "error")
+    if res["con_error"] > 10:
+        flash(f"... y {res['con_error'] - 10} fila(s) más con error.", "error")
+    return redirect(url_for("proyecto_index", proyecto_id=proyecto_id))
+
+
 @app.route("/p/<int:proyecto_id>/cambiar_estado/<int:tid>", methods=["POST"])
 @login_required
 @require_project_access
@@ -1698,18 +5143,46 @@ def proyecto_adjuntar(proyecto_id, tid):
         name, ext = os.path.splitext(secure_filename(file.filename))
         if not name:
             name = 'documento'
-        filename = f"{proyecto_id}_{tid}_{name}_{int(time.time() * 1000)}{ext}"
-        filename = secure_filename(filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        if os.path.exists(filepath):
-            agregar_documento(proyecto_id, tid, filename)
+        sha256, tamano, tmp = recibir_blob(file.stream)
+        documento = {"sha256": sha256, "nombre": name + ext, "tamano": tamano}
+        agregar_documento(proyecto_id, tid, documento, tmp, current_user().get("id"))
     return redirect(url_for("proyecto_index", proyecto_id=proyecto_id))
 
 
+def _adjunto_de(proyecto_id, tid, **filtro):
+    """Adjunto de la tarea por sha256 o archivo (índice único tarea/sha256), o None."""
+    return Attachment.query.filter_by(proyecto_id=int(proyecto_id), tarea_id=int(tid), **filtro).first()
+
+
+@app.route("/p/<int:proyecto_id>/t/<int:tid>/adjuntos/<sha256>/<nombre>")
+@login_required
+@require_project_access
+def adjunto(proyecto_id, tid, sha256, nombre):
+    a = _adjunto_de(proyecto_id, tid, sha256=sha256) if SHA256_RE.match(sha256) else None
+    if not a:
+        abort(404)
+    return servir_adjunto(ruta_blob(sha256), a.nombre or nombre, etag=sha256)
+
+
+@app.route("/p/<int:proyecto_id>/t/<int:tid>/adjuntos/<sha256>/miniatura")
+@login_required
+@require_project_access
+def adjunto_miniatura(proyecto_id, tid, sha256):
+    if not SHA256_RE.match(sha256) or not _adjunto_de(proyecto_id, tid, sha256=sha256):
+        abort(404)
+    return servir_adjunto(ruta_miniatura(sha256), "miniatura.webp", etag=f"{sha256}-{MINIATURA_PX}")
+
+
 @app.route("/uploads/<filename>")
+@login_required
 def uploads(filename):
-    return send_from_directory(UPLOAD_FOLDER, filename)
+    # adjuntos antiguos (antes del almacén por contenido), nombrados "<proyecto>_<tarea>_..."
+    m = re.match(r"^(\d+)_(\d+)_", filename)
+    if not m or not user_can_access_project(current_user(), int(m.group(1))):
+        abort(404)
+    if not _adjunto_de(m.group(1), m.group(2), archivo=filename):
+        abort(404)
+    return servir_adjunto(os.path.join(UPLOAD_FOLDER, secure_filename(filename)), filename)
 
 
 # ================= PROYECTO: TABLERO =================
@@ -1718,13 +5191,7 @@ def uploads(filename):
 @require_project_access
 @no_cache
 def proyecto_tablero(proyecto_id):
-    tareas, _ = load_tareas(proyecto_id)
-
-    centro_filtro = request.args.get('centro', 'Todos')
-    responsable_filtro = request.args.get('responsable', 'Todos')
-    estado_filtro = request.args.get('estado', 'Todos')
-    plazo_filtro = request.args.get('plazo', 'Todos')
-    objetivo_filtro = request.args.get('objetivo', 'Todos')
+    filtros = filtros_desde_request()
 
     u = current_user()
     empresa = db.session.get(Company, int(u.get("empresa_id"))) if u.get("empresa_id") else None
@@ -1739,21 +5206,13 @@ def proyecto_tablero(proyecto_id):
     objetivos = [objective_to_dict(o) for o in Objective.query.filter_by(proyecto_id=int(proyecto_id)).order_by(Objective.id.asc()).all()]
     objetivos_map = {o['id']: o for o in objetivos}
 
-    tareas_filtradas = filtrar_tareas(
-        tareas,
-        centro=centro_filtro if centro_filtro != 'Todos' else None,
-        responsable=responsable_filtro if responsable_filtro != 'Todos' else None,
-        estado=estado_filtro if estado_filtro != 'Todos' else None,
-        plazo=plazo_filtro if plazo_filtro != 'Todos' else None,
-        objetivo_id=objetivo_filtro,
-        objetivos_map=objetivos_map
-    )
+    criterios = filtros_tareas_sql(proyecto_id, objetivos_map=objetivos_map, **filtros)
+    tareas_filtradas = [task_to_dict(t) for t in Task.query.filter(*criterios).order_by(Task.id.asc()).all()]
 
-    estadisticas = obtener_estadisticas(tareas_filtradas)
-    estadisticas_totales = obtener_estadisticas(tareas)
+    estadisticas = obtener_estadisticas_db(*criterios)
+    estadisticas_totales = estadisticas_proyectos([proyecto_id])[int(proyecto_id)]
 
-    responsables_unicos = sorted(set([t.get('responsable', '') for t in tareas if t.get('responsable')]))
-    centros_unicos = sorted(set([t.get('centro_responsabilidad', '') for t in tareas if t.get('centro_responsabilidad')]))
+    facetas = facetas_proyecto(proyecto_id)
 
     return render_template(
         "tablero.html",
@@ -1761,25 +5220,79 @@ def proyecto_tablero(proyecto_id):
         estadisticas=estadisticas,
         estadisticas_totales=estadisticas_totales,
         estados=ESTADOS,
-        responsables=responsables_unicos,
-        centros=centros_unicos,
-        filtros={
-            "centro": centro_filtro,
-            "responsable": responsable_filtro,
-            "estado": estado_filtro,
-            "plazo": plazo_filtro,
-            "objetivo": objetivo_filtro
-        },
+        responsables=facetas["responsables"],
+        centros=facetas["centros"],
+        filtros=filtros,
         objetivos=objetivos,
         objetivos_map=objetivos_map,
-        kpis=[kpi_to_dict(k, int(proyecto_id), objetivos_map) for k in KPI.query.join(Objective, KPI.objetivo_id == Objective.id).filter(Objective.proyecto_id == int(proyecto_id)).order_by(KPI.id.asc()).all()],
+        kpis=kpis_proyecto(proyecto_id, objetivos_map),
         proyecto_id=proyecto_id,
         user=u,
         empresa_nombre=empresa_nombre,
-        proyectos_usuario=proyectos_usuario
+        proyectos_usuario=proyectos_usuario,
+        sse_reintento_seg=SSE_REINTENTO_SEG,
     )
 
 
+@app.route("/p/<int:proyecto_id>/tablero/stream")
+@login_required
+@require_project_access
+def proyecto_tablero_stream(proyecto_id):
+    filtros = filtros_desde_request()
+    try:
+        reanudar = datetime.fromisoformat(request.headers.get("Last-Event-ID") or request.args.get("desde", ""))
+    except ValueError:
+        reanudar = None
+    if reanudar and reanudar.tzinfo:
+        # updated_at se guarda en UTC sin zona: comparar con un datetime con zona fallaría a mitad del stream
+        reanudar = reanudar.astimezone(timezone.utc).replace(tzinfo=None)
+    if not _tomar_cupo_sse():
+        resp = Response("Demasiados tableros en vivo en este servidor; reintente más tarde.\n", status=503, mimetype="text/plain")
+        resp.headers["Retry-After"] = str(SSE_REINTENTO_SEG)
+        return resp
+
+    resp = Response(
+        stream_with_context(stream_tablero(proyecto_id, filtros, reanudar)),
+        mimetype="text/event-stream",
+    )
+    resp.call_on_close(_soltar_cupo_sse)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+@app.route("/p/<int:proyecto_id>/facetas.json")
+@login_required
+@require_project_access
+@no_cache
+def proyecto_facetas_json(proyecto_id):
+    return jsonify(facetas_proyecto(proyecto_id))
+
+
+@app.route("/p/<int:proyecto_id>/export.<formato>")
+@login_required
+@require_project_access
+@no_cache
+def proyecto_exportar(proyecto_id, formato):
+    if formato not in ("csv", "xlsx"):
+        abort(404)
+
+    objetivos_map = {o.id: objective_to_dict(o) for o in Objective.query.filter_by(proyecto_id=int(proyecto_id)).all()}
+    criterios = filtros_tareas_sql(proyecto_id, objetivos_map=objetivos_map, **filtros_desde_request())
+
+    if formato == "csv":
+        cuerpo = (parte.encode("utf-8") for parte in exportar_csv(criterios))
+        mimetype = "text/csv; charset=utf-8"
+    else:
+        cuerpo = exportar_xlsx(criterios)
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+    resp = Response(stream_with_context(cuerpo), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f'attachment; filename="tareas_proyecto_{proyecto_id}.{formato}"'
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
 # ================= PROYECTO: OBJETIVOS + KPIs =================
 @app.route("/p/<int:proyecto_id>/objetivos")
 @login_required
@@ -1795,7 +5308,7 @@ def proyecto_objetivos(proyecto_id):
 
     objetivos = [objective_to_dict(o) for o in Objective.query.filter_by(proyecto_id=int(proyecto_id)).order_by(Objective.id.asc()).all()]
     objetivos_map = {o['id']: o for o in objetivos}
-    kpis = [kpi_to_dict(k, int(proyecto_id), objetivos_map) for k in KPI.query.join(Objective, KPI.objetivo_id == Objective.id).filter(Objective.proyecto_id == int(proyecto_id)).order_by(KPI.id.asc()).all()]
+    kpis = kpis_proyecto(proyecto_id, objetivos_map)
     kpis_por_obj = {}
     for k in kpis:
         kpis_por_obj.setdefault(k['objetivo_id'], []).append(k)
@@ -1897,27 +5410,19 @@ def proyecto_kpi_eliminar(proyecto_id, kpi_id):
 @no_cache
 def proyecto_informe(proyecto_id):
     tareas, _ = load_tareas(proyecto_id)
-    estadisticas = obtener_estadisticas(tareas)
+    estadisticas = obtener_estadisticas_db(Task.proyecto_id == int(proyecto_id))
     hoy = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     proyecto = _get_project(proyecto_id)
     proyecto_nombre = (proyecto or {}).get("nombre", "Proyecto")
 
-    tareas_vencidas = []
-    limite = datetime.now().date() + timedelta(days=7)
-    tareas_por_vencer = []
+    hoy_fecha = datetime.now().date()
+    limite = hoy_fecha + timedelta(days=7)
+    base = Task.query.filter(Task.proyecto_id == int(proyecto_id)).order_by(Task.id.asc())
 
-    for t in tareas:
-        plazo_str = t.get("plazo", "")
-        if not plazo_str:
-            continue
-        try:
-            fecha = datetime.strptime(plazo_str, '%Y-%m-%d').date()
-        except Exception:
-            continue
-        if fecha < datetime.now().date():
-            tareas_vencidas.append(t)
-        if datetime.now().date() <= fecha <= limite:
-            tareas_por_vencer.append(t)
+    tareas_vencidas = [task_to_dict(t) for t in base.filter(Task.plazo_fecha < hoy_fecha).all()]
+    tareas_por_vencer = [
+        task_to_dict(t) for t in base.filter(Task.plazo_fecha >= hoy_fecha, Task.plazo_fecha <= limite).all()
+    ]
 
     return render_template(
         "informe.html",
@@ -1937,6 +5442,324 @@ def about():
     return render_template("about.html")
 
 
+# ================= API JSON v1 =================
+API_MAX_LOTE = 5000
+API_CAMPOS_EDITABLES = ("responsable", "centro_responsabilidad", "plazo", "observacion", "recursos")
+
+
+def api_error(mensaje, status=400, **extra):
+    return jsonify({"error": mensaje, **extra}), status
+
+
+def api_project_access(f):
+    """Como require_project_access, pero responde JSON 401/403 en vez de redirigir."""
+    @wraps(f)
+    def wrapper(proyecto_id, *args, **kwargs):
+        u = current_user()
+        if not u:
+            return api_error("No autenticado", 401)
+        if not user_can_access_project(u, int(proyecto_id)):
+            return api_error("Sin acceso al proyecto", 403)
+        return f(proyecto_id, *args, **kwargs)
+    return wrapper
+
+
+def _api_lote():
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("tasks")
+    if not isinstance(data, list) or not data:
+        return None, api_error("Se espera una lista 'tasks' no vacía")
+    if len(data) > API_MAX_LOTE:
+        return None, api_error(f"Máximo {API_MAX_LOTE} tareas por lote", 413)
+    return data, None
+
+
+def _api_texto(item, campo, errores, i):
+    v = item.get(campo)
+    if v is None:
+        return None
+    if not isinstance(v, str):
+        errores.append({"index": i, "error": f"'{campo}' debe ser texto"})
+        return None
+    v = v.strip()
+    if campo == "plazo" and v and parse_plazo(v) is None:
+        errores.append({"index": i, "error": "'plazo' debe tener formato YYYY-MM-DD"})
+    return v
+
+
+@app.route("/api/v1/p/<int:proyecto_id>/tasks", methods=["GET"])
+@api_project_access
+@no_cache
+def api_tasks_listar(proyecto_id):
+    despues = request.args.get("despues", 0, type=int) or 0
+    tareas, siguiente = load_tareas_pagina(proyecto_id, despues, _limite_pagina(), serializar=task_to_api)
+    return jsonify({"tasks": tareas, "siguiente": siguiente})
+
+
+@app.route("/api/v1/p/<int:proyecto_id>/tasks/changes", methods=["GET"])
+@api_project_access
+@no_cache
+def api_tasks_cambios(proyecto_id):
+    """
+    Feed incremental: ?cursor=<cursor anterior>&limite=N. Se vuelve a consultar con el
+    `cursor` devuelto (también cuando no hubo cambios) hasta que `hay_mas` sea false.
+    """
+    try:
+        tareas, cursor, hay_mas = cambios_tareas(
+            proyecto_id, request.args.get("cursor") or None, _limite_pagina()
+        )
+    except ValueError:
+        return api_error("Cursor inválido")
+    return jsonify({"tasks": tareas, "cursor": cursor, "hay_mas": hay_mas})
+
+
+@app.route("/api/v1/p/<int:proyecto_id>/tasks", methods=["POST"])
+@api_project_access
+def api_tasks_crear(proyecto_id):
+    """Alta masiva: {"tasks": [{"texto": ..., "responsable": ..., ...}, ...]}, todo o nada."""
+    lote, err = _api_lote()
+    if err:
+        return err
+
+    p = db.session.get(Project, int(proyecto_id))
+    if not p:  # el superadmin pasa api_project_access aunque el proyecto no exista
+        return api_error("Proyecto no encontrado", 404)
+    filas, errores = [], []
+    for i, item in enumerate(lote):
+        if not isinstance(item, dict):
+            errores.append({"index": i, "error": "Cada tarea debe ser un objeto"})
+            continue
+        texto = _api_texto(item, "texto", errores, i)
+        if not texto:
+            errores.append({"index": i, "error": "'texto' es obligatorio"})
+        valores = {campo: _api_texto(item, campo, errores, i) for campo in API_CAMPOS_EDITABLES}
+        filas.append(fila_tarea(
+            p,
+            texto,
+            valores["responsable"],
+            valores["centro_responsabilidad"],
+            valores["plazo"],
+            valores["observacion"],
+            valores["recursos"],
+        ))
+
+    if errores:
+        return api_error("Lote inválido; no se insertó ninguna tarea", 400, errores=errores)
+
+    tareas = insertar_tareas_lote(p.id, filas)
+    return jsonify({"tasks": [task_to_api(t) for t in tareas]}), 201
+
+
+@app.route("/api/v1/p/<int:proyecto_id>/tasks", methods=["PATCH"])
+@api_project_access
+def api_tasks_actualizar(proyecto_id):
+    """
+    Cambios masivos: {"tasks": [{"id": 1, "situacion": "Completada", "plazo": "..."}, ...]}.
+    Se aplican en una transacción y se devuelven solo las tareas que cambiaron.
+    """
+    lote, err = _api_lote()
+    if err:
+        return err
+
+    u = current_user()
+    cambios, errores = {}, []
+    for i, item in enumerate(lote):
+        if not isinstance(item, dict):
+            errores.append({"index": i, "error": "Cada cambio debe ser un objeto"})
+            continue
+        tid = item.get("id")
+        if not isinstance(tid, int) or isinstance(tid, bool):
+            errores.append({"index": i, "error": "'id' entero obligatorio"})
+            continue
+
+        c = cambios.setdefault(tid, {})
+        if "situacion" in item:
+            estado = item.get("situacion")
+            if estado not in ESTADOS:
+                errores.append({"index": i, "error": f"'situacion' debe ser uno de {ESTADOS}"})
+            elif estado == "Validada" and u.get("rol") not in ("supervisor", "superadmin"):
+                errores.append({"index": i, "error": "Solo un supervisor puede validar"})
+            else:
+                c["situacion"] = estado
+        for campo in API_CAMPOS_EDITABLES:
+            if campo in item:
+                valor = _api_texto(item, campo, errores, i)
+                c[campo] = valor or ""
+
+    if errores:
+        return api_error("Lote inválido; no se modificó ninguna tarea", 400, errores=errores)
+
+    cambiadas, faltantes = actualizar_tareas_lote(proyecto_id, cambios)
+    if faltantes:
+        db.session.rollback()
+        return api_error("Tareas inexistentes en el proyecto", 404, ids=faltantes)
+    return jsonify({"tasks": [task_to_api(t) for t in cambiadas]})
+
+
+@app.route("/api/v1/p/<int:proyecto_id>/tasks/import", methods=["POST"])
+@api_project_access
+def api_tasks_importar(proyecto_id):
+    """Importación desde un archivo multipart 'archivo' (.csv/.xlsx); informa errores por fila."""
+    archivo = request.files.get("archivo")
+    if not archivo or not archivo.filename:
+        return api_error("Falta el archivo 'archivo'")
+    try:
+        res = importar_archivo(proyecto_id, archivo)
+    except ValueError as ex:
+        return api_error(str(ex))
+    return jsonify(res), 201 if res["insertadas"] else 200
+
+
+@app.route("/api/v1/p/<int:proyecto_id>/attachments", methods=["GET"])
+@api_project_access
+@no_cache
+def api_adjuntos_listar(proyecto_id):
+    """Adjuntos del proyecto por cursor sobre id (?despues=, ?limite=) y su uso de almacenamiento."""
+    despues = request.args.get("despues", 0, type=int) or 0
+    limite = _limite_pagina()
+    filas = (
+        Attachment.query
+        .filter(Attachment.proyecto_id == proyecto_id, Attachment.id > despues)
+        .order_by(Attachment.id.asc())
+        .limit(limite + 1)
+        .all()
+    )
+    siguiente = filas[limite - 1].id if len(filas) > limite else None
+    uso = uso_adjuntos(Attachment.proyecto_id == proyecto_id).get(proyecto_id, {"adjuntos": 0, "bytes": 0, "bytes_unicos": 0})
+    return jsonify({
+        "attachments": [{**attachment_to_dict(a), "tarea_id": a.tarea_id} for a in filas[:limite]],
+        "siguiente": siguiente,
+        "uso": uso,
+    })
+
+
+def subida_to_api(s: ChunkedUpload):
+    return {
+        "id": s.id,
+        "nombre": s.nombre,
+        "tamano": s.tamano,
+        "tamano_parte": s.tamano_parte,
+        "partes": partes_subida(s),
+        "recibidas": partes_recibidas(s),
+        "estado": s.estado,
+        "expira_en": s.expira_en.isoformat(),
+    }
+
+
+def _api_subida(proyecto_id, tid, sid):
+    """Subida vigente de esta tarea iniciada por el usuario actual (solo él puede continuarla)."""
+    s = db.session.get(ChunkedUpload, sid)
+    if not s or s.proyecto_id != int(proyecto_id) or s.tarea_id != int(tid) or s.expira_en < datetime.utcnow():
+        return None
+    if s.usuario_id != current_user().get("id"):
+        return None
+    return s
+
+
+@app.route("/api/v1/p/<int:proyecto_id>/tasks/<int:tid>/uploads", methods=["POST"])
+@api_project_access
+def api_subida_crear(proyecto_id, tid):
+    """
+    Inicia una subida por partes: {"nombre": ..., "tamano": bytes, "sha256": opcional}.
+    Luego PUT .../uploads/<id>/parts/<n> (n = 0..partes-1, cuerpo binario, cabecera opcional
+    X-Checksum-SHA256), en cualquier orden y en paralelo; GET .../uploads/<id> indica las
+    partes ya recibidas para reanudar; POST .../uploads/<id>/complete encola la unión de las
+    partes y responde 202 con la URL del trabajo (Location), que al terminar agregó el documento.
+    """
+    data = request.get_json(silent=True) or {}
+    nombre = secure_filename(str(data.get("nombre") or ""))
+    tamano = data.get("tamano")
+    sha256 = str(data.get("sha256") or "").strip().lower() or None
+    if not nombre or not allowed_file(nombre):
+        return api_error("Nombre o tipo de archivo no permitido")
+    if not isinstance(tamano, int) or isinstance(tamano, bool) or tamano <= 0:
+        return api_error("'tamano' debe ser un entero positivo")
+    if tamano > SUBIDA_MAX_TAMANO:
+        return api_error(f"Máximo {SUBIDA_MAX_TAMANO // (1024 * 1024)} MB por archivo", 413)
+    if sha256 and not SHA256_RE.match(sha256):
+        return api_error("'sha256' debe tener 64 caracteres hexadecimales")
+
+    t = db.session.query(Task.empresa_id).filter_by(proyecto_id=proyecto_id, id=tid).first()
+    if not t:
+        return api_error("Tarea inexistente en el proyecto", 404)
+
+    s = ChunkedUpload(
+        id=secrets.token_hex(16),
+        empresa_id=t.empresa_id,
+        proyecto_id=proyecto_id,
+        tarea_id=tid,
+        usuario_id=current_user().get("id"),
+        nombre=nombre,
+        tamano=tamano,
+        tamano_parte=SUBIDA_TAMANO_PARTE,
+        sha256=sha256,
+        expira_en=datetime.utcnow() + timedelta(seconds=SUBIDA_VIGENCIA_SEG),
+    )
+    db.session.add(s)
+    db.session.commit()
+    return jsonify(subida_to_api(s)), 201
+
+
+@app.route("/api/v1/p/<int:proyecto_id>/tasks/<int:tid>/uploads/<sid>", methods=["GET"])
+@api_project_access
+@no_cache
+def api_subida_estado(proyecto_id, tid, sid):
+    s = _api_subida(proyecto_id, tid, sid)
+    if not s:
+        return api_error("Subida inexistente o vencida", 404)
+    return jsonify(subida_to_api(s))
+
+
+@app.route("/api/v1/p/<int:proyecto_id>/tasks/<int:tid>/uploads/<sid>/parts/<int:n>", methods=["PUT"])
+@api_project_access
+def api_subida_parte(proyecto_id, tid, sid, n):
+    s = _api_subida(proyecto_id, tid, sid)
+    if not s:
+        return api_error("Subida inexistente o vencida", 404)
+    if s.estado != "abierta":
+        return api_error("La subida ya se está completando", 409)
+    if not 0 <= n < partes_subida(s):
+        return api_error(f"La parte debe estar entre 0 y {partes_subida(s) - 1}")
+    try:
+        sha256 = guardar_parte(s, n, request.stream, request.headers.get("X-Checksum-SHA256"))
+    except ValueError as ex:
+        return api_error(str(ex), 422)
+    return jsonify({"parte": n, "sha256": sha256})
+
+
+@app.route("/api/v1/p/<int:proyecto_id>/tasks/<int:tid>/uploads/<sid>/complete", methods=["POST"])
+@api_project_access
+def api_subida_completar(proyecto_id, tid, sid):
+    s = _api_subida(proyecto_id, tid, sid)
+    if not s:
+        return api_error("Subida inexistente o vencida", 404)
+    if s.estado == "abierta":
+        faltantes = sorted(set(range(partes_subida(s))) - set(partes_recibidas(s)))
+        if faltantes:
+            return api_error("Faltan partes", 409, faltantes=faltantes)
+        if not iniciar_completar_subida(s):
+            # otro pedido la pasó a "completando" entre medio: se responde con su trabajo
+            s = _api_subida(proyecto_id, tid, sid)
+            if not s:
+                return api_error("Subida inexistente o vencida", 404)
+    j = db.session.get(Job, s.job_id)
+    url = url_for("job_estado_json", job_id=j.id)
+    return jsonify({"job": job_to_dict(j), "url": url}), 202, {"Location": url}
+
+
+@app.route("/api/v1/p/<int:proyecto_id>/tasks/<int:tid>/uploads/<sid>", methods=["DELETE"])
+@api_project_access
+def api_subida_cancelar(proyecto_id, tid, sid):
+    s = _api_subida(proyecto_id, tid, sid)
+    if not s:
+        return api_error("Subida inexistente o vencida", 404)
+    if s.estado != "abierta":
+        return api_error("La subida ya se está completando", 409)
+    cerrar_subida(s)
+    return "", 204
+
+
 # ================= MIGRACIÓN (JSON -> DB) =================
 EMPRESAS_FILE = os.path.join(DATA_DIR, "empresas.json")
 PROYECTOS_FILE = os.path.join(DATA_DIR, "proyectos.json")
@@ -2026,7 +5849,14 @@ def migrate_json_to_db():
 with app.app_context():
     db.create_all()
     ensure_company_calendar_columns()
+    ensure_job_columns()
+    ensure_subida_columns()
+    ensure_task_schema()
     ensure_superadmin()
+    iniciar_broker_eventos()
 
 if __name__ == "__main__":
+    # con el reloader de debug el módulo se carga dos veces: el worker solo en el proceso hijo
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        iniciar_worker_jobs_web()
     app.run(debug=True, host="0.0.0.0", port=5000)
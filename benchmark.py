@@ -0,0 +1,158 @@
+"""
+Benchmarks del Planificador de Tareas.
+Compara rutas en Python contra las equivalentes resueltas en la base de datos,
+y el flujo de formularios contra la API JSON por lotes.
+
+Uso:
+    python benchmark.py                 # SQLite temporal, todos los benchmarks
+    python benchmark.py api             # solo uno (estadisticas | api)
+    DATABASE_URL=postgresql://... python benchmark.py
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+if not os.environ.get("DATABASE_URL"):
+    _tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    _tmp.close()
+    os.environ["DATABASE_URL"] = "sqlite:///" + _tmp.name
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import (  # noqa: E402
+    app, db, Company, Project, Task, User, ESTADOS,
+    load_tareas, obtener_estadisticas, obtener_estadisticas_db,
+)
+
+TAMANOS = [1_000, 10_000, 100_000]
+REPETICIONES = 3
+
+
+def _medir(fn, repeticiones=REPETICIONES):
+    mejor = None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        mejor = dt if mejor is None else min(mejor, dt)
+    return mejor
+
+
+def crear_proyecto(n_tareas, nombre):
+    """Crea una empresa y un proyecto con `n_tareas` tareas aleatorias."""
+    e = Company(nombre=f"Bench {nombre}", licencia_max_proyectos=1)
+    db.session.add(e)
+    db.session.flush()
+    p = Project(empresa_id=e.id, nombre=nombre)
+    db.session.add(p)
+    db.session.flush()
+
+    hoy = datetime.now().date()
+    responsables = [f"Responsable {i}" for i in range(25)] + [""]
+    centros = [f"Centro {i}" for i in range(10)] + [""]
+    filas = []
+    for i in range(n_tareas):
+        if random.random() < 0.1:
+            plazo = None
+        else:
+            plazo = hoy + timedelta(days=random.randint(-90, 90))
+        filas.append({
+            "empresa_id": e.id,
+            "proyecto_id": p.id,
+            "texto": f"Tarea {i}",
+            "situacion": random.choice(ESTADOS),
+            "responsable": random.choice(responsables),
+            "centro_responsabilidad": random.choice(centros),
+            "plazo": plazo.isoformat() if plazo else "",
+            "plazo_fecha": plazo,
+            "observacion": "x" * 200,
+            "recursos": "",
+        })
+    db.session.bulk_insert_mappings(Task, filas)
+    db.session.commit()
+    return p.id
+
+
+def bench_estadisticas():
+    print("== obtener_estadisticas (Python) vs obtener_estadisticas_db (SQL) ==")
+    print(f"{'tareas':>8} | {'python (s)':>11} | {'sql (s)':>9} | {'x':>6}")
+    for n in TAMANOS:
+        pid = crear_proyecto(n, f"estadisticas-{n}")
+
+        def ruta_python():
+            tareas, _ = load_tareas(pid)
+            return obtener_estadisticas(tareas)
+
+        def ruta_sql():
+            return obtener_estadisticas_db(Task.proyecto_id == pid)
+
+        assert ruta_python() == ruta_sql()
+        t_py = _medir(ruta_python)
+        t_sql = _medir(ruta_sql)
+        print(f"{n:>8} | {t_py:>11.4f} | {t_sql:>9.4f} | {t_py / t_sql:>6.1f}")
+
+
+API_TAREAS_PROYECTO = 2_000
+API_CAMBIOS = [100, 500, 1_000]
+
+
+def _cliente_supervisor(empresa_id):
+    correo = f"bench-{empresa_id}@bench.local"
+    db.session.add(User(
+        nombre="Bench",
+        correo=correo,
+        password_hash=generate_password_hash("bench123"),
+        rol="supervisor",
+        empresa_id=empresa_id,
+        activo=True,
+    ))
+    db.session.commit()
+    c = app.test_client()
+    c.post("/login", data={"correo": correo, "password": "bench123"})
+    return c
+
+
+def bench_api():
+    print("== cambios de estado: formulario (1 POST + redirect por tarea) vs PATCH /api/v1 por lotes ==")
+    print(f"{'cambios':>8} | {'form (s)':>9} | {'api (s)':>8} | {'form/s':>8} | {'api/s':>9}")
+    for n in API_CAMBIOS:
+        pid = crear_proyecto(API_TAREAS_PROYECTO, f"api-{n}")
+        c = _cliente_supervisor(db.session.get(Project, pid).empresa_id)
+        ids = [tid for (tid,) in db.session.query(Task.id).filter_by(proyecto_id=pid).limit(n).all()]
+
+        def ruta_form():
+            for tid in ids:
+                r = c.post(
+                    f"/p/{pid}/cambiar_estado/{tid}",
+                    data={"situacion": random.choice(ESTADOS)},
+                    follow_redirects=True,
+                )
+                assert r.status_code == 200
+
+        def ruta_api():
+            r = c.patch(
+                f"/api/v1/p/{pid}/tasks",
+                json={"tasks": [{"id": tid, "situacion": random.choice(ESTADOS)} for tid in ids]},
+            )
+            assert r.status_code == 200
+
+        t_form = _medir(ruta_form, repeticiones=1)
+        t_api = _medir(ruta_api)
+        print(f"{n:>8} | {t_form:>9.3f} | {t_api:>8.3f} | {n / t_form:>8.0f} | {n / t_api:>9.0f}")
+
+
+BENCHMARKS = {
+    "estadisticas": bench_estadisticas,
+    "api": bench_api,
+}
+
+
+if __name__ == "__main__":
+    nombres = sys.argv[1:] or list(BENCHMARKS)
+    with app.app_context():
+        for nombre in nombres:
+            BENCHMARKS[nombre]()
@@ -0,0 +1,161 @@
+"""
+Servidor falso de Google Calendar y Microsoft Graph para probar la sincronización
+de plazos sin cuentas reales. Implementa solo lo que usa app.py:
+endpoints de token, Google batch HTTP (multipart/mixed) y Graph $batch.
+
+Uso:
+    python fake_calendario.py            # escucha en http://127.0.0.1:5055
+
+    GOOGLE_TOKEN_URL=http://127.0.0.1:5055/token \
+    GOOGLE_CALENDAR_API=http://127.0.0.1:5055 \
+    MS_LOGIN_URL=http://127.0.0.1:5055 \
+    MS_GRAPH_API=http://127.0.0.1:5055 \
+    python app.py
+
+Inspección y fallos simulados:
+    GET  /_eventos                   eventos guardados por proveedor
+    POST /_fallar?n=3&status=503     las próximas n sub-peticiones responden `status`
+"""
+
+import json
+import os
+import secrets
+import threading
+
+from flask import Flask, Response, jsonify, request
+
+
+def crear_app():
+    app = Flask(__name__)
+    estado = {
+        "eventos": {"google": {}, "microsoft": {}},
+        "fallos": [],
+        "batches": 0,
+        "tokens": 0,
+    }
+    lock = threading.Lock()
+    app.config["ESTADO"] = estado
+
+    def _fallo():
+        if estado["fallos"]:
+            return estado["fallos"].pop(0)
+        return None
+
+    # ---------- tokens ----------
+    def _token():
+        with lock:
+            estado["tokens"] += 1
+        if request.form.get("grant_type") not in ("authorization_code", "refresh_token"):
+            return jsonify({"error": "unsupported_grant_type"}), 400
+        if request.form.get("code") == "invalido" or request.form.get("refresh_token") == "revocado":
+            return jsonify({"error": "invalid_grant"}), 400
+        return jsonify({
+            "access_token": "fake-" + secrets.token_hex(8),
+            "refresh_token": "fake-refresh",
+            "expires_in": 3600,
+        })
+
+    app.add_url_rule("/token", "token_google", _token, methods=["POST"])
+    app.add_url_rule("/<tenant>/oauth2/v2.0/token", "token_microsoft", lambda tenant: _token(), methods=["POST"])
+
+    # ---------- Google ----------
+    def _google(metodo, ruta, cuerpo):
+        partes = ruta.strip("/").split("/")  # calendar v3 calendars <cal> events [<id>]
+        eventos = estado["eventos"]["google"]
+        evento_id = partes[5] if len(partes) > 5 else None
+        if metodo == "POST":
+            evento_id = cuerpo.get("id") or secrets.token_hex(8)
+            if evento_id in eventos:
+                return 409, {"error": {"code": 409, "message": "The requested identifier already exists."}}
+            eventos[evento_id] = {**cuerpo, "id": evento_id}
+            return 200, eventos[evento_id]
+        if evento_id not in eventos:
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        if metodo == "PATCH":
+            eventos[evento_id].update(cuerpo)
+            return 200, eventos[evento_id]
+        if metodo == "DELETE":
+            del eventos[evento_id]
+            return 204, None
+        return 405, {}
+
+    @app.route("/batch/calendar/v3", methods=["POST"])
+    def batch_google():
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            return "", 401
+        limite = request.content_type.split("boundary=", 1)[1]
+        salida_limite = "batch_" + secrets.token_hex(6)
+        salida = []
+        with lock:
+            estado["batches"] += 1
+            for parte in request.get_data(as_text=True).split(f"--{limite}"):
+                if "Content-ID:" not in parte:
+                    continue
+                cid = parte.split("Content-ID:", 1)[1].split("\r\n", 1)[0].strip().strip("<>")
+                interna = parte.split("\r\n\r\n", 1)[1]
+                linea, _, resto = interna.partition("\r\n")
+                metodo, ruta = linea.split(" ", 1)
+                cuerpo = json.loads(resto.split("\r\n\r\n", 1)[1]) if "\r\n\r\n" in resto else {}
+                fallo = _fallo()
+                status, datos = (fallo, {"error": {"code": fallo}}) if fallo else _google(metodo, ruta, cuerpo)
+                texto = json.dumps(datos) if datos is not None else ""
+                salida.append(
+                    f"--{salida_limite}\r\nContent-Type: application/http\r\nContent-ID: <response-{cid}>\r\n\r\n"
+                    f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n\r\n{texto}\r\n"
+                )
+        cuerpo = "".join(salida) + f"--{salida_limite}--\r\n"
+        return Response(cuerpo, content_type=f"multipart/mixed; boundary={salida_limite}")
+
+    # ---------- Microsoft Graph ----------
+    def _graph(metodo, ruta, cuerpo):
+        partes = ruta.strip("/").split("/")  # me events [<id>]
+        eventos = estado["eventos"]["microsoft"]
+        evento_id = partes[2] if len(partes) > 2 else None
+        if metodo == "POST":
+            existente = next((e for e in eventos.values() if cuerpo.get("transactionId") and e.get("transactionId") == cuerpo.get("transactionId")), None)
+            if existente:
+                return 201, existente
+            evento_id = "AAMk" + secrets.token_hex(8)
+            eventos[evento_id] = {**cuerpo, "id": evento_id}
+            return 201, eventos[evento_id]
+        if evento_id not in eventos:
+            return 404, {"error": {"code": "ErrorItemNotFound"}}
+        if metodo == "PATCH":
+            eventos[evento_id].update(cuerpo)
+            return 200, eventos[evento_id]
+        if metodo == "DELETE":
+            del eventos[evento_id]
+            return 204, None
+        return 405, {}
+
+    @app.route("/v1.0/$batch", methods=["POST"])
+    def batch_graph():
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            return "", 401
+        respuestas = []
+        with lock:
+            estado["batches"] += 1
+            for req in request.get_json()["requests"]:
+                fallo = _fallo()
+                status, datos = (fallo, {"error": {"code": str(fallo)}}) if fallo else _graph(req["method"], req["url"], req.get("body") or {})
+                respuestas.append({"id": req["id"], "status": status, "body": datos})
+        return jsonify({"responses": respuestas})
+
+    # ---------- inspección ----------
+    @app.route("/_eventos")
+    def ver_eventos():
+        return jsonify(estado["eventos"])
+
+    @app.route("/_fallar", methods=["POST"])
+    def fallar():
+        n = request.args.get("n", 1, type=int)
+        status = request.args.get("status", 503, type=int)
+        with lock:
+            estado["fallos"] += [status] * n
+        return jsonify({"fallos": len(estado["fallos"])})
+
+    return app
+
+
+if __name__ == "__main__":
+    crear_app().run(host="127.0.0.1", port=int(os.getenv("FAKE_CALENDARIO_PORT", "5055")))
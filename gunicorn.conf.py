@@ -0,0 +1,24 @@
+"""
+Configuración de gunicorn (se carga sola desde el directorio de trabajo).
+
+Dimensionamiento: cada proceso atiende GUNICORN_THREADS peticiones a la vez (gthread) y
+gunicorn levanta WEB_CONCURRENCY procesos. Un tablero abierto mantiene un stream SSE que
+ocupa un hilo hasta SSE_DURACION_SEG; app.py limita los streams a SSE_MAX_STREAMS por
+proceso (por defecto la mitad de los hilos) y responde 503 al resto, de modo que siempre
+quedan hilos para las páginas y la API. Para más tableros simultáneos, subir hilos o
+procesos (la memoria crece con los procesos, no con los hilos).
+
+El worker de la cola de trabajos se arranca aquí, una vez por proceso web, y no al
+importar app.py: así los comandos `flask ...` no levantan un worker propio.
+"""
+
+import os
+
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+
+
+def post_worker_init(worker):
+    import app
+
+    app.iniciar_worker_jobs_web()
@@ -0,0 +1,156 @@
+"""
+Fixtures de las pruebas: app.py sobre una SQLite temporal y un almacén de adjuntos
+temporal, sin worker de trabajos en segundo plano, y con los proveedores de calendario
+apuntando a fake_calendario.py.
+El entorno se fija antes de importar app (lee la configuración al importarse).
+"""
+
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+from flask.testing import FlaskClient
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from fake_calendario import crear_app as crear_fake_calendario  # noqa: E402
+
+_fake = crear_fake_calendario()
+_servidor = make_server("127.0.0.1", 0, _fake, threaded=True)
+threading.Thread(target=_servidor.serve_forever, daemon=True).start()
+_url_fake = f"http://127.0.0.1:{_servidor.server_port}"
+
+_fd, _db = tempfile.mkstemp(suffix=".db")
+os.close(_fd)
+os.environ.update(
+    DATABASE_URL="sqlite:///" + _db,
+    JOBS_WORKER_EN_WEB="0",
+    GOOGLE_TOKEN_URL=_url_fake + "/token",
+    GOOGLE_CALENDAR_API=_url_fake,
+    MS_LOGIN_URL=_url_fake,
+    MS_GRAPH_API=_url_fake,
+)
+
+import app as planificador  # noqa: E402
+
+planificador.app.config["TESTING"] = True
+
+# Almacén de adjuntos aparte: las pruebas (p.ej. la recolección de huérfanos) no tocan uploads/
+_uploads = tempfile.mkdtemp(prefix="uploads-")
+planificador.UPLOAD_FOLDER = planificador.app.config["UPLOAD_FOLDER"] = _uploads
+planificador.BLOBS_FOLDER = os.path.join(_uploads, "blobs")
+planificador.UPLOAD_TMP_FOLDER = os.path.join(_uploads, "tmp")
+os.makedirs(planificador.BLOBS_FOLDER)
+os.makedirs(planificador.UPLOAD_TMP_FOLDER)
+
+
+class ClientePorPeticion(FlaskClient):
+    """Cada petición con su propio app_context (y por tanto su propio g y sesión de BD),
+    como en el servidor, aunque la prueba tenga abierto el de `ctx`."""
+
+    def open(self, *args, **kwargs):
+        with planificador.app.app_context():
+            return super().open(*args, **kwargs)
+
+
+planificador.app.test_client_class = ClientePorPeticion
+
+
+@pytest.fixture
+def fake_calendario():
+    """Estado del calendario falso (eventos por proveedor, contadores)."""
+    return _fake.config["ESTADO"]
+
+
+@pytest.fixture
+def ctx():
+    with planificador.app.app_context():
+        yield
+        planificador.db.session.remove()
+
+
+@pytest.fixture
+def empresa(ctx):
+    """Empresa con un proyecto, un supervisor y un ejecutor; nombres únicos por prueba."""
+    db = planificador.db
+    n = planificador.Company.query.count() + 1
+    eid = planificador.crear_empresa_full(f"Empresa {n}", [f"Proyecto {n}"], max_proys=1)
+    pid = planificador.Project.query.filter_by(empresa_id=eid).first().id
+    usuarios = {}
+    for rol in ("supervisor", "ejecutor"):
+        correo = f"{rol}{n}@test.local"
+        db.session.add(planificador.User(
+            nombre=rol.title(), correo=correo, password_hash=generate_password_hash("123456"),
+            rol=rol, empresa_id=eid, activo=True,
+        ))
+        usuarios[rol] = correo
+    db.session.commit()
+    return {"id": eid, "proyecto_id": pid, "usuarios": usuarios}
+
+
+@pytest.fixture
+def superadmin(ctx):
+    db = planificador.db
+    correo = f"sa{planificador.User.query.count() + 1}@test.local"
+    db.session.add(planificador.User(
+        nombre="SA", correo=correo, password_hash=generate_password_hash("123456"), rol="superadmin", activo=True,
+    ))
+    db.session.commit()
+    return correo
+
+
+@pytest.fixture
+def login():
+    """login(correo) -> cliente de pruebas con la sesión iniciada."""
+    def _login(correo):
+        c = planificador.app.test_client()
+        r = c.post("/login", data={"correo": correo, "password": "123456"})
+        assert r.status_code == 302
+        return c
+    return _login
+
+
+@pytest.fixture
+def esperar():
+    """esperar(fn) -> primer valor verdadero de fn(), reintentando hasta 5 s (suscriptores asíncronos)."""
+    def _esperar(fn, timeout=5):
+        fin = time.monotonic() + timeout
+        while True:
+            planificador.db.session.expire_all()
+            valor = fn()
+            if valor or time.monotonic() > fin:
+                return valor
+            time.sleep(0.05)
+    return _esperar
+
+
+@pytest.fixture
+def crear_tarea():
+    """crear_tarea(cliente, proyecto_id, texto, **campos) -> id de la tarea creada por la API."""
+    def _crear(c, pid, texto, **campos):
+        r = c.post(f"/api/v1/p/{pid}/tasks", json={"tasks": [{"texto": texto, **campos}]})
+        assert r.status_code == 201, r.get_json()
+        return r.get_json()["tasks"][0]["id"]
+    return _crear
+
+
+@pytest.fixture
+def adjuntar():
+    """adjuntar(cliente, proyecto_id, tarea_id, nombre, contenido) -> sha256 del adjunto."""
+    def _adjuntar(c, pid, tid, nombre, contenido):
+        r = c.post(
+            f"/p/{pid}/adjuntar/{tid}",
+            data={"documento": (io.BytesIO(contenido), nombre)},
+            content_type="multipart/form-data",
+        )
+        assert r.status_code == 302
+        return hashlib.sha256(contenido).hexdigest()
+    return _adjuntar
@@ -0,0 +1,216 @@
+import io
+import os
+import time
+
+import app as planificador
+from app import db, Attachment, Blob, Task
+
+
+def _envejecer(ruta, segundos=7200):
+    viejo = time.time() - segundos
+    os.utime(ruta, (viejo, viejo))
+
+
+def test_archivo_de_una_transaccion_deshecha_lo_borra_el_gc(ctx):
+    contenido = b"adjunto que nunca llega a confirmarse"
+    sha256, tamano, tmp = planificador.recibir_blob(io.BytesIO(contenido))
+    planificador.retener_blob(sha256, tamano, tmp)
+    db.session.rollback()
+
+    ruta = planificador.ruta_blob(sha256)
+    assert os.path.isfile(ruta) and db.session.get(Blob, sha256) is None
+
+    planificador.recolectar_blobs(gracia=3600)
+    assert os.path.isfile(ruta)  # aún dentro de la gracia: podría ser una transacción en curso
+
+    _envejecer(ruta)
+    borrados, liberado = planificador.recolectar_blobs(gracia=3600)
+    assert not os.path.exists(ruta)
+    assert (borrados, liberado) == (1, len(contenido))
+
+
+def test_gc_no_borra_archivos_con_fila(ctx):
+    sha256, tamano, tmp = planificador.recibir_blob(io.BytesIO(b"adjunto confirmado"))
+    planificador.retener_blob(sha256, tamano, tmp)
+    db.session.commit()
+
+    ruta = planificador.ruta_blob(sha256)
+    _envejecer(ruta)
+    planificador.recolectar_blobs(gracia=3600)
+    assert os.path.isfile(ruta)
+
+
+def _subir_blob(contenido):
+    """Blob ya contado (como los de Task.documentos antes de attachments)."""
+    sha256, tamano, tmp = planificador.recibir_blob(io.BytesIO(contenido))
+    planificador.retener_blob(sha256, tamano, tmp)
+    db.session.commit()
+    return sha256
+
+
+def _referencias(sha256):
+    db.session.expire_all()
+    return db.session.get(Blob, sha256).referencias
+
+
+def test_normalizar_pasa_documentos_antiguos_mezclados(empresa, login, crear_tarea):
+    pid = empresa["proyecto_id"]
+    tid = crear_tarea(login(empresa["usuarios"]["supervisor"]), pid, "Con adjuntos antiguos")
+    suelto = f"antiguo_{tid}.pdf"
+    with open(os.path.join(planificador.UPLOAD_FOLDER, suelto), "wb") as f:
+        f.write(b"archivo suelto de antes")
+    contenido = b"adjunto ya en el almacen"
+    sha256 = _subir_blob(contenido)
+    Task.query.filter_by(id=tid).update({"documentos": [
+        suelto,
+        {"sha256": sha256, "nombre": "plano.pdf", "tamano": len(contenido)},
+        {"sha256": sha256, "nombre": "plano (copia).pdf", "tamano": len(contenido)},
+        suelto,
+    ]})
+    db.session.commit()
+
+    r = planificador.app.test_cli_runner().invoke(args=["adjuntos-normalizar"])
+    assert r.exit_code == 0 and "1 tarea(s)" in r.output
+
+    db.session.expire_all()
+    filas = Attachment.query.filter_by(tarea_id=tid).order_by(Attachment.id).all()
+    assert [(a.nombre, a.sha256, a.archivo, a.tamano) for a in filas] == [
+        (suelto, None, suelto, len(b"archivo suelto de antes")),
+        ("plano.pdf", sha256, None, len(contenido)),
+    ]
+    assert db.session.get(Task, tid).documentos is None
+    assert _referencias(sha256) == 1
+
+    r = planificador.app.test_cli_runner().invoke(args=["adjuntos-normalizar"])
+    assert "0 tarea(s)" in r.output
+    assert Attachment.query.filter_by(tarea_id=tid).count() == 2
+
+
+def test_mismo_contenido_dos_veces_en_una_tarea_es_una_referencia(empresa, login, crear_tarea, adjuntar):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    tid = crear_tarea(c, pid, "Adjunto repetido")
+    sha256 = adjuntar(c, pid, tid, "informe.pdf", b"informe repetido")
+    assert adjuntar(c, pid, tid, "informe_v2.pdf", b"informe repetido") == sha256
+
+    assert Attachment.query.filter_by(tarea_id=tid, sha256=sha256).count() == 1
+    assert _referencias(sha256) == 1
+
+
+def test_eliminar_proyecto_resta_sus_referencias(empresa, superadmin, login, crear_tarea, adjuntar):
+    pid = empresa["proyecto_id"]
+    sa = login(superadmin)
+    otra = planificador.crear_empresa_full(f"Empresa ref {pid}", [f"Proyecto ref {pid}"], max_proys=1)
+    otro_pid = planificador.Project.query.filter_by(empresa_id=otra).first().id
+
+    t1 = crear_tarea(sa, pid, "Uno")
+    t2 = crear_tarea(sa, pid, "Dos")
+    t3 = crear_tarea(sa, otro_pid, "Tres")
+    comun = adjuntar(sa, pid, t1, "comun.pdf", b"contenido compartido entre proyectos")
+    adjuntar(sa, pid, t2, "comun.pdf", b"contenido compartido entre proyectos")
+    adjuntar(sa, otro_pid, t3, "comun.pdf", b"contenido compartido entre proyectos")
+    solo = adjuntar(sa, pid, t1, "solo.pdf", b"contenido solo del proyecto borrado")
+    assert (_referencias(comun), _referencias(solo)) == (3, 1)
+
+    assert sa.post(f"/sa/proyecto/{pid}/eliminar").status_code == 302
+
+    assert (_referencias(comun), _referencias(solo)) == (1, 0)
+    assert Attachment.query.filter_by(proyecto_id=pid).count() == 0
+    planificador.recolectar_blobs(gracia=0)
+    assert os.path.isfile(planificador.ruta_blob(comun))
+    assert not os.path.exists(planificador.ruta_blob(solo))
+
+
+def test_bytes_unicos_cuentan_cada_contenido_una_vez(empresa, login, crear_tarea, adjuntar):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    t1 = crear_tarea(c, pid, "Uno")
+    t2 = crear_tarea(c, pid, "Dos")
+    grande, chico = b"g" * 100 + bytes([pid % 256]), b"c" * 50
+    adjuntar(c, pid, t1, "grande.pdf", grande)
+    adjuntar(c, pid, t2, "grande.pdf", grande)
+    adjuntar(c, pid, t1, "chico.pdf", chico)
+
+    esperado = {"adjuntos": 3, "bytes": 2 * len(grande) + len(chico), "bytes_unicos": len(grande) + len(chico)}
+    assert planificador.uso_adjuntos(Attachment.proyecto_id == pid)[pid] == esperado
+    r = c.get(f"/api/v1/p/{pid}/attachments")
+    assert r.status_code == 200 and r.get_json()["uso"] == esperado
+
+
+def _url_adjunto(pid, tid, sha256, nombre="plano.pdf"):
+    return f"/p/{pid}/t/{tid}/adjuntos/{sha256}/{nombre}"
+
+
+def test_servir_adjunto_responde_304_con_if_none_match(empresa, login, crear_tarea, adjuntar):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["ejecutor"])
+    tid = crear_tarea(c, pid, "Con plano")
+    contenido = b"%PDF plano de servir " + bytes([pid % 256])
+    sha256 = adjuntar(c, pid, tid, "plano.pdf", contenido)
+
+    r = c.get(_url_adjunto(pid, tid, sha256))
+    assert r.status_code == 200 and r.data == contenido
+    assert r.headers["ETag"] == f'"{sha256}"'
+    assert r.cache_control.private and r.cache_control.immutable and not r.cache_control.public
+    assert r.headers["X-Content-Type-Options"] == "nosniff"
+
+    r = c.get(_url_adjunto(pid, tid, sha256), headers={"If-None-Match": f'"{sha256}"'})
+    assert r.status_code == 304 and r.data == b""
+    assert r.headers["ETag"] == f'"{sha256}"' and r.cache_control.private
+
+    r = c.get(_url_adjunto(pid, tid, sha256), headers={"If-None-Match": '"otro"'})
+    assert r.status_code == 200 and r.data == contenido
+
+
+def test_servir_adjunto_responde_206_con_range(empresa, login, crear_tarea, adjuntar):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["ejecutor"])
+    tid = crear_tarea(c, pid, "Con video")
+    contenido = bytes(range(256)) * 4
+    sha256 = adjuntar(c, pid, tid, "plano.pdf", contenido)
+
+    r = c.get(_url_adjunto(pid, tid, sha256), headers={"Range": "bytes=100-199"})
+    assert r.status_code == 206
+    assert r.headers["Content-Range"] == f"bytes 100-199/{len(contenido)}"
+    assert r.data == contenido[100:200]
+
+    # If-Range con el ETag vigente mantiene el rango; con otro, se envía entero
+    r = c.get(_url_adjunto(pid, tid, sha256), headers={"Range": "bytes=-10", "If-Range": f'"{sha256}"'})
+    assert r.status_code == 206 and r.data == contenido[-10:]
+    r = c.get(_url_adjunto(pid, tid, sha256), headers={"Range": "bytes=-10", "If-Range": '"viejo"'})
+    assert r.status_code == 200 and r.data == contenido
+
+    r = c.get(_url_adjunto(pid, tid, sha256), headers={"Range": f"bytes={len(contenido)}-"})
+    assert r.status_code == 416
+
+
+def test_servir_adjunto_es_404_si_el_sha256_es_de_otra_tarea(empresa, login, crear_tarea, adjuntar):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    t1 = crear_tarea(c, pid, "Dueña")
+    t2 = crear_tarea(c, pid, "Ajena")
+    sha256 = adjuntar(c, pid, t1, "plano.pdf", b"solo de la primera tarea " + bytes([pid % 256]))
+
+    assert c.get(_url_adjunto(pid, t1, sha256)).status_code == 200
+    assert c.get(_url_adjunto(pid, t2, sha256)).status_code == 404
+    assert c.get(_url_adjunto(pid, t1, "0" * 64)).status_code == 404
+    assert c.get(_url_adjunto(pid, t1, "no-es-un-sha")).status_code == 404
+
+    otra = planificador.crear_empresa_full(f"Empresa sha {pid}", [f"Proyecto sha {pid}"], max_proys=1)
+    otro_pid = planificador.Project.query.filter_by(empresa_id=otra).first().id
+    assert c.get(_url_adjunto(otro_pid, t1, sha256)).status_code == 403
+
+
+def test_servir_adjunto_delega_en_nginx_con_x_accel(empresa, login, crear_tarea, adjuntar, monkeypatch):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    tid = crear_tarea(c, pid, "Por nginx")
+    sha256 = adjuntar(c, pid, tid, "plano.pdf", b"servido por nginx " + bytes([pid % 256]))
+    monkeypatch.setattr(planificador, "ADJUNTOS_X_ACCEL", "/_adjuntos/")
+
+    r = c.get(_url_adjunto(pid, tid, sha256))
+    assert r.status_code == 200 and r.data == b""
+    assert r.headers["X-Accel-Redirect"] == "/_adjuntos/blobs/" + os.path.relpath(
+        planificador.ruta_blob(sha256), planificador.BLOBS_FOLDER
+    ).replace(os.sep, "/")
+    assert r.headers["ETag"] == f'"{sha256}"' and r.headers["Content-Type"] == "application/pdf"
@@ -0,0 +1,19 @@
+from app import Project
+
+
+def test_crear_tareas_en_proyecto_inexistente_es_404(superadmin, login):
+    c = login(superadmin)
+    pid = (Project.query.order_by(Project.id.desc()).first().id if Project.query.count() else 0) + 1000
+
+    r = c.post(f"/api/v1/p/{pid}/tasks", json={"tasks": [{"texto": "Tarea huérfana"}]})
+
+    assert r.status_code == 404
+    assert r.get_json() == {"error": "Proyecto no encontrado"}
+
+
+def test_crear_tareas_por_api(empresa, login):
+    c = login(empresa["usuarios"]["supervisor"])
+    r = c.post(f"/api/v1/p/{empresa['proyecto_id']}/tasks", json={"tasks": [{"texto": "Desde la API"}]})
+
+    assert r.status_code == 201
+    assert [t["texto"] for t in r.get_json()["tasks"]] == ["Desde la API"]
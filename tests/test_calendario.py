@@ -0,0 +1,120 @@
+import time
+from datetime import datetime, timedelta
+
+import app as planificador
+from app import db, Company, Job, Task
+
+
+def _conectar_google(empresa_id):
+    e = db.session.get(Company, empresa_id)
+    e.calendar_provider = "google"
+    e.calendar_access_token = "fake-token"
+    e.calendar_refresh_token = "fake-refresh"
+    e.calendar_token_expires_at = datetime.utcnow() + timedelta(hours=1)
+    db.session.commit()
+
+
+def test_edicion_de_tarea_llega_al_calendario(empresa, login, fake_calendario, esperar, monkeypatch):
+    # margen chico pero distinto de cero: el trabajo no debe correr antes de que el feed entregue la tarea
+    monkeypatch.setattr(planificador, "CAMBIOS_MARGEN_SEG", 1)
+    _conectar_google(empresa["id"])
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+
+    r = c.post(f"/p/{pid}/agregar", data={"texto": "Entrega de planos", "plazo": "2099-03-01"}, follow_redirects=False)
+    assert r.status_code in (200, 302)
+    t = Task.query.filter_by(proyecto_id=pid, texto="Entrega de planos").one()
+
+    j = esperar(Job.query.filter_by(tipo="calendario.sync", empresa_id=empresa["id"], estado="pendiente").first)
+    assert j is not None
+    assert j.ejecutar_desde > datetime.utcnow()
+
+    antes = dict(fake_calendario["eventos"]["google"])
+    planificador.procesar_jobs("test", una_vez=True)
+    assert fake_calendario["eventos"]["google"] == antes  # aún dentro del margen
+
+    time.sleep(2.2)
+    planificador.procesar_jobs("test", una_vez=True)
+    db.session.expire_all()
+    j = db.session.get(Job, j.id)
+    assert j.estado == "completado", j.error
+    eventos = fake_calendario["eventos"]["google"]
+    evento_id = planificador._id_evento_google(empresa["id"], t.id)
+    assert evento_id in eventos
+    assert eventos[evento_id]["summary"].endswith("Entrega de planos")
+
+
+def _tareas_con_plazo(c, pid, crear_tarea, n):
+    return [crear_tarea(c, pid, f"Hito {i}", plazo=f"2099-0{i + 1}-15") for i in range(n)]
+
+
+def test_tarea_rechazada_se_reintenta_en_la_siguiente_sincronizacion(empresa, login, crear_tarea, fake_calendario, monkeypatch):
+    monkeypatch.setattr(planificador, "CAMBIOS_MARGEN_SEG", 0)
+    _conectar_google(empresa["id"])
+    pid = empresa["proyecto_id"]
+    ids = _tareas_con_plazo(login(empresa["usuarios"]["supervisor"]), pid, crear_tarea, 2)
+    eventos = fake_calendario["eventos"]["google"]
+    id_evento = {tid: planificador._id_evento_google(empresa["id"], tid) for tid in ids}
+
+    fake_calendario["fallos"][:] = [400]  # el proveedor rechaza la primera tarea del lote
+    res = planificador.sincronizar_calendario(empresa["id"])
+    assert (res["creados"], res["errores"]) == (1, 1)
+    assert id_evento[ids[0]] not in eventos and id_evento[ids[1]] in eventos
+    assert db.session.get(Company, empresa["id"]).calendar_sync_cursores["reintentar"] == [ids[0]]
+
+    # sin ediciones de por medio: el cursor ya pasó la tarea, pero se reenvía igual
+    res = planificador.sincronizar_calendario(empresa["id"])
+    assert (res["creados"], res["errores"]) == (1, 0)
+    assert id_evento[ids[0]] in eventos
+    assert "reintentar" not in db.session.get(Company, empresa["id"]).calendar_sync_cursores
+
+
+def test_eliminar_proyecto_borra_sus_eventos_del_calendario(empresa, superadmin, login, crear_tarea, fake_calendario, monkeypatch):
+    monkeypatch.setattr(planificador, "CAMBIOS_MARGEN_SEG", 0)
+    _conectar_google(empresa["id"])
+    pid = empresa["proyecto_id"]
+    ids = _tareas_con_plazo(login(empresa["usuarios"]["supervisor"]), pid, crear_tarea, 3)
+    planificador.sincronizar_calendario(empresa["id"])
+    eventos = fake_calendario["eventos"]["google"]
+    id_evento = [planificador._id_evento_google(empresa["id"], tid) for tid in ids]
+    assert all(e in eventos for e in id_evento)
+
+    r = login(superadmin).post(f"/sa/proyecto/{pid}/eliminar")
+    assert r.status_code == 302
+    j = Job.query.filter_by(tipo="calendario.borrar_eventos", empresa_id=empresa["id"]).one()
+    assert sorted(j.payload["eventos"]) == sorted(id_evento)
+
+    planificador.procesar_jobs("test", una_vez=True)
+    assert not any(e in eventos for e in id_evento)
+    db.session.expire_all()
+    j = db.session.get(Job, j.id)
+    assert j.estado == "completado", j.error
+
+
+def test_eliminar_empresa_borra_antes_sus_eventos(empresa, superadmin, login, crear_tarea, fake_calendario, monkeypatch):
+    monkeypatch.setattr(planificador, "CAMBIOS_MARGEN_SEG", 0)
+    _conectar_google(empresa["id"])
+    ids = _tareas_con_plazo(login(empresa["usuarios"]["supervisor"]), empresa["proyecto_id"], crear_tarea, 2)
+    planificador.sincronizar_calendario(empresa["id"])
+    eventos = fake_calendario["eventos"]["google"]
+    id_evento = [planificador._id_evento_google(empresa["id"], tid) for tid in ids]
+
+    r = login(superadmin).post(f"/sa/empresa/{empresa['id']}/eliminar")
+    assert r.status_code == 302 and "/jobs/" in r.headers["Location"]
+    assert db.session.get(Company, empresa["id"]) is not None  # aún no: primero el calendario
+
+    planificador.procesar_jobs("test", una_vez=True)
+    db.session.expire_all()
+    assert db.session.get(Company, empresa["id"]) is None
+    assert not any(e in eventos for e in id_evento)
+
+
+def test_sincronizacion_pendiente_no_se_posterga_sin_limite(empresa, monkeypatch):
+    monkeypatch.setattr(planificador, "CALENDARIO_POSTERGAR_MAX_SEG", 30)
+    j = planificador.encolar_sync_calendario(empresa["id"], demora=3)
+    for _ in range(3):  # ediciones continuas: cada una pide 3 s más... o una hora
+        planificador.encolar_sync_calendario(empresa["id"], demora=3600)
+    db.session.expire_all()
+    j = db.session.get(Job, j.id)
+    assert j.ejecutar_desde <= j.created_at + timedelta(seconds=30)
+    assert Job.query.filter_by(tipo="calendario.sync", empresa_id=empresa["id"]).count() == 1
@@ -0,0 +1,78 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as planificador
+from app import db, Task
+
+
+def _feed(c, pid, cursor=None, limite=2):
+    r = c.get(f"/api/v1/p/{pid}/tasks/changes", query_string={"cursor": cursor or "", "limite": limite})
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()
+
+
+def test_cursor_recorre_todo_una_vez_aunque_se_repita_updated_at(empresa, login, crear_tarea):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    ids = [crear_tarea(c, pid, f"Cambio {i}") for i in range(5)]
+    mismo = datetime.utcnow() - timedelta(minutes=5)
+    Task.query.filter(Task.id.in_(ids)).update({"updated_at": mismo}, synchronize_session=False)
+    db.session.commit()
+
+    vistas, cursor = [], None
+    while True:
+        r = _feed(c, pid, cursor)
+        vistas += [t["id"] for t in r["tasks"]]
+        cursor = r["cursor"]
+        if not r["hay_mas"]:
+            break
+    assert vistas == ids
+    assert _feed(c, pid, cursor)["tasks"] == []  # sin cambios: el cursor no retrocede
+
+    # una tarea editada vuelve a salir, una sola vez, detrás del cursor
+    Task.query.filter_by(id=ids[1]).update(
+        {"updated_at": datetime.utcnow() - timedelta(minutes=1)}, synchronize_session=False
+    )
+    db.session.commit()
+    r = _feed(c, pid, cursor)
+    assert [t["id"] for t in r["tasks"]] == [ids[1]] and not r["hay_mas"]
+    assert _feed(c, pid, r["cursor"])["tasks"] == []
+
+
+def test_feed_no_entrega_lo_escrito_dentro_del_margen(empresa, login, crear_tarea, monkeypatch):
+    monkeypatch.setattr(planificador, "CAMBIOS_MARGEN_SEG", 0.3)
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    tid = crear_tarea(c, pid, "Recién escrita")
+
+    assert tid not in [t["id"] for t in _feed(c, pid, limite=500)["tasks"]]
+    time.sleep(0.35)
+    assert tid in [t["id"] for t in _feed(c, pid, limite=500)["tasks"]]
+
+
+def test_cursor_invalido_es_400(empresa, login):
+    c = login(empresa["usuarios"]["supervisor"])
+    r = c.get(f"/api/v1/p/{empresa['proyecto_id']}/tasks/changes", query_string={"cursor": "no-es-un-cursor"})
+    assert r.status_code == 400
+
+
+def test_transaccion_mas_larga_que_el_margen_no_confirma_tareas(empresa, login, crear_tarea, monkeypatch):
+    monkeypatch.setattr(planificador, "CAMBIOS_MARGEN_SEG", 0.2)
+    pid = empresa["proyecto_id"]
+    tid = crear_tarea(login(empresa["usuarios"]["supervisor"]), pid, "Original")
+
+    Task.query.filter_by(id=tid).update({"texto": "Tardía"}, synchronize_session=False)
+    time.sleep(0.3)  # p.ej. un lote de importación lento: el feed ya habría pasado su updated_at
+    with pytest.raises(planificador.TransaccionLarga):
+        db.session.commit()
+    db.session.rollback()
+    assert db.session.get(Task, tid).texto == "Original"
+
+    t = db.session.get(Task, tid)
+    time.sleep(0.3)  # leer y esperar no cuenta: el plazo corre desde la escritura
+    t.texto = "A tiempo"
+    db.session.commit()
+    db.session.expire_all()
+    assert db.session.get(Task, tid).texto == "A tiempo"
@@ -0,0 +1,56 @@
+from sqlalchemy import event
+
+import app as planificador
+from app import db, Project
+
+
+class ContadorConsultas:
+    def __init__(self):
+        self.n = 0
+
+    def __call__(self, *args):
+        self.n += 1
+
+    def __enter__(self):
+        event.listen(db.engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, "before_cursor_execute", self)
+
+
+def _agregar_proyectos(empresa, login, n):
+    c = login(empresa["usuarios"]["supervisor"])
+    desde = Project.query.filter_by(empresa_id=empresa["id"]).count()
+    for i in range(desde, desde + n):
+        p = Project(nombre=f"Extra {empresa['id']}-{i}", empresa_id=empresa["id"])
+        db.session.add(p)
+        db.session.commit()
+        for j, situacion in enumerate(("Completada", "Validada", "Sin Ejecutar")):
+            c.post(f"/p/{p.id}/agregar", data={"texto": f"T{j}"})
+            if situacion != "Sin Ejecutar":
+                tid = planificador.Task.query.filter_by(proyecto_id=p.id, texto=f"T{j}").one().id
+                c.post(f"/p/{p.id}/cambiar_estado/{tid}", data={"situacion": situacion})
+    return c
+
+
+def _consultas_avance(c):
+    with ContadorConsultas() as contador:
+        r = c.get("/empresa/avance")
+    assert r.status_code == 200
+    return contador.n, r.get_json()["proyectos"]
+
+
+def test_avance_empresa_con_consultas_constantes(empresa, login):
+    c = _agregar_proyectos(empresa, login, 2)
+    _consultas_avance(c)  # primera lectura: materializa los proyectos que falten
+    pocos, avances = _consultas_avance(c)
+
+    _agregar_proyectos(empresa, login, 8)
+    _consultas_avance(c)
+    muchos, avances_muchos = _consultas_avance(c)
+
+    assert len(avances_muchos) == len(avances) + 8
+    assert muchos == pocos
+    extra = next(a for a in avances_muchos if a["proyecto"]["nombre"].startswith("Extra"))
+    assert (extra["total"], extra["completadas"], extra["validadas"], extra["avance_pct"]) == (3, 1, 1, 66.7)
@@ -0,0 +1,57 @@
+from datetime import date, timedelta
+
+import app as planificador
+from app import db, Task
+
+
+def _sembrar(empresa):
+    """Tareas con responsables/centros vacíos o nulos, estados variados y plazos de todo tipo."""
+    pid = empresa["proyecto_id"]
+    hoy = date.today()
+    filas = [
+        ("Completada", "Ana", "Obras", (hoy - timedelta(days=3)).isoformat()),
+        ("Sin Ejecutar", "", "Obras", hoy.isoformat()),
+        ("Sin Ejecutar", None, None, ""),
+        ("En Ejecución", "Luis", "", (hoy + timedelta(days=9)).isoformat()),
+        ("Validada", "Ana", "Calidad", "pronto"),          # plazo no válido: sin plazo
+        ("Estado raro", "Luis", "Calidad", (hoy - timedelta(days=1)).isoformat()),
+    ]
+    for i, (situacion, responsable, centro, plazo) in enumerate(filas):
+        db.session.add(Task(
+            empresa_id=empresa["id"], proyecto_id=pid, texto=f"Est {i}", situacion=situacion,
+            responsable=responsable, centro_responsabilidad=centro,
+            plazo=plazo, plazo_fecha=planificador.parse_plazo(plazo),
+        ))
+    db.session.commit()
+    return pid
+
+
+def _en_python(*criterios):
+    tareas = Task.query.filter(*criterios).order_by(Task.id).all()
+    return planificador.obtener_estadisticas([planificador.task_to_dict(t) for t in tareas])
+
+
+def test_estadisticas_en_sql_igualan_a_las_de_python(empresa):
+    pid = _sembrar(empresa)
+
+    est = planificador.obtener_estadisticas_db(Task.proyecto_id == pid)
+    assert est == _en_python(Task.proyecto_id == pid)
+    assert list(est["por_responsable"]) == list(_en_python(Task.proyecto_id == pid)["por_responsable"])
+    assert est["total"] == 6
+    assert est["por_responsable"] == {"Ana": 2, "Sin asignar": 2, "Luis": 2}
+    assert est["por_centro"] == {"Obras": 2, "Sin asignar": 2, "Calidad": 2}
+    assert (est["vencidas"], est["por_vencer"], est["sin_plazo"]) == (2, 2, 2)
+    assert sum(est["por_estado"].values()) == 5  # "Estado raro" cuenta en el total, no por estado
+
+
+def test_estadisticas_en_sql_respetan_los_criterios(empresa):
+    pid = _sembrar(empresa)
+    for criterios in (
+        [Task.proyecto_id == pid, Task.responsable == "Ana"],
+        [Task.proyecto_id == pid, Task.centro_responsabilidad == "Nadie"],
+        planificador.filtros_tareas_sql(pid, plazo="vencidas"),
+    ):
+        assert planificador.obtener_estadisticas_db(*criterios) == _en_python(*criterios)
+
+    vacio = planificador.obtener_estadisticas_db(Task.proyecto_id == pid, Task.id < 0)
+    assert vacio["total"] == 0 and vacio["por_responsable"] == {} and vacio["sin_plazo"] == 0
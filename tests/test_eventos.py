@@ -0,0 +1,19 @@
+import app as planificador
+from app import db, Company, User
+
+
+def test_suscriptor_con_error_de_bd_no_deja_la_sesion_rota(empresa, monkeypatch):
+    def roto(evento, datos):
+        db.session.add(User(nombre="x", correo=None, password_hash="x", rol="ejecutor"))
+        db.session.flush()  # correo es NOT NULL: IntegrityError
+
+    vistos = []
+    monkeypatch.setitem(planificador._suscriptores, "task.created", [
+        (roto, False, False),
+        (lambda evento, datos: vistos.append(db.session.get(Company, empresa["id"]).nombre), False, False),
+    ])
+
+    planificador.publicar("task.created", proyecto_id=empresa["proyecto_id"], tarea_id=0)
+
+    assert len(vistos) == 1  # el siguiente suscriptor usa la sesión sin PendingRollbackError
+    assert db.session.get(Company, empresa["id"]) is not None
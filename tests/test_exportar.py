@@ -0,0 +1,33 @@
+import csv
+import io
+
+import openpyxl
+
+
+PELIGROSOS = {
+    "texto": '=HYPERLINK("http://malo.example","clic")',
+    "responsable": "+56 9 1234",
+    "centro_responsabilidad": "@SUMA(A1)",
+    "observacion": "-2+3",
+    "recursos": "Grúa",
+}
+
+
+def test_exportacion_neutraliza_textos_que_parecen_formulas(empresa, login, crear_tarea):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    tid = crear_tarea(c, pid, **PELIGROSOS)
+    esperado = {k: ("'" + v if k != "recursos" else v) for k, v in PELIGROSOS.items()}
+
+    r = c.get(f"/p/{pid}/export.csv")
+    assert r.status_code == 200
+    filas = list(csv.DictReader(io.StringIO(r.get_data(as_text=True).lstrip("﻿")), delimiter=";"))
+    fila = next(f for f in filas if f["id"] == str(tid))
+    assert {k: fila[k] for k in esperado} == esperado
+
+    r = c.get(f"/p/{pid}/export.xlsx")
+    assert r.status_code == 200
+    hoja = openpyxl.load_workbook(io.BytesIO(r.get_data())).active
+    encabezado, *datos = hoja.iter_rows(values_only=True)
+    fila = dict(zip(encabezado, next(f for f in datos if f[0] == tid)))
+    assert {k: fila[k] for k in esperado} == esperado
@@ -0,0 +1,74 @@
+import app as planificador
+from app import db, Task
+
+
+def _sembrar(empresa):
+    pid = empresa["proyecto_id"]
+    filas = [("Ana", "Obras"), ("Luis", "Obras"), ("Ana", ""), (None, None), ("", "Calidad"), ("Ana", "Calidad")]
+    for i, (responsable, centro) in enumerate(filas):
+        db.session.add(Task(
+            empresa_id=empresa["id"], proyecto_id=pid, texto=f"Faceta {i}",
+            responsable=responsable, centro_responsabilidad=centro,
+        ))
+    db.session.commit()
+    return pid
+
+
+def _insertar_sin_evento(empresa, responsable):
+    db.session.add(Task(empresa_id=empresa["id"], proyecto_id=empresa["proyecto_id"], texto="Directa", responsable=responsable))
+    db.session.commit()
+
+
+def test_facetas_cuentan_por_valor_sin_vacios(empresa):
+    pid = _sembrar(empresa)
+    assert planificador.facetas_proyecto(pid) == {
+        "responsables": [{"valor": "Ana", "n": 3}, {"valor": "Luis", "n": 1}],
+        "centros": [{"valor": "Calidad", "n": 2}, {"valor": "Obras", "n": 2}],
+    }
+
+
+def test_facetas_se_cachean_e_invalidan_al_escribir_tareas(empresa, login, crear_tarea):
+    pid = _sembrar(empresa)
+    c = login(empresa["usuarios"]["supervisor"])
+    assert planificador.facetas_proyecto(pid)["responsables"][-1] == {"valor": "Luis", "n": 1}
+
+    # una escritura que no publica eventos no se ve hasta invalidar o expirar
+    _insertar_sin_evento(empresa, "Zoe")
+    assert "Zoe" not in [f["valor"] for f in planificador.facetas_proyecto(pid)["responsables"]]
+
+    # cambiar solo el estado no invalida
+    tid = Task.query.filter_by(proyecto_id=pid, texto="Faceta 1").first().id
+    r = c.patch(f"/api/v1/p/{pid}/tasks", json={"tasks": [{"id": tid, "situacion": "Completada"}]})
+    assert r.status_code == 200, r.get_json()
+    assert "Zoe" not in [f["valor"] for f in planificador.facetas_proyecto(pid)["responsables"]]
+
+    # cambiar el responsable sí
+    r = c.patch(f"/api/v1/p/{pid}/tasks", json={"tasks": [{"id": tid, "responsable": "Ana"}]})
+    assert r.status_code == 200, r.get_json()
+    assert planificador.facetas_proyecto(pid)["responsables"] == [
+        {"valor": "Ana", "n": 4}, {"valor": "Zoe", "n": 1},
+    ]
+
+    # y dar de alta una tarea también
+    crear_tarea(c, pid, "Nueva", centro_responsabilidad="Bodega")
+    assert planificador.facetas_proyecto(pid)["centros"][0] == {"valor": "Bodega", "n": 1}
+
+
+def test_facetas_expiran_tras_el_ttl(empresa, monkeypatch):
+    pid = _sembrar(empresa)
+    planificador.facetas_proyecto(pid)
+    monkeypatch.setattr(planificador, "FACETAS_TTL", 0)
+    planificador.invalidar_facetas(pid)
+    planificador.facetas_proyecto(pid)
+
+    _insertar_sin_evento(empresa, "Zoe")
+    assert "Zoe" in [f["valor"] for f in planificador.facetas_proyecto(pid)["responsables"]]
+
+
+def test_facetas_json(empresa, login):
+    pid = _sembrar(empresa)
+    c = login(empresa["usuarios"]["ejecutor"])
+    r = c.get(f"/p/{pid}/facetas.json")
+    assert r.status_code == 200
+    assert r.get_json() == planificador.facetas_proyecto(pid)
+    assert "no-store" in r.headers["Cache-Control"]
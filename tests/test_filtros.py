@@ -0,0 +1,106 @@
+import itertools
+import re
+from datetime import date, datetime, timedelta
+
+import app as planificador
+from app import db, Objective, Task
+
+
+def _filtrar(tareas, centro=None, responsable=None, estado=None, plazo=None, objetivo=None, objetivos_map=None):
+    """Referencia en Python: el filtrado del tablero tal como se hacía sobre task_to_dict."""
+    hoy = datetime.now().date()
+
+    def fecha(t):
+        try:
+            return datetime.strptime(t.get('plazo') or '', '%Y-%m-%d').date()
+        except ValueError:
+            return None
+
+    res = list(tareas)
+    if centro and centro != 'Todos':
+        res = [t for t in res if t.get('centro_responsabilidad') == centro]
+    if responsable and responsable != 'Todos':
+        res = [t for t in res if t.get('responsable') == responsable]
+    if estado and estado != 'Todos':
+        res = [t for t in res if t.get('situacion') == estado]
+    if objetivo is not None and objetivo != 'Todos' and objetivos_map:
+        obj = objetivos_map.get(int(objetivo)) if str(objetivo).isdigit() else None
+        if obj and obj.get('centros'):
+            res = [t for t in res if (t.get('centro_responsabilidad') or '') in obj['centros']]
+    if plazo == 'vencidas':
+        res = [t for t in res if fecha(t) and fecha(t) < hoy]
+    elif plazo == 'por_vencer':
+        res = [t for t in res if fecha(t) and fecha(t) >= hoy]
+    elif plazo == 'sin_plazo':
+        res = [t for t in res if not t.get('plazo')]
+    return res
+
+
+def _sembrar(empresa):
+    pid = empresa["proyecto_id"]
+    hoy = date.today()
+    filas = [
+        ("Completada", "Ana", "Obras", (hoy - timedelta(days=3)).isoformat()),
+        ("Sin Ejecutar", "", "Obras", hoy.isoformat()),
+        ("Sin Ejecutar", None, None, ""),
+        ("En Ejecución", "Luis", "", (hoy + timedelta(days=9)).isoformat()),
+        ("Validada", "Ana", "Calidad", "pronto"),
+        ("Completada", "Luis", "Calidad", None),
+        ("Pendiente de", "Ana", "Obras", (hoy + timedelta(days=1)).isoformat()),
+    ]
+    for i, (situacion, responsable, centro, plazo) in enumerate(filas):
+        db.session.add(Task(
+            empresa_id=empresa["id"], proyecto_id=pid, texto=f"Filtro {i}", situacion=situacion,
+            responsable=responsable, centro_responsabilidad=centro,
+            plazo=plazo, plazo_fecha=planificador.parse_plazo(plazo),
+        ))
+    objetivos = [
+        Objective(empresa_id=empresa["id"], proyecto_id=pid, nombre="Obras y sin centro", centros=["Obras", ""]),
+        Objective(empresa_id=empresa["id"], proyecto_id=pid, nombre="Calidad", centros=["Calidad"]),
+        Objective(empresa_id=empresa["id"], proyecto_id=pid, nombre="Sin centros", centros=[]),
+    ]
+    db.session.add_all(objetivos)
+    db.session.commit()
+    return pid, {o.id: planificador.objective_to_dict(o) for o in objetivos}
+
+
+def _ids(tareas):
+    return [t["id"] for t in tareas]
+
+
+def test_filtros_sql_igualan_a_la_referencia_en_python(empresa):
+    pid, objetivos_map = _sembrar(empresa)
+    todas = [planificador.task_to_dict(t) for t in Task.query.filter_by(proyecto_id=pid).order_by(Task.id)]
+    o_obras, o_calidad, o_vacio = objetivos_map
+
+    combinaciones = itertools.product(
+        ("Todos", "Obras", "Calidad", "Nadie"),
+        ("Todos", "Ana", "Luis"),
+        ("Todos", "Completada", "Sin Ejecutar"),
+        ("Todos", "vencidas", "por_vencer", "sin_plazo"),
+        ("Todos", str(o_obras), str(o_calidad), str(o_vacio), "999", "abc"),
+    )
+    for centro, responsable, estado, plazo, objetivo in combinaciones:
+        filtros = dict(centro=centro, responsable=responsable, estado=estado, plazo=plazo, objetivo=objetivo)
+        criterios = planificador.filtros_tareas_sql(pid, objetivos_map=objetivos_map, **filtros)
+        sql = Task.query.filter(*criterios).order_by(Task.id).all()
+        assert [t.id for t in sql] == _ids(_filtrar(todas, objetivos_map=objetivos_map, **filtros)), filtros
+
+
+def test_objetivo_incluye_tareas_sin_centro(empresa):
+    pid, objetivos_map = _sembrar(empresa)
+    o_obras = next(iter(objetivos_map))
+    criterios = planificador.filtros_tareas_sql(pid, objetivo=str(o_obras), objetivos_map=objetivos_map)
+    textos = sorted(t.texto for t in Task.query.filter(*criterios))
+    assert textos == ["Filtro 0", "Filtro 1", "Filtro 2", "Filtro 3", "Filtro 6"]
+
+
+def test_tablero_muestra_solo_las_filtradas(empresa, login):
+    pid, _ = _sembrar(empresa)
+    c = login(empresa["usuarios"]["supervisor"])
+
+    html = c.get(f"/p/{pid}/tablero", query_string={"responsable": "Ana", "plazo": "por_vencer"}).get_data(as_text=True)
+    assert re.findall(r"Filtro \d", html) == ["Filtro 6"]
+
+    html = c.get(f"/p/{pid}/tablero", query_string={"plazo": "sin_plazo"}).get_data(as_text=True)
+    assert sorted(set(re.findall(r"Filtro \d", html))) == ["Filtro 2", "Filtro 5"]
@@ -0,0 +1,75 @@
+import socket
+import time
+
+import pytest
+import requests
+
+from app import ClienteHTTP, CircuitoAbierto
+
+
+class Respuesta:
+    status_code = 200
+    headers = {}
+
+
+def _cliente(monkeypatch, *efectos, **kwargs):
+    """ClienteHTTP cuya sesión devuelve/lanza `efectos` en orden; registra las llamadas."""
+    c = ClienteHTTP(backoff=0, **kwargs)
+    llamadas = []
+
+    def request(metodo, url, **kw):
+        efecto = efectos[min(len(llamadas), len(efectos) - 1)]
+        llamadas.append(metodo)
+        if isinstance(efecto, BaseException):
+            raise efecto
+        return efecto
+
+    monkeypatch.setattr(c.sesion, "request", request)
+    return c, llamadas
+
+
+def _puerto_cerrado():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_post_no_se_reintenta_si_la_peticion_pudo_salir(monkeypatch):
+    c, llamadas = _cliente(monkeypatch, requests.ConnectionError("Connection reset by peer"), reintentos=2)
+    with pytest.raises(requests.ConnectionError):
+        c.post("p", "http://proveedor/batch")
+    assert llamadas == ["POST"]
+
+    c, llamadas = _cliente(monkeypatch, requests.ConnectionError("Connection reset by peer"), reintentos=2)
+    with pytest.raises(requests.ConnectionError):
+        c.request("p", "GET", "http://proveedor/eventos")
+    assert llamadas == ["GET"] * 3
+
+
+def test_post_se_reintenta_si_no_pudo_conectar():
+    c = ClienteHTTP(backoff=0, reintentos=2, umbral=10)
+    with pytest.raises(requests.ConnectionError):
+        c.post("p", f"http://127.0.0.1:{_puerto_cerrado()}/batch")
+    assert c.metricas()["p"]["status"] == {"error_conexion": 3}
+
+
+def test_error_inesperado_en_la_prueba_no_deja_el_circuito_abierto(monkeypatch):
+    c, llamadas = _cliente(
+        monkeypatch, requests.ConnectionError("caído"), ValueError("respuesta rota"), Respuesta(),
+        reintentos=0, umbral=1, enfriamiento=0.05,
+    )
+    with pytest.raises(requests.ConnectionError):
+        c.post("p", "http://proveedor/token")
+    with pytest.raises(CircuitoAbierto):
+        c.post("p", "http://proveedor/token")
+    assert c.metricas()["p"]["circuito"] == "abierto"
+
+    time.sleep(0.06)
+    assert c.metricas()["p"]["circuito"] == "semiabierto"
+    with pytest.raises(ValueError):
+        c.post("p", "http://proveedor/token")  # la prueba falla con un error no previsto
+
+    time.sleep(0.06)
+    assert c.post("p", "http://proveedor/token").status_code == 200
+    assert c.metricas()["p"]["circuito"] == "cerrado"
+    assert len(llamadas) == 3
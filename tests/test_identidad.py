@@ -0,0 +1,84 @@
+import re
+
+import pytest
+from sqlalchemy import event
+
+import app as planificador
+from app import db, Project, User
+
+
+@pytest.fixture
+def consultas():
+    """Sentencias SQL emitidas mientras dura la prueba (normalizadas a una línea)."""
+    with planificador.app.app_context():
+        motor = db.engine
+    emitidas = []
+
+    def oir(conn, cursor, sentencia, params, context, many):
+        emitidas.append(" ".join(sentencia.split()))
+
+    event.listen(motor, "before_cursor_execute", oir)
+    yield emitidas
+    event.remove(motor, "before_cursor_execute", oir)
+
+
+def _por_id(emitidas, tabla):
+    patron = re.compile(rf"FROM {tabla} WHERE {tabla}\.id = \?$")
+    return [s for s in emitidas if patron.search(s)]
+
+
+@pytest.mark.parametrize("ruta", ["/p/{pid}/", "/p/{pid}/tareas.json", "/api/v1/p/{pid}/tasks"])
+def test_usuario_y_proyecto_se_leen_una_vez_por_peticion(empresa, login, consultas, ruta):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+
+    consultas.clear()
+    assert c.get(ruta.format(pid=pid)).status_code == 200
+    assert len(_por_id(consultas, "users")) == 1
+    assert len(_por_id(consultas, "projects")) == 1
+
+    # la siguiente petición no hereda el g de la anterior: vuelve a leerlos
+    consultas.clear()
+    assert c.get(ruta.format(pid=pid)).status_code == 200
+    assert len(_por_id(consultas, "users")) == 1
+
+
+def test_cabecera_de_depuracion_cuenta_los_aciertos(empresa, login, monkeypatch):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    assert "X-Identity-Cache-Saved" not in c.get(f"/p/{pid}/").headers
+
+    monkeypatch.setattr(planificador.app, "debug", True)
+    assert int(c.get(f"/p/{pid}/").headers["X-Identity-Cache-Saved"]) >= 1
+
+
+def test_usuario_desactivado_pierde_el_acceso_en_la_siguiente_peticion(empresa, login):
+    pid = empresa["proyecto_id"]
+    correo = empresa["usuarios"]["ejecutor"]
+    c = login(correo)
+    assert c.get(f"/api/v1/p/{pid}/tasks").status_code == 200
+
+    User.query.filter_by(correo=correo).update({"activo": False})
+    db.session.commit()
+    assert c.get(f"/api/v1/p/{pid}/tasks").status_code == 401
+    r = c.get(f"/p/{pid}/")
+    assert r.status_code == 302 and "/login" in r.headers["Location"]
+
+
+def test_proyecto_terminado_es_403_salvo_para_superadmin(empresa, superadmin, login):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    assert c.get(f"/api/v1/p/{pid}/tasks").status_code == 200
+
+    Project.query.filter_by(id=pid).update({"terminado": True})
+    db.session.commit()
+    assert c.get(f"/api/v1/p/{pid}/tasks").status_code == 403
+    assert c.get(f"/p/{pid}/tareas.json").status_code == 403
+    assert login(superadmin).get(f"/api/v1/p/{pid}/tasks").status_code == 200
+
+
+def test_otra_empresa_no_accede_al_proyecto(empresa, login):
+    ajeno = planificador.crear_empresa_full("Empresa ajena", ["Proyecto ajeno"], max_proys=1)
+    pid_ajeno = Project.query.filter_by(empresa_id=ajeno).first().id
+    c = login(empresa["usuarios"]["supervisor"])
+    assert c.get(f"/api/v1/p/{pid_ajeno}/tasks").status_code == 403
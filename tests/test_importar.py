@@ -0,0 +1,68 @@
+import io
+
+import app as planificador
+from app import Task
+
+
+def _importar(c, pid, contenido, nombre="tareas.csv"):
+    return c.post(
+        f"/api/v1/p/{pid}/tasks/import",
+        data={"archivo": (io.BytesIO(contenido), nombre)},
+        content_type="multipart/form-data",
+    )
+
+
+def test_csv_con_una_linea_latin1_al_final(empresa, login, monkeypatch):
+    monkeypatch.setattr(planificador, "IMPORT_LOTE", 1000)
+    pid = empresa["proyecto_id"]
+    filas = ["texto;responsable;plazo"] + [f"Tarea ñ {i};Ana;2099-01-01" for i in range(3000)]
+    contenido = "\r\n".join(filas).encode("utf-8") + "\r\nRevisión final;José;01/02/2099\r\n".encode("latin-1")
+
+    r = _importar(login(empresa["usuarios"]["supervisor"]), pid, contenido)
+
+    assert r.status_code == 201, r.get_json()
+    assert r.get_json()["insertadas"] == 3001
+    assert Task.query.filter_by(proyecto_id=pid, texto="Tarea ñ 0").count() == 1
+    t = Task.query.filter_by(proyecto_id=pid, texto="Revisión final").one()
+    assert (t.responsable, t.plazo) == ("José", "2099-02-01")
+
+
+def test_csv_ilegible_no_inserta_nada(empresa, login, monkeypatch):
+    monkeypatch.setattr(planificador, "IMPORT_LOTE", 100)
+    pid = empresa["proyecto_id"]
+    filas = ["texto,responsable"] + [f"Tarea {i},Ana" for i in range(500)]
+    contenido = ("\n".join(filas) + '\n"' + "x" * 200_000 + '",Ana\n').encode()  # campo > csv.field_size_limit
+
+    r = _importar(login(empresa["usuarios"]["supervisor"]), pid, contenido)
+
+    assert r.status_code == 400
+    assert r.get_json()["error"].startswith("No se pudo leer el archivo")
+    assert Task.query.filter_by(proyecto_id=pid).count() == 0
+
+
+def test_xlsx_danado_es_400(empresa, login):
+    r = _importar(login(empresa["usuarios"]["supervisor"]), empresa["proyecto_id"], b"PK\x03\x04 roto", "tareas.xlsx")
+    assert r.status_code == 400
+    assert r.get_json()["error"].startswith("No se pudo leer el archivo")
+
+
+def test_xlsx_y_errores_por_fila(empresa, login):
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Tarea", "Centro", "Plazo"])
+    ws.append(["Con fecha", "Obra", "2099-05-01"])
+    ws.append(["", "Obra", None])
+    ws.append(["Fecha mala", "Obra", "mañana"])
+    buf = io.BytesIO()
+    wb.save(buf)
+
+    r = _importar(login(empresa["usuarios"]["supervisor"]), empresa["proyecto_id"], buf.getvalue(), "tareas.xlsx")
+
+    res = r.get_json()
+    assert r.status_code == 201
+    assert (res["insertadas"], res["con_error"]) == (1, 2)
+    assert [e["fila"] for e in res["errores"]] == [3, 4]
+    t = Task.query.filter_by(proyecto_id=empresa["proyecto_id"], texto="Con fecha").one()
+    assert (t.centro_responsabilidad, t.plazo) == ("Obra", "2099-05-01")
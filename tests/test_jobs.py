@@ -0,0 +1,70 @@
+import sys
+import threading
+import time
+
+import pytest
+
+import app as planificador
+from app import db, Job
+
+
+@pytest.fixture(autouse=True)
+def cola_vacia(ctx):
+    """Estas pruebas toman el siguiente trabajo de la cola: sin restos de otros archivos."""
+    Job.query.filter_by(estado="pendiente").delete()
+    db.session.commit()
+
+
+def test_trabajo_largo_con_latido_no_se_reclama(ctx, monkeypatch):
+    monkeypatch.setattr(planificador, "JOBS_TIMEOUT_SEG", 0.6)
+    monkeypatch.setattr(planificador, "JOBS_LATIDO_SEG", 0.1)
+    corridas = []
+
+    def lento(payload):
+        corridas.append(1)
+        time.sleep(1.5)
+        return {"ok": True}
+
+    monkeypatch.setitem(planificador.JOBS, "prueba.lenta", lento)
+    j = planificador.encolar_job("prueba.lenta")
+
+    def correr():
+        with planificador.app.app_context():
+            planificador.ejecutar_job(planificador.tomar_job("w1"))
+
+    hilo = threading.Thread(target=correr)
+    hilo.start()
+    time.sleep(0.2)
+    fin = time.time() + 1.0
+    while time.time() < fin:
+        assert planificador.tomar_job("w2") is None
+        time.sleep(0.1)
+    hilo.join()
+
+    db.session.expire_all()
+    j = db.session.get(Job, j.id)
+    assert (j.estado, j.intentos, j.worker, len(corridas)) == ("completado", 1, "w1", 1)
+
+
+def test_trabajo_sin_latido_se_reclama(ctx, monkeypatch):
+    monkeypatch.setattr(planificador, "JOBS_TIMEOUT_SEG", 0.3)
+    monkeypatch.setitem(planificador.JOBS, "prueba.huerfana", lambda payload: {})
+    j = planificador.encolar_job("prueba.huerfana")
+    assert planificador.tomar_job("muerto").id == j.id  # el worker "muere" sin ejecutar ni latir
+
+    assert planificador.tomar_job("w2") is None
+    time.sleep(0.4)
+    tomado = planificador.tomar_job("w2")
+    assert (tomado.id, tomado.worker, tomado.intentos) == (j.id, "w2", 2)
+
+
+def test_reporte_sin_dependencias_falla_sin_reintentos(ctx, monkeypatch):
+    monkeypatch.setitem(sys.modules, "analisis", None)  # como si faltara pandas/matplotlib
+    j = planificador.encolar_job("analisis.reporte")
+    with planificador.app.app_context():
+        planificador.ejecutar_job(planificador.tomar_job("w1"))
+
+    db.session.expire_all()
+    j = db.session.get(Job, j.id)
+    assert (j.estado, j.intentos) == ("fallido", 1)
+    assert "dependencia" in j.error
@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+
+import pytest
+
+import app as planificador
+from app import db, KPI, Objective, Task
+
+
+def test_kpis_automaticos_coinciden_con_el_calculo_a_mano(empresa, login, crear_tarea):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    ayer, manana = (date.today() + timedelta(days=d) for d in (-1, 1))
+    # (centro, situación, plazo)
+    tareas = [
+        ("Obras", "Completada", ayer),
+        ("Obras", "Validada", None),
+        ("Obras", "Sin Ejecutar", ayer),      # vencida
+        ("Obras", "En Ejecución", manana),
+        ("Calidad", "Completada", None),
+        ("Calidad", "Sin Ejecutar", ayer),    # vencida
+        ("", "Validada", ayer),               # cerrada: no cuenta como vencida
+    ]
+    for i, (centro, situacion, plazo) in enumerate(tareas):
+        tid = crear_tarea(c, pid, f"KPI {i}", centro_responsabilidad=centro, plazo=plazo.isoformat() if plazo else "")
+        Task.query.filter_by(id=tid).update({"situacion": situacion})
+        db.session.commit()
+
+    objetivos = {}
+    for nombre, centros in (("Obras", ["Obras"]), ("Todo", []), ("Dos centros", ["Obras", "Calidad"])):
+        o = Objective(empresa_id=empresa["id"], proyecto_id=pid, nombre=nombre, centros=centros)
+        db.session.add(o)
+        db.session.flush()
+        objetivos[nombre] = o.id
+
+    kpis = [
+        ("Obras", "auto", "tareas_total", None),
+        ("Obras", "auto", "tareas_vencidas", None),
+        ("Obras", "auto", "avance_completadas_pct", None),
+        ("Obras", "auto", "avance_validadas_pct", None),
+        ("Todo", "auto", "tareas_total", None),
+        ("Todo", "auto", "tareas_vencidas", None),
+        ("Todo", "auto", "avance_completadas_pct", None),
+        ("Dos centros", "auto", "avance_validadas_pct", None),
+        ("Dos centros", "manual", None, 42.0),
+    ]
+    for objetivo, modo, auto_tipo, manual in kpis:
+        db.session.add(KPI(objetivo_id=objetivos[objetivo], nombre=f"{objetivo} {auto_tipo}",
+                           modo=modo, auto_tipo=auto_tipo, actual_manual=manual))
+    db.session.commit()
+
+    objetivos_map = {o.id: planificador.objective_to_dict(o) for o in Objective.query.filter_by(proyecto_id=pid)}
+    actuales = [k["actual"] for k in planificador.kpis_proyecto(pid, objetivos_map)]
+
+    assert actuales == pytest.approx([
+        4, 1, 100 * 1 / 4, 100 * 1 / 4,   # Obras: 4 tareas, 1 vencida, 1 completada, 1 validada
+        7, 2, 100 * 2 / 7,                # todo el proyecto (incluye la tarea sin centro)
+        100 * 1 / 6,                      # Obras + Calidad: 6 tareas, 1 validada
+        42.0,
+    ])
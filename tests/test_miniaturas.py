@@ -0,0 +1,86 @@
+import io
+
+from PIL import Image
+
+import app as planificador
+from app import Job
+
+
+def _png(ancho, alto):
+    buf = io.BytesIO()
+    Image.new("RGB", (ancho, alto), (200, 30, 30)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def _pdf():
+    buf = io.BytesIO()
+    Image.new("RGB", (595, 842), "white").save(buf, "PDF")  # una página A4 a 72 ppp
+    return buf.getvalue()
+
+
+def test_miniaturas_de_png_y_pdf(empresa, login, crear_tarea, adjuntar, esperar):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    tid = crear_tarea(c, pid, "Con planos")
+    shas = {
+        "png": adjuntar(c, pid, tid, "foto.png", _png(1200, 600)),
+        "pdf": adjuntar(c, pid, tid, "plano.pdf", _pdf()),
+    }
+    for sha in shas.values():
+        assert c.get(f"/p/{pid}/t/{tid}/adjuntos/{sha}/miniatura").status_code == 404
+
+    assert esperar(lambda: Job.query.filter_by(tipo="adjuntos.miniatura", estado="pendiente").count() >= 2)
+    planificador.procesar_jobs("test", una_vez=True)
+
+    tamanos = {}
+    for tipo, sha in shas.items():
+        r = c.get(f"/p/{pid}/t/{tid}/adjuntos/{sha}/miniatura")
+        assert r.status_code == 200 and r.mimetype == "image/webp"
+        with Image.open(io.BytesIO(r.data)) as img:
+            assert img.format == "WEBP"
+            tamanos[tipo] = img.size
+    px = planificador.MINIATURA_PX
+    assert tamanos["png"] == (px, px // 2)
+    assert max(tamanos["pdf"]) == px and tamanos["pdf"][0] < tamanos["pdf"][1]
+
+
+def test_imagen_bomba_falla_sin_reintentar(empresa, login, crear_tarea, adjuntar, esperar, monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)  # 2x el límite: DecompressionBombError
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    sha = adjuntar(c, pid, crear_tarea(c, pid, "Con bomba"), "bomba.png", _png(100, 100))
+
+    j = esperar(lambda: next((j for j in Job.query.filter_by(tipo="adjuntos.miniatura").all()
+                              if j.payload.get("sha256") == sha), None))
+    planificador.ejecutar_job(planificador.tomar_job("test"))
+    j = planificador.db.session.get(Job, j.id)
+    assert j.estado == "fallido" and j.intentos == 1
+    assert "No se pudo generar la miniatura" in j.error
+
+
+def test_cli_encola_solo_previsualizables_sin_trabajo_pendiente(empresa, login, crear_tarea, adjuntar, esperar):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    tid = crear_tarea(c, pid, "Varios")
+    png = adjuntar(c, pid, tid, "vista.png", _png(50, 50))
+    docx = adjuntar(c, pid, tid, "informe.docx", b"PK no es una imagen")
+
+    def trabajos():
+        return [j for j in Job.query.filter_by(tipo="adjuntos.miniatura").all() if j.payload["sha256"] in (png, docx)]
+
+    assert esperar(trabajos)
+
+    def encoladas():
+        antes = len(trabajos())
+        r = planificador.app.test_cli_runner().invoke(args=["adjuntos-miniaturas"])
+        assert r.exit_code == 0, r.output
+        planificador.db.session.expire_all()
+        return len(trabajos()) - antes
+
+    assert encoladas() == 0  # el del PNG ya está pendiente y el .docx no se previsualiza
+    for j in trabajos():
+        planificador.db.session.delete(j)
+    planificador.db.session.commit()
+    assert encoladas() == 1
+    assert encoladas() == 0
+    assert [j.payload["sha256"] for j in trabajos()] == [png]
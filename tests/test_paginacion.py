@@ -0,0 +1,104 @@
+import pytest
+
+import app as planificador
+from app import db, Task
+
+
+def _crear_iguales(c, pid, n, texto="Misma tarea"):
+    """n tareas idénticas salvo el id (mismo texto, responsable, plazo y created_at del lote)."""
+    r = c.post(f"/api/v1/p/{pid}/tasks", json={"tasks": [
+        {"texto": texto, "responsable": "Ana", "plazo": "2030-01-01"} for _ in range(n)
+    ]})
+    assert r.status_code == 201, r.get_json()
+    return [t["id"] for t in r.get_json()["tasks"]]
+
+
+RUTAS = [
+    (lambda pid: f"/api/v1/p/{pid}/tasks", "tasks"),
+    (lambda pid: f"/p/{pid}/tareas.json", "tareas"),
+]
+
+
+def _paginas(c, url, clave, limite, antes_de_cada=None):
+    paginas, despues = [], 0
+    while True:
+        r = c.get(url, query_string={"despues": despues, "limite": limite})
+        assert r.status_code == 200
+        datos = r.get_json()
+        paginas.append([t["id"] for t in datos[clave]])
+        if datos["siguiente"] is None:
+            return paginas
+        assert datos["siguiente"] == paginas[-1][-1]
+        despues = datos["siguiente"]
+        if antes_de_cada:
+            antes_de_cada(len(paginas))
+
+
+@pytest.mark.parametrize("ruta,clave", RUTAS)
+def test_paginas_cubren_todas_las_tareas_iguales_una_vez(empresa, login, ruta, clave):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    ids = _crear_iguales(c, pid, 7)
+
+    paginas = _paginas(c, ruta(pid), clave, 3)
+    assert [len(p) for p in paginas] == [3, 3, 1]
+    assert [i for p in paginas for i in p] == ids
+
+
+@pytest.mark.parametrize("ruta,clave", RUTAS)
+def test_multiplo_exacto_del_limite_no_deja_pagina_vacia(empresa, login, ruta, clave):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    ids = _crear_iguales(c, pid, 6)
+
+    paginas = _paginas(c, ruta(pid), clave, 3)
+    assert paginas == [ids[:3], ids[3:]]
+
+
+def test_altas_y_bajas_entre_paginas_no_duplican_ni_saltan(empresa, login):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    ids = _crear_iguales(c, pid, 6)
+    nuevas = []
+
+    def mover(n_pagina):
+        if n_pagina == 1:
+            # se borra una tarea ya vista y otra aún por ver; se inserta una al final
+            Task.query.filter(Task.id.in_([ids[0], ids[4]])).delete(synchronize_session=False)
+            db.session.commit()
+            nuevas.extend(_crear_iguales(c, pid, 1))
+
+    vistas = [i for p in _paginas(c, f"/api/v1/p/{pid}/tasks", "tasks", 3, mover) for i in p]
+    assert vistas == ids[:3] + [ids[3], ids[5]] + nuevas
+    assert len(vistas) == len(set(vistas))
+
+
+def test_pagina_no_mezcla_proyectos(empresa, login):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    ids = _crear_iguales(c, pid, 2)
+    otro = planificador.crear_empresa_full("Empresa paginación", ["Otro proyecto"], max_proys=1)
+    pid_otro = planificador.Project.query.filter_by(empresa_id=otro).first().id
+    planificador.agregar_tarea(pid_otro, "Misma tarea", "Ana", "", "2030-01-01", "", "")
+
+    assert _paginas(c, f"/api/v1/p/{pid}/tasks", "tasks", 500) == [ids]
+
+
+def test_planificador_enlaza_la_pagina_siguiente(empresa, login):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    ids = _crear_iguales(c, pid, 3)
+
+    html = c.get(f"/p/{pid}/", query_string={"limite": 2}).get_data(as_text=True)
+    assert f"despues={ids[1]}" in html
+    html = c.get(f"/p/{pid}/", query_string={"limite": 2, "despues": ids[1]}).get_data(as_text=True)
+    assert "Siguientes tareas" not in html
+
+
+def test_limite_se_acota(empresa, login):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    _crear_iguales(c, pid, 2)
+
+    r = c.get(f"/api/v1/p/{pid}/tasks", query_string={"limite": -5})
+    assert len(r.get_json()["tasks"]) == 1 and r.get_json()["siguiente"] is not None
@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import text
+
+import app as planificador
+from app import db, Task
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("2024-02-29", date(2024, 2, 29)),
+    (" 2024-01-05 ", date(2024, 1, 5)),
+    ("2024-1-5", date(2024, 1, 5)),       # mismo formato que aceptaba strptime
+    ("2023-02-29", None),
+    ("05/01/2024", None),
+    ("pronto", None),
+    ("", None),
+    ("   ", None),
+    (None, None),
+])
+def test_parse_plazo(valor, esperado):
+    assert planificador.parse_plazo(valor) == esperado
+
+
+def test_plazo_fecha_clasifica_vencidas_por_vencer_y_sin_plazo(empresa, login, crear_tarea):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    hoy = date.today()
+    ids = {
+        nombre: crear_tarea(c, pid, nombre, plazo=plazo)
+        for nombre, plazo in (
+            ("ayer", (hoy - timedelta(days=1)).isoformat()),
+            ("hoy", hoy.isoformat()),
+            ("mañana", (hoy + timedelta(days=1)).isoformat()),
+            ("vacío", ""),
+        )
+    }
+    # la API rechaza plazos ilegibles; el formulario (y los datos antiguos) no
+    planificador.agregar_tarea(pid, "inválido", "", "", "31/12/2099", "", "")
+    fechas = {t.texto: t.plazo_fecha for t in Task.query.filter_by(proyecto_id=pid)}
+    assert fechas == {"ayer": hoy - timedelta(days=1), "hoy": hoy, "mañana": hoy + timedelta(days=1),
+                      "vacío": None, "inválido": None}
+
+    def filtrar(plazo):
+        criterios = planificador.filtros_tareas_sql(pid, plazo=plazo)
+        return {texto for (texto,) in db.session.query(Task.texto).filter(*criterios)}
+
+    assert filtrar("vencidas") == {"ayer"}
+    assert filtrar("por_vencer") == {"hoy", "mañana"}
+    assert filtrar("sin_plazo") == {"vacío"}  # como antes: un plazo ilegible no es "sin plazo" al filtrar
+
+    est = planificador.estadisticas_proyectos([pid])[pid]
+    assert (est["vencidas"], est["por_vencer"], est["sin_plazo"]) == (1, 2, 2)
+
+    # editar el plazo recalcula la fecha
+    r = c.patch(f"/api/v1/p/{pid}/tasks", json={"tasks": [{"id": ids["vacío"], "plazo": "2000-01-01"}]})
+    assert r.status_code == 200
+    db.session.expire_all()
+    assert db.session.get(Task, ids["vacío"]).plazo_fecha == date(2000, 1, 1)
+    assert filtrar("vencidas") == {"ayer", "vacío"}
+
+
+def test_backfill_rellena_plazo_fecha_sin_tocar_updated_at(empresa, login, crear_tarea):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    con_fecha = crear_tarea(c, pid, "Con fecha", plazo="2030-06-15")
+    ilegible = planificador.agregar_tarea(pid, "Ilegible", "", "", "algún día", "", "")["id"]
+    db.session.execute(text("UPDATE tasks SET plazo_fecha = NULL WHERE proyecto_id = :pid"), {"pid": pid})
+    db.session.commit()
+    antes = dict(db.session.query(Task.id, Task.updated_at).filter_by(proyecto_id=pid))
+
+    planificador.backfill_plazo_fecha(batch=1)
+
+    db.session.expire_all()
+    assert db.session.get(Task, con_fecha).plazo_fecha == date(2030, 6, 15)
+    assert db.session.get(Task, ilegible).plazo_fecha is None
+    assert dict(db.session.query(Task.id, Task.updated_at).filter_by(proyecto_id=pid)) == antes
@@ -0,0 +1,60 @@
+import threading
+from datetime import date, timedelta
+
+import app as planificador
+from app import db, Job, ProjectStat
+
+
+def test_reconstrucciones_simultaneas_no_chocan(empresa, login):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    for i in range(3):
+        c.post(f"/p/{pid}/agregar", data={"texto": f"Tarea {i}", "responsable": "Ana"})
+    ProjectStat.query.filter_by(proyecto_id=pid).delete()
+    db.session.commit()
+
+    errores = []
+
+    def reconstruir():
+        with planificador.app.app_context():
+            try:
+                planificador.asegurar_project_stats([pid])
+            except Exception as ex:  # pragma: no cover - solo si hay choque
+                errores.append(ex)
+
+    hilos = [threading.Thread(target=reconstruir) for _ in range(4)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert errores == []
+    est = planificador.estadisticas_proyectos([pid])[pid]
+    assert est["total"] == 3 and est["por_responsable"] == {"Ana": 3}
+    assert ProjectStat.query.filter_by(proyecto_id=pid, dimension="total").count() == 1
+
+
+def test_buckets_de_otro_dia_se_sirven_y_se_recalculan_en_un_trabajo(empresa, login, crear_tarea):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    ayer = date.today() - timedelta(days=1)
+    crear_tarea(c, pid, "Vence ayer", plazo=ayer.isoformat())
+    assert planificador.estadisticas_proyectos([pid])[pid]["vencidas"] == 1
+
+    # Como quedaría calculado ayer: la tarea aún no vencía
+    ProjectStat.query.filter_by(proyecto_id=pid, dimension="plazo", clave="vencidas").update({"n": 0})
+    ProjectStat.query.filter_by(proyecto_id=pid, dimension="plazo", clave="por_vencer").update({"n": 1})
+    ProjectStat.query.filter_by(proyecto_id=pid, dimension="plazo").update({"fecha_ref": ayer})
+    db.session.commit()
+
+    est = planificador.estadisticas_proyectos([pid])[pid]
+    assert (est["vencidas"], est["por_vencer"]) == (0, 1)
+    pendientes = Job.query.filter_by(tipo="stats.recalcular", empresa_id=empresa["id"], estado="pendiente")
+    assert pendientes.count() == 1
+    planificador.estadisticas_proyectos([pid])
+    assert pendientes.count() == 1
+
+    planificador.procesar_jobs("test", una_vez=True)
+    db.session.expire_all()
+    est = planificador.estadisticas_proyectos([pid])[pid]
+    assert (est["vencidas"], est["por_vencer"]) == (1, 0)
@@ -0,0 +1,60 @@
+from sqlalchemy import event
+
+import app as planificador
+from app import db, Company, Project, Task, User
+
+
+def _esperado():
+    """Conteos por empresa hechos uno por uno, como el resumen antes de agrupar."""
+    return {
+        e.id: {
+            "n_proyectos": Project.query.filter_by(empresa_id=e.id).count(),
+            "n_usuarios": User.query.filter_by(empresa_id=e.id).count(),
+            "n_tareas": Task.query.join(Project, Task.proyecto_id == Project.id).filter(Project.empresa_id == e.id).count(),
+        }
+        for e in Company.query.all()
+    }
+
+
+def _consultas(fn):
+    n = [0]
+
+    def contar(*args):
+        n[0] += 1
+
+    event.listen(db.engine, "before_cursor_execute", contar)
+    try:
+        return fn(), n[0]
+    finally:
+        event.remove(db.engine, "before_cursor_execute", contar)
+
+
+def test_resumen_de_empresas_agrupado_coincide_con_el_conteo(empresa, superadmin, login, crear_tarea):
+    c = login(empresa["usuarios"]["supervisor"])
+    for i in range(3):
+        crear_tarea(c, empresa["proyecto_id"], f"Resumen {i}")
+    vacia = planificador.crear_empresa_full(f"Sin tareas {empresa['id']}", [], max_proys=0)
+
+    planificador.resumen_empresas(per_page=0)  # materializa los proyectos que falten
+    (resumen, total), pocas = _consultas(lambda: planificador.resumen_empresas(per_page=0))
+    obtenido = {r["empresa"]["id"]: {k: r[k] for k in ("n_proyectos", "n_usuarios", "n_tareas")} for r in resumen}
+    assert obtenido == _esperado()
+    assert total == Company.query.count()
+    assert obtenido[empresa["id"]] == {"n_proyectos": 1, "n_usuarios": 2, "n_tareas": 3}
+    assert obtenido[vacia] == {"n_proyectos": 0, "n_usuarios": 0, "n_tareas": 0}
+
+    for i in range(5):
+        planificador.crear_empresa_full(f"Más {empresa['id']}-{i}", [f"P {empresa['id']}-{i}"], max_proys=1)
+    planificador.resumen_empresas(per_page=0)
+    (resumen, _), muchas = _consultas(lambda: planificador.resumen_empresas(per_page=0))
+    assert len(resumen) == Company.query.count()
+    assert muchas == pocas
+
+    # orden por tareas (desc) y paginación
+    (pagina, total), _ = _consultas(lambda: planificador.resumen_empresas(orden="tareas", desc=True, page=1, per_page=2))
+    assert len(pagina) == 2 and total == Company.query.count()
+    assert pagina[0]["n_tareas"] == max(v["n_tareas"] for v in _esperado().values())
+    assert pagina[0]["n_tareas"] >= pagina[1]["n_tareas"]
+
+    r = login(superadmin).get("/sa?orden=tareas&dir=desc&per_page=0")
+    assert r.status_code == 200 and f"Sin tareas {empresa['id']}" in r.get_data(as_text=True)
@@ -0,0 +1,63 @@
+import hashlib
+import threading
+
+import app as planificador
+from app import db, Attachment, ChunkedUpload, Job
+
+
+def test_subida_solo_la_continua_quien_la_inicio(empresa, login):
+    pid = empresa["proyecto_id"]
+    sup = login(empresa["usuarios"]["supervisor"])
+    eje = login(empresa["usuarios"]["ejecutor"])
+    tid = sup.post(f"/api/v1/p/{pid}/tasks", json={"tasks": [{"texto": "Con adjunto"}]}).get_json()["tasks"][0]["id"]
+    contenido = b"%PDF-1.4 prueba\n"
+
+    r = sup.post(f"/api/v1/p/{pid}/tasks/{tid}/uploads", json={"nombre": "plano.pdf", "tamano": len(contenido)})
+    assert r.status_code == 201
+    base = f"/api/v1/p/{pid}/tasks/{tid}/uploads/{r.get_json()['id']}"
+
+    assert eje.get(base).status_code == 404
+    assert eje.put(base + "/parts/0", data=contenido).status_code == 404
+    assert eje.post(base + "/complete").status_code == 404
+
+    assert sup.put(base + "/parts/0", data=contenido).get_json()["sha256"] == hashlib.sha256(contenido).hexdigest()
+    assert sup.post(base + "/complete").status_code == 202
+    planificador.procesar_jobs("test", una_vez=True)
+
+
+def test_completar_encola_un_solo_trabajo_aunque_lleguen_dos(empresa, login, crear_tarea):
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    tid = crear_tarea(c, pid, "Con subida grande")
+    contenido = b"0123456789" * 50
+    sha256 = hashlib.sha256(contenido).hexdigest()
+    sid = c.post(
+        f"/api/v1/p/{pid}/tasks/{tid}/uploads",
+        json={"nombre": "grande.pdf", "tamano": len(contenido), "sha256": sha256},
+    ).get_json()["id"]
+    base = f"/api/v1/p/{pid}/tasks/{tid}/uploads/{sid}"
+    assert c.put(base + "/parts/0", data=contenido).status_code == 200
+
+    respuestas = []
+    hilos = [threading.Thread(target=lambda: respuestas.append(c.post(base + "/complete"))) for _ in range(2)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert [r.status_code for r in respuestas] == [202, 202]
+    urls = {r.headers["Location"] for r in respuestas}
+    assert len(urls) == 1 and {r.get_json()["url"] for r in respuestas} == urls
+    assert Job.query.filter(Job.tipo == "adjuntos.subida", Job.payload["subida_id"].as_string() == sid).count() == 1
+    assert db.session.get(ChunkedUpload, sid).estado == "completando"
+    assert c.put(base + "/parts/0", data=contenido).status_code == 409
+    assert c.delete(base).status_code == 409
+
+    planificador.procesar_jobs("test", una_vez=True)
+    j = c.get(urls.pop()).get_json()
+    assert j["estado"] == "completado"
+    assert j["resultado"]["documento"] == {"sha256": sha256, "nombre": "grande.pdf", "tamano": len(contenido)}
+    assert Attachment.query.filter_by(tarea_id=tid, sha256=sha256).count() == 1
+    db.session.expire_all()
+    assert db.session.get(ChunkedUpload, sid) is None
+    assert c.get(base).status_code == 404
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta, timezone
+
+import app as planificador
+
+
+def test_streams_por_encima_del_cupo_reciben_503(empresa, login, monkeypatch):
+    monkeypatch.setattr(planificador, "SSE_MAX_STREAMS", 1)
+    monkeypatch.setattr(planificador, "SSE_DURACION_SEG", 0)
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+
+    abierto = c.get(f"/p/{pid}/tablero/stream", buffered=False)
+    assert abierto.status_code == 200
+
+    rechazado = c.get(f"/p/{pid}/tablero/stream")
+    assert rechazado.status_code == 503
+    assert rechazado.headers["Retry-After"] == str(planificador.SSE_REINTENTO_SEG)
+
+    abierto.close()  # libera el cupo
+    otro = c.get(f"/p/{pid}/tablero/stream")
+    assert otro.status_code == 200
+    assert otro.get_data(as_text=True).startswith("retry:")
+
+
+def test_stream_retoma_desde_el_ultimo_evento(empresa, login, monkeypatch):
+    monkeypatch.setattr(planificador, "SSE_POLL_SEG", 0.1)
+    monkeypatch.setattr(planificador, "SSE_DURACION_SEG", 0.3)
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    desde = (datetime.utcnow() - timedelta(minutes=5)).isoformat()
+    c.post(f"/p/{pid}/agregar", data={"texto": "Cambio perdido"})
+
+    r = c.get(f"/p/{pid}/tablero/stream", headers={"Last-Event-ID": desde})
+    assert "Cambio perdido" in r.get_data(as_text=True)
+
+    viejo = (datetime.utcnow() - timedelta(hours=2)).isoformat()
+    r = c.get(f"/p/{pid}/tablero/stream?desde={viejo}")
+    assert '"recargar": true' in r.get_data(as_text=True)
+
+
+def test_stream_acepta_desde_con_zona_horaria(empresa, login, monkeypatch):
+    monkeypatch.setattr(planificador, "SSE_POLL_SEG", 0.1)
+    monkeypatch.setattr(planificador, "SSE_DURACION_SEG", 0.3)
+    pid = empresa["proyecto_id"]
+    c = login(empresa["usuarios"]["supervisor"])
+    # hace 5 minutos, expresado en UTC-03:00
+    desde = (datetime.now(timezone.utc) - timedelta(minutes=5)).astimezone(timezone(timedelta(hours=-3)))
+    c.post(f"/p/{pid}/agregar", data={"texto": "Cambio con zona"})
+
+    r = c.get(f"/p/{pid}/tablero/stream", headers={"Last-Event-ID": desde.isoformat()})
+    cuerpo = r.get_data(as_text=True)
+    assert r.status_code == 200 and "Cambio con zona" in cuerpo and '"recargar": true' not in cuerpo
+
+    r = c.get(f"/p/{pid}/tablero/stream", query_string={"desde": desde.isoformat()})
+    assert "Cambio con zona" in r.get_data(as_text=True)
@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as planificador
+from app import db, Company, JobFallido
+
+
+def _guardar_token(empresa_id, token, refresh="refresh"):
+    e = db.session.get(Company, empresa_id)
+    e.calendar_provider = "google"
+    e.calendar_access_token = token
+    e.calendar_refresh_token = refresh
+    e.calendar_token_expires_at = datetime.utcnow() + timedelta(hours=1) if token else None
+    db.session.commit()
+    return e
+
+
+def test_cache_de_tokens_sigue_a_la_bd(empresa):
+    eid = empresa["id"]
+    assert planificador.token_calendario(_guardar_token(eid, "cuenta-a")) == "cuenta-a"
+
+    # Otro proceso reconecta el calendario a otra cuenta: este proceso solo ve la BD
+    e = _guardar_token(eid, "cuenta-b")
+    assert planificador.tokens_calendario._cache[eid][0] == "cuenta-a"
+    assert planificador.token_calendario(e) == "cuenta-b"
+
+    # ...y otro lo desconecta
+    e = _guardar_token(eid, None, refresh=None)
+    with pytest.raises(JobFallido):
+        planificador.token_calendario(e)
+    assert eid not in planificador.tokens_calendario._cache